@@ -0,0 +1,249 @@
+"""
+Worker asyncio (WORKER_MODE=async).
+
+Consome as mesmas filas do worker.py com um cliente redis.asyncio e mantém até
+WORKER_ASYNC_CONCURRENCY tarefas em andamento no event loop:
+  - tarefas `async def` de AVAILABLE_TASKS rodam como corrotinas no próprio loop;
+  - tarefas síncronas vão para o executor do seu "mode" ("thread" ou "process"),
+    sem bloquear o loop.
+
+Prioridades, tarefas atrasadas, retentativas e dead-letter queue seguem as regras do
+worker.py. Com RELIABLE_QUEUE, claim/ack da ReliableQueue rodam em uma thread auxiliar.
+Ao receber SIGINT/SIGTERM o worker para de retirar tarefas e aguarda as que estão em andamento.
+
+Ajustes via env (além dos do worker.py):
+  WORKER_ASYNC_CONCURRENCY  -> máximo de tarefas em andamento por worker (padrão 100)
+"""
+import asyncio
+import inspect
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import redis.exceptions
+
+import envelope
+import metrics
+import progress
+import registry
+import tasks
+import throttle
+import transport
+import worker
+
+logger = logging.getLogger(__name__)
+
+ASYNC_CONCURRENCY = int(os.getenv("WORKER_ASYNC_CONCURRENCY", "100"))
+# o pop não bloqueia mais que isso, para o loop reagir logo ao encerramento
+POP_TIMEOUT = 1.0
+
+
+def task_mode(spec: Dict[str, Any]) -> str:
+    """"async" para corrotinas; senão o "mode" do executor (thread por padrão)."""
+    if inspect.iscoroutinefunction(spec["func"]):
+        return "async"
+    return spec.get("mode", "thread")
+
+
+async def execute(
+    task_name: str,
+    spec: Dict[str, Any],
+    args: List[Any],
+    kwargs: Dict[str, Any],
+    executors: Dict[str, Executor],
+    progress_ref: Optional[str] = None,
+) -> Any:
+    """
+    Aguarda a corrotina no loop ou executa a função síncrona (com memoização e progresso, se
+    houver) no executor do seu modo.
+    """
+    mode = task_mode(spec)
+    if mode == "async":
+        return await spec["func"](*args, **kwargs)
+    executor = executors.get(mode, executors["thread"])
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, worker.run_task, spec["func"], args, kwargs, task_name, spec.get("memoize", 0), progress_ref
+    )
+
+
+async def handle_task(
+    item: Tuple[str, str],
+    executors: Dict[str, Executor],
+    stats: worker.ThroughputStats,
+    sync_client: redis.Redis,
+    rq: Optional[transport.ReliableQueue],
+    limiter: throttle.Limiter,
+) -> None:
+    queue, task_json = item
+    error: Optional[BaseException] = None
+    result: Any = None
+    mode = "async"
+    try:
+        task_name, spec, task_args, task_kwargs = worker.parse_task(task_json)
+        mode = task_mode(spec)
+        lease = await asyncio.to_thread(limiter.acquire, task_name, spec) if throttle.has_limits(spec) else None
+
+        metrics.log_sampled(logger, "🏃 Executando '%s' com args=%s, kwargs=%s", task_name, task_args, task_kwargs)
+        token = stats.started(task_name)
+        ok = False
+        try:
+            result = await execute(
+                task_name, spec, task_args, task_kwargs, executors, worker.progress_ref(task_json, spec)
+            )
+            ok = True
+        finally:
+            stats.finished(token, ok)
+            if lease is not None:
+                await asyncio.to_thread(limiter.release, task_name, lease)
+        stats.record(mode, True)
+        metrics.log_sampled(logger, "✅ Tarefa '%s' concluída com sucesso. Resultado: %s", task_name, result)
+
+    except throttle.Throttled as e:
+        error = e
+        metrics.log_sampled(logger, "⏳ %s", e)
+    except tasks.TaskInterrupted as e:
+        error = e
+        logger.info("⏸️ %s", e)
+    except (worker.InvalidTaskError, envelope.EnvelopeError) as e:
+        error = e
+        logger.error("❌ %s", e)
+    except Exception as e:
+        error = e
+        stats.record(mode, False)
+        logger.exception("🔥 Ocorreu um erro inesperado ao processar a tarefa.")
+
+    # resultado, retentativa e ack usam o cliente síncrono, fora do event loop
+    try:
+        if error is not None:
+            await asyncio.to_thread(worker.retry_or_dead_letter, sync_client, queue, task_json, error)
+        else:
+            await asyncio.to_thread(worker.save_result, sync_client, task_json, result)
+        if rq is not None:
+            await asyncio.to_thread(rq.ack, [item])
+    except Exception:
+        logger.exception("Falha ao finalizar tarefa da fila %s.", queue)
+
+
+async def run(concurrency: int = ASYNC_CONCURRENCY) -> None:
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        # mesmo handler do worker.py; via loop o sinal acorda o event loop na hora
+        loop.add_signal_handler(sig, worker.handle_signal, sig, None)
+
+    client = transport.async_redis_client()
+    sync_client = worker.make_redis_client()
+    limiter = throttle.Limiter(sync_client)
+    backoff = 1.0
+    max_backoff = 30.0
+
+    stats = worker.ThroughputStats()
+    executors: Dict[str, Executor] = {
+        "thread": ThreadPoolExecutor(max_workers=worker.WORKER_THREADS, thread_name_prefix="task"),
+        "process": ProcessPoolExecutor(
+            max_workers=worker.WORKER_PROCESSES, initializer=progress.init_process, initargs=(progress.stop_event(),)
+        ),
+    }
+    logger.info(
+        "Worker em modo async (concorrência=%s threads=%s processes=%s)",
+        concurrency, worker.WORKER_THREADS, worker.WORKER_PROCESSES,
+    )
+    next_stats = time.monotonic() + worker.STATS_INTERVAL
+    heartbeat = registry.Heartbeat(worker.make_redis_client(), worker.WORKER_ID, "async", concurrency, stats.snapshot).start()
+
+    queue_weights = transport.worker_queues(
+        worker.AVAILABLE_TASKS, {name: spec.get("weight", 1) for name, spec in worker.AVAILABLE_TASKS.items()}
+    )
+    selector = transport.QueueSelector(queue_weights, worker.WORKER_QUEUE_POLICY)
+    logger.info("Consumindo filas %s (política=%s)", selector.queues, selector.policy)
+
+    rq: Optional[transport.ReliableQueue] = None
+    lease_stop = threading.Event()
+    if worker.RELIABLE_QUEUE:
+        rq = transport.ReliableQueue(sync_client, worker.WORKER_ID, selector.queues, worker.VISIBILITY_TIMEOUT)
+        threading.Thread(target=worker._keep_lease, args=(rq, lease_stop), daemon=True).start()
+        logger.info("Fila confiável ativa (worker=%s visibility_timeout=%ss)", worker.WORKER_ID, worker.VISIBILITY_TIMEOUT)
+    next_reap = time.monotonic()
+    next_promote = time.monotonic()
+
+    in_flight: Set[asyncio.Task] = set()
+
+    while worker.running:
+        try:
+            if time.monotonic() >= next_stats:
+                stats.log()
+                next_stats = time.monotonic() + worker.STATS_INTERVAL
+            if rq is not None and time.monotonic() >= next_reap:
+                await asyncio.to_thread(rq.reap)
+                next_reap = time.monotonic() + worker.REAP_INTERVAL
+            if time.monotonic() >= next_promote:
+                _, next_due = await transport.promote_due_async(client)
+                wait = worker.DELAYED_POLL_INTERVAL
+                if next_due is not None:
+                    wait = min(wait, max(0.0, next_due - time.time()))
+                next_promote = time.monotonic() + wait
+
+            # só retira da fila o que cabe no limite de concorrência
+            free = concurrency - len(in_flight)
+            if free <= 0:
+                await asyncio.wait(in_flight, timeout=POP_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            timeout = min(POP_TIMEOUT, max(0.05, next_promote - time.monotonic()))
+            count = min(transport.BATCH_SIZE, free)
+            queues = selector.order()
+            batch: List[Tuple[str, str]]
+            with metrics.timer(metrics.DEQUEUE_WAIT):
+                if rq is not None:
+                    batch = await asyncio.to_thread(rq.claim, count, timeout, queues)
+                else:
+                    batch = await transport.pop_batch_async(client, queues, count, timeout=timeout)
+
+            for item in batch:
+                task = asyncio.create_task(handle_task(item, executors, stats, sync_client, rq, limiter))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+            backoff = 1.0  # Reset backoff on success
+        except redis.exceptions.ConnectionError as e:
+            logger.warning("🚨 Erro de conexão com o Redis: %s. Reconectando em ~%s segundos...", e, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(max_backoff, backoff * 2)
+            await client.aclose()
+            client = transport.async_redis_client()
+        except Exception:
+            logger.exception("Erro inesperado no loop do worker asyncio")
+            await asyncio.sleep(1)
+
+    if in_flight:
+        logger.info("Aguardando %s tarefas em andamento...", len(in_flight))
+        await asyncio.gather(*in_flight, return_exceptions=True)
+    for executor in executors.values():
+        executor.shutdown(wait=True)
+    heartbeat.stop()
+    if rq is not None:
+        lease_stop.set()
+        try:
+            rq.deregister()
+        except Exception:
+            logger.warning("Não foi possível remover o registro do worker %s.", worker.WORKER_ID)
+    stats.log()
+    logger.info("Worker encerrado.")
+    try:
+        await client.aclose()
+        sync_client.close()
+    except Exception:
+        pass
+
+
+def main() -> None:
+    metrics.start_server()
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
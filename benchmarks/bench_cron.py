@@ -0,0 +1,66 @@
+"""
+Micro-benchmark: croniter por job (caminho antigo) vs cron_cache.
+
+Uso:
+  python3 benchmarks/bench_cron.py [--jobs 50000] [--exprs 20]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+from croniter import croniter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cron_cache  # noqa: E402
+
+EXPRESSIONS = [
+    "* * * * *", "*/5 * * * *", "*/15 * * * *", "0 * * * *", "30 2 * * *",
+    "0 9 * * 1-5", "0 0 1 * *", "15,45 * * * *", "0 */6 * * *", "0 8-18 * * 1-5",
+]
+
+
+def per_job(schedules, base):
+    return [croniter(expr, base).get_next(datetime) for expr in schedules]
+
+
+def cached_per_job(schedules, base):
+    return [cron_cache.next_fire(expr, base) for expr in schedules]
+
+
+def bulk(schedules, base):
+    return cron_cache.next_fire_times(schedules, base)
+
+
+def run(name, func, schedules, base, baseline=None):
+    start = time.perf_counter()
+    result = func(schedules, base)
+    elapsed = time.perf_counter() - start
+    speedup = f"  ({baseline / elapsed:.1f}x)" if baseline else ""
+    print(f"{name:<22} {elapsed * 1000:9.1f} ms  {len(schedules) / elapsed:12,.0f} jobs/s{speedup}")
+    return elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=50_000)
+    parser.add_argument("--exprs", type=int, default=len(EXPRESSIONS))
+    args = parser.parse_args()
+
+    exprs = (EXPRESSIONS * (args.exprs // len(EXPRESSIONS) + 1))[: args.exprs]
+    schedules = [exprs[i % len(exprs)] for i in range(args.jobs)]
+    base = datetime.now()
+
+    print(f"{args.jobs} jobs, {len(set(exprs))} expressões distintas")
+    baseline, expected = run("croniter por job", per_job, schedules, base)
+    _, got = run("cache, por job", cached_per_job, schedules, base, baseline)
+    assert got == expected
+    _, got = run("cache, em lote", bulk, schedules, base, baseline)
+    assert got == expected
+    hits, misses, size = cron_cache.cache_info()
+    print(f"cache: hits={hits} misses={misses} size={size}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,502 @@
+"""
+Benchmark ponta a ponta: enqueue, latência dequeue->início, throughput dos workers e tick do scheduler.
+
+Seções (--only para escolher):
+  enqueue     tarefas/s de RPUSH individual, push_tasks, BatchProducer e enqueue_unique
+  latency     atraso entre o enqueue e o início da tarefa (p50/p95/p99) com um worker ocioso, por modo
+  throughput  tarefas/s drenando um backlog com 1..N processos de worker, por modo
+              (sync, pool-thread, pool-process, async)
+  tick        tempo para o scheduler reivindicar e enfileirar 1k/10k/100k jobs vencidos, com o cache
+              de definições vazio (cold) e já carregado (warm, o regime normal do scheduler)
+
+Serviços: usa o Redis (REDIS_HOST/REDIS_PORT) e o PostgreSQL (DB_*) do ambiente se responderem;
+senão sobe um fakeredis TCP na própria máquina e um PostgreSQL embutido (pacote pgserver). O
+tick roda no banco `<DB_NAME>_bench` (ou no embutido), nunca na tabela jobs do ambiente, e as
+filas usam o prefixo `bench_queue`. Números com stand-ins servem para comparar execuções entre si,
+não com produção; o backend usado fica registrado no resultado.
+
+Os resultados vão para um JSON (--output) com metadados (commit, parâmetros, backends);
+--compare <anterior.json> imprime a variação das métricas principais.
+
+Uso:
+  python3 benchmarks/bench_e2e.py [--only enqueue,latency,throughput,tick] [--tasks 20000]
+      [--workers 1,2,4] [--modes sync,pool-thread,pool-process,async] [--jobs 1000,10000,100000]
+      [--redis auto|real|fake] [--postgres auto|real|embedded|skip] [--output arquivo.json]
+      [--compare anterior.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# filas isoladas das de produção; definido antes de importar transport
+os.environ.setdefault("QUEUE_NAME", "bench_queue")
+
+LATENCY_KEY = "bench:latency"
+SECTIONS = ("enqueue", "latency", "throughput", "tick")
+# modo -> (env do worker, tarefa registrada no worker filho)
+MODES = {
+    "sync": ({"WORKER_MODE": "sync"}, "bench_task"),
+    "pool-thread": ({"WORKER_MODE": "pool"}, "bench_task"),
+    "pool-process": ({"WORKER_MODE": "pool"}, "bench_task_process"),
+    "async": ({"WORKER_MODE": "async"}, "bench_task_async"),
+}
+
+_client = None
+
+
+def _record(enqueued_at, started):
+    """
+    Grava a latência da tarefa; o tamanho da lista é o contador de concluídas. Um único comando
+    de propósito: o servidor TCP do fakeredis não usa TCP_NODELAY e respostas múltiplas de um
+    pipeline esperariam o ACK atrasado (~40 ms), o que mediria o stand-in e não o worker.
+    """
+    global _client
+    if _client is None:
+        import transport
+        _client = transport.redis_client()
+    _client.rpush(LATENCY_KEY, started - enqueued_at)
+
+
+def bench_task(enqueued_at, work_ms=0.0):
+    started = time.time()
+    if work_ms:
+        time.sleep(work_ms / 1000)
+    _record(enqueued_at, started)
+
+
+async def bench_task_async(enqueued_at, work_ms=0.0):
+    started = time.time()
+    if work_ms:
+        await asyncio.sleep(work_ms / 1000)
+    _record(enqueued_at, started)
+
+
+def worker_child():
+    """Entrada dos processos de worker: registra as tarefas de benchmark e roda worker.main()."""
+    import worker
+    worker.AVAILABLE_TASKS["bench_task"] = {"func": bench_task, "mode": "thread"}
+    worker.AVAILABLE_TASKS["bench_task_process"] = {"func": bench_task, "mode": "process"}
+    worker.AVAILABLE_TASKS["bench_task_async"] = {"func": bench_task_async}
+    worker.main()
+
+
+# ---------------------------------------------------------------- serviços
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def setup_redis(choice):
+    import redis
+    if choice in ("auto", "real"):
+        try:
+            redis.Redis(
+                host=os.getenv("REDIS_HOST", "redis"), port=int(os.getenv("REDIS_PORT", "6379")), socket_timeout=2
+            ).ping()
+            return "real"
+        except redis.exceptions.RedisError:
+            if choice == "real":
+                raise
+    from fakeredis import TcpFakeServer
+    port = _free_port()
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.update(REDIS_HOST="127.0.0.1", REDIS_PORT=str(port))
+    return "fakeredis"
+
+
+def setup_postgres(choice):
+    """Aponta DB_* para um banco de benchmark. Retorna (backend, servidor embutido ou None)."""
+    if choice == "skip":
+        return "skipped", None
+    if choice in ("auto", "real"):
+        import psycopg2
+        params = dict(
+            dbname=os.getenv("DB_NAME", "scheduler_db"), user=os.getenv("DB_USER", "admin"),
+            password=os.getenv("DB_PASSWORD", "admin"), host=os.getenv("DB_HOST", "localhost"),
+            port=int(os.getenv("DB_PORT", "5432")), connect_timeout=2,
+        )
+        try:
+            bench_db = f"{params['dbname']}_bench"
+            conn = psycopg2.connect(**params)
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (bench_db,))
+                if cur.fetchone() is None:
+                    cur.execute(f'CREATE DATABASE "{bench_db}"')
+            conn.close()
+            os.environ["DB_NAME"] = bench_db
+            return "real", None
+        except psycopg2.Error as e:
+            if choice == "real":
+                raise
+            print(f"PostgreSQL indisponível ({str(e).strip()}); tentando o embutido.")
+    try:
+        import pgserver
+    except ImportError:
+        print("pgserver não instalado: seção tick ignorada.")
+        return "skipped", None
+    server = pgserver.get_server(tempfile.mkdtemp(prefix="bench_pg_"), cleanup_mode="delete")
+    host = parse_qs(urlparse(server.get_uri()).query)["host"][0]
+    os.environ.update(DB_HOST=host, DB_USER="postgres", DB_NAME="postgres", DB_PASSWORD="")
+    return "embedded", server
+
+
+# ---------------------------------------------------------------- seções
+
+
+def percentiles(values):
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]  # noqa: E731
+    return {
+        "count": len(ordered),
+        "p50_ms": round(pick(0.50) * 1000, 3),
+        "p95_ms": round(pick(0.95) * 1000, 3),
+        "p99_ms": round(pick(0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+    }
+
+
+def bench_enqueue(client, n):
+    import envelope
+    import transport
+
+    queue = transport.queue_name()
+
+    def payload(i):
+        return envelope.encode({"task_name": "bench_task", "args": [], "kwargs": {"enqueued_at": 0, "i": i}})
+
+    def rpush_single():
+        for i in range(n):
+            client.rpush(queue, payload(i))
+
+    def push_tasks():
+        transport.push_tasks(client, (payload(i) for i in range(n)), queue)
+
+    def batch_producer():
+        with transport.BatchProducer(client) as producer:
+            for i in range(n):
+                producer.push(payload(i), queue)
+
+    def enqueue_unique():
+        prefix = time.time_ns()
+        transport.enqueue_unique(client, ((queue, payload(i), f"bench:{prefix}:{i}", None) for i in range(n)))
+
+    out = {}
+    for name, func in [("rpush_single", rpush_single), ("push_tasks", push_tasks),
+                       ("batch_producer", batch_producer), ("enqueue_unique", enqueue_unique)]:
+        client.delete(queue)
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        assert client.llen(queue) == n, name
+        out[name] = {"tasks": n, "seconds": round(elapsed, 4), "tasks_per_sec": round(n / elapsed, 1)}
+        print(f"  enqueue {name:<15} {n / elapsed:12,.0f} tarefas/s")
+    client.delete(queue)
+    for key in client.scan_iter(match=f"{transport.QUEUE_NAME}:idem:bench:*", count=1000):
+        client.delete(key)
+    return out
+
+
+class Workers:
+    """Processos de worker de benchmark para um modo, encerrados com SIGTERM."""
+
+    def __init__(self, client, mode, count, args):
+        env = dict(
+            os.environ, METRICS_PORT="0", HEARTBEAT_INTERVAL="0.2", WORKER_STATS_INTERVAL="3600",
+            WORKER_THREADS=str(args.threads), WORKER_PROCESSES=str(args.processes),
+            WORKER_ASYNC_CONCURRENCY=str(args.concurrency), **MODES[mode][0],
+        )
+        self.client = client
+        self.procs = [
+            subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--worker-child"],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            for _ in range(count)
+        ]
+
+    def __enter__(self):
+        import registry
+        deadline = time.monotonic() + 60
+        pids = {p.pid for p in self.procs}
+        while time.monotonic() < deadline:
+            if pids <= {w["pid"] for w in registry.live_workers(self.client)}:
+                return self
+            time.sleep(0.1)
+        raise RuntimeError("workers não ficaram prontos em 60s")
+
+    def __exit__(self, *exc):
+        for proc in self.procs:
+            proc.send_signal(signal.SIGTERM)
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def _reset(client):
+    import transport
+    client.delete(LATENCY_KEY, transport.queue_name())
+
+
+def _wait_done(client, n, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if client.llen(LATENCY_KEY) >= n:
+            return True
+        time.sleep(0.002)
+    return False
+
+
+def bench_latency(client, modes, args):
+    import envelope
+    import transport
+
+    out = {}
+    for mode in modes:
+        _reset(client)
+        task_name = MODES[mode][1]
+        with Workers(client, mode, 1, args):
+            for _ in range(args.latency_tasks):
+                task = {"task_name": task_name, "args": [], "kwargs": {"enqueued_at": time.time()}}
+                client.rpush(transport.queue_name(), envelope.encode(task))
+                time.sleep(args.latency_interval / 1000)
+            ok = _wait_done(client, args.latency_tasks, timeout=60)
+        values = [float(v) for v in client.lrange(LATENCY_KEY, 0, -1)]
+        out[mode] = dict(percentiles(values), complete=ok) if values else {"count": 0, "complete": ok}
+        print(f"  latência {mode:<13} p50 {out[mode].get('p50_ms', 0):8.2f} ms  p99 {out[mode].get('p99_ms', 0):8.2f} ms")
+    return out
+
+
+def bench_throughput(client, modes, counts, args):
+    import envelope
+    import transport
+
+    out = []
+    for mode in modes:
+        task_name = MODES[mode][1]
+        for count in counts:
+            _reset(client)
+            with Workers(client, mode, count, args):
+                now = time.time()
+                transport.push_tasks(
+                    client,
+                    (envelope.encode({"task_name": task_name, "args": [],
+                                      "kwargs": {"enqueued_at": now, "work_ms": args.work_ms}})
+                     for _ in range(args.tasks)),
+                )
+                start = time.perf_counter()
+                ok = _wait_done(client, args.tasks, timeout=args.timeout)
+                elapsed = time.perf_counter() - start
+            done = client.llen(LATENCY_KEY)
+            row = {"mode": mode, "workers": count, "tasks": done, "seconds": round(elapsed, 4),
+                   "tasks_per_sec": round(done / elapsed, 1), "complete": ok}
+            out.append(row)
+            print(f"  throughput {mode:<13} workers={count:<3} {row['tasks_per_sec']:10,.0f} tarefas/s"
+                  + ("" if ok else "  (timeout)"))
+    _reset(client)
+    return out
+
+
+def bench_tick(client, sizes, batch_size):
+    from psycopg2 import extras
+
+    import database as db
+    import scheduler
+    import transport
+
+    def drain():
+        batches = []
+        start = time.perf_counter()
+        while True:
+            t = time.perf_counter()
+            claimed, _ = scheduler.claim_and_advance(client, batch_size)
+            if not claimed:
+                break
+            batches.append(time.perf_counter() - t)
+        return time.perf_counter() - start, batches
+
+    db.init_db()
+    out = []
+    for size in sizes:
+        db.execute("TRUNCATE jobs RESTART IDENTITY")
+        past = datetime.now() - timedelta(minutes=1)
+        payload = json.dumps({"task_name": "send_email", "kwargs": {"email": "a@b.com", "message": "bench"}})
+        exprs = ["*/5 * * * *", "0 * * * *", "*/15 * * * *", "30 2 * * *"]
+        with db.get_connection() as conn:
+            with conn.cursor() as cur:
+                extras.execute_values(
+                    cur,
+                    "INSERT INTO jobs (job_name, schedule, payload, next_run_at) VALUES %s",
+                    ((f"bench-{i}", exprs[i % len(exprs)], payload, past) for i in range(size)),
+                    page_size=5000,
+                )
+            conn.commit()
+        for key in client.scan_iter(match=f"{transport.QUEUE_NAME}*", count=1000):
+            client.delete(key)
+
+        scheduler.job_cache.clear()
+        elapsed, batches = drain()
+        t = time.perf_counter()
+        scheduler.claim_and_advance(client, batch_size)
+        idle = time.perf_counter() - t
+        enqueued = client.llen(transport.queue_name())
+        # mesmos jobs vencidos de novo (outro next_run_at, outra chave de idempotência), com o cache cheio
+        db.execute("UPDATE jobs SET next_run_at = %s", (past - timedelta(minutes=1),))
+        warm, warm_batches = drain()
+        row = {
+            "jobs": size, "enqueued": enqueued, "seconds": round(elapsed, 4),
+            "jobs_per_sec": round(size / elapsed, 1), "batches": len(batches),
+            "batch_p50_ms": round(statistics.median(batches) * 1000, 3) if batches else None,
+            "batch_max_ms": round(max(batches) * 1000, 3) if batches else None,
+            "warm_seconds": round(warm, 4), "warm_jobs_per_sec": round(size / warm, 1),
+            "warm_batch_p50_ms": round(statistics.median(warm_batches) * 1000, 3) if warm_batches else None,
+            "idle_tick_ms": round(idle * 1000, 3),
+        }
+        out.append(row)
+        print(f"  tick {size:>7} jobs  cold {elapsed:7.2f}s {row['jobs_per_sec']:9,.0f} jobs/s  "
+              f"warm {warm:7.2f}s {row['warm_jobs_per_sec']:9,.0f} jobs/s  tick ocioso {row['idle_tick_ms']} ms")
+    db.execute("TRUNCATE jobs RESTART IDENTITY")
+    return out
+
+
+# ---------------------------------------------------------------- comparação
+
+
+def _metrics(result):
+    """Métricas comparáveis: nome -> (valor, maior é melhor)."""
+    flat = {}
+    for name, row in result.get("enqueue", {}).items():
+        flat[f"enqueue.{name}"] = (row["tasks_per_sec"], True)
+    for mode, row in result.get("latency", {}).items():
+        if "p99_ms" in row:
+            flat[f"latency.{mode}.p50_ms"] = (row["p50_ms"], False)
+            flat[f"latency.{mode}.p99_ms"] = (row["p99_ms"], False)
+    for row in result.get("throughput", []):
+        flat[f"throughput.{row['mode']}.w{row['workers']}"] = (row["tasks_per_sec"], True)
+    for row in result.get("tick", []):
+        flat[f"tick.{row['jobs']}.seconds"] = (row["seconds"], False)
+        if "warm_seconds" in row:
+            flat[f"tick.{row['jobs']}.warm_seconds"] = (row["warm_seconds"], False)
+    return flat
+
+
+def compare(previous, current):
+    before, after = _metrics(previous), _metrics(current)
+    print(f"\ncomparação com {previous['meta'].get('commit')} ({previous['meta'].get('timestamp')}):")
+    for name in sorted(set(before) & set(after)):
+        old, higher_better = before[name]
+        new, _ = after[name]
+        if not old:
+            continue
+        change = (new - old) / old * 100
+        better = change > 0 if higher_better else change < 0
+        mark = "melhor" if better and abs(change) >= 5 else "pior" if abs(change) >= 5 else "="
+        print(f"  {name:<32} {old:>12,.2f} -> {new:>12,.2f}  {change:+7.1f}%  {mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--worker-child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--only", default=",".join(SECTIONS))
+    parser.add_argument("--tasks", type=int, default=20_000, help="tarefas por medição de enqueue/throughput")
+    parser.add_argument("--workers", default="1,2,4", help="quantidades de processos de worker")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--work-ms", type=float, default=1.0, help="I/O simulado por tarefa no throughput")
+    parser.add_argument("--latency-tasks", type=int, default=200)
+    parser.add_argument("--latency-interval", type=float, default=5.0, help="ms entre enqueues na medição de latência")
+    parser.add_argument("--jobs", default="1000,10000,100000")
+    parser.add_argument("--batch-size", type=int, default=500, help="SCHEDULER_BATCH_SIZE no tick")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--redis", choices=("auto", "real", "fake"), default="auto")
+    parser.add_argument("--postgres", choices=("auto", "real", "embedded", "skip"), default="auto")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", f"e2e-{time.strftime('%Y%m%d-%H%M%S')}.json"))
+    parser.add_argument("--compare", help="JSON de uma execução anterior")
+    args = parser.parse_args()
+
+    if args.worker_child:
+        worker_child()
+        return
+
+    sections = [s for s in args.only.split(",") if s]
+    modes = [m for m in args.modes.split(",") if m]
+    for name in sections:
+        if name not in SECTIONS:
+            parser.error(f"seção desconhecida: {name}")
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"modo desconhecido: {mode}")
+
+    redis_backend = setup_redis(args.redis)
+    pg_backend, pg_server = setup_postgres(args.postgres if "tick" in sections else "skip")
+
+    import transport
+    # os módulos do repo configuram logging INFO; aqui só interessam os números
+    logging.getLogger().setLevel(logging.WARNING)
+    client = transport.redis_client()
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    result = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit or None,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "redis": redis_backend,
+            "postgres": pg_backend,
+            "params": {k: v for k, v in vars(args).items() if k not in ("worker_child", "output", "compare")},
+        }
+    }
+    print(f"Redis: {redis_backend}  PostgreSQL: {pg_backend}  commit: {commit or '?'}")
+
+    try:
+        if "enqueue" in sections:
+            result["enqueue"] = bench_enqueue(client, args.tasks)
+        if "latency" in sections:
+            result["latency"] = bench_latency(client, modes, args)
+        if "throughput" in sections:
+            counts = [int(c) for c in args.workers.split(",") if c]
+            result["throughput"] = bench_throughput(client, modes, counts, args)
+        if "tick" in sections and pg_backend != "skipped":
+            result["tick"] = bench_tick(client, [int(j) for j in args.jobs.split(",") if j], args.batch_size)
+    finally:
+        if pg_server is not None:
+            import database as db
+            db.close_pool()
+            pg_server.cleanup()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResultados em {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
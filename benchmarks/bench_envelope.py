@@ -0,0 +1,98 @@
+"""
+Benchmark do envelope de tarefas: custo de encode/decode e memória no Redis por milhão de tarefas.
+
+Compara JSON (formato legado) com msgpack, msgpack+zlib e msgpack+lz4 para um payload
+pequeno (send_email) e um grande (generate_report com muitos filtros). A memória é estimada
+pelo tamanho do payload; com --redis mede a diferença de used_memory no servidor real
+(REDIS_HOST/REDIS_PORT) para --sample tarefas e extrapola para 1M.
+
+Uso:
+  python3 benchmarks/bench_envelope.py [--iterations 20000] [--redis] [--sample 100000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import envelope  # noqa: E402
+import transport  # noqa: E402
+
+PAYLOADS = {
+    "send_email": {
+        "task_name": "send_email",
+        "args": [],
+        "kwargs": {"email": "junior.dev@empresa.com", "message": "Sua primeira tarefa distribuída!"},
+    },
+    "generate_report": {
+        "task_name": "generate_report",
+        "args": [],
+        "kwargs": {
+            "report_type": "vendas_mensal",
+            "filters": {
+                "regioes": ["norte", "nordeste", "sul", "sudeste", "centro-oeste"] * 4,
+                "clientes": [f"cliente-{i:05d}" for i in range(300)],
+                "periodo": {"inicio": "2024-01-01", "fim": "2024-12-31"},
+                "agrupar_por": ["mes", "regiao", "produto"],
+            },
+        },
+    },
+}
+
+VARIANTS = {
+    "json": dict(fmt="json"),
+    "msgpack": dict(fmt="msgpack", compression="none"),
+    "msgpack+zlib": dict(fmt="msgpack", compression="zlib"),
+    "msgpack+lz4": dict(fmt="msgpack", compression="lz4"),
+}
+
+
+def measure(task, options, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encoded = envelope.encode(task, **options)
+    encode_us = (time.perf_counter() - start) / iterations * 1e6
+    start = time.perf_counter()
+    for _ in range(iterations):
+        envelope.decode(encoded)
+    decode_us = (time.perf_counter() - start) / iterations * 1e6
+    return encoded, encode_us, decode_us
+
+
+def redis_bytes_per_task(encoded, sample):
+    client = transport.redis_client()
+    key = "bench:envelope"
+    client.delete(key)
+    before = client.info("memory")["used_memory"]
+    pipe = client.pipeline(transaction=False)
+    for start in range(0, sample, 1000):
+        pipe.rpush(key, *([encoded] * min(1000, sample - start)))
+    pipe.execute()
+    after = client.info("memory")["used_memory"]
+    client.delete(key)
+    return (after - before) / sample
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--redis", action="store_true", help="medir used_memory em um Redis real")
+    parser.add_argument("--sample", type=int, default=100_000)
+    args = parser.parse_args()
+
+    if envelope.msgpack is None:
+        print("msgpack não instalado: apenas JSON disponível.")
+    if envelope.lz4_frame is None:
+        print("lz4 não instalado: msgpack+lz4 usará zlib.")
+
+    for name, task in PAYLOADS.items():
+        print(f"\n{name}")
+        print(f"{'formato':<14} {'bytes':>7} {'encode µs':>10} {'decode µs':>10} {'MB/1M tarefas':>14}")
+        for variant, options in VARIANTS.items():
+            encoded, enc_us, dec_us = measure(task, options, args.iterations)
+            per_task = redis_bytes_per_task(encoded, args.sample) if args.redis else len(encoded)
+            print(f"{variant:<14} {len(encoded):>7} {enc_us:>10.2f} {dec_us:>10.2f} {per_task * 1e6 / 2**20:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
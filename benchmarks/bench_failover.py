@@ -0,0 +1,118 @@
+"""
+Harness de failover do scheduler: sobe N réplicas de scheduler.py, mata o líder com SIGKILL
+e mede o tempo até outra réplica assumir (novo fencing token no Redis). A cada rodada confere
+também que o token do líder morto é recusado pelo enqueue (fencing) e repõe a réplica morta.
+
+Usa o Redis e o PostgreSQL do ambiente (REDIS_HOST/REDIS_PORT, DB_*), como os serviços.
+O failover esperado é no máximo lease + lease/3 (expiração + intervalo de tentativa do standby).
+
+Uso:
+  python3 benchmarks/bench_failover.py [--replicas 3] [--rounds 5] [--lease 3] [--json failover.json]
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import envelope  # noqa: E402
+import leader  # noqa: E402
+import transport  # noqa: E402
+
+
+def start_replica(lease):
+    env = dict(os.environ, SCHEDULER_LEADER_LEASE=str(lease), METRICS_PORT="0")
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "scheduler.py")],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_leader(client, replicas, timeout, previous_token=0):
+    """Espera um líder com token maior que `previous_token` entre as réplicas vivas. Retorna (Popen, token)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        current = leader.current_leader(client)
+        if current and current[1] > previous_token:
+            pid = int(current[0].rpartition("-")[2])
+            for proc in replicas:
+                if proc.pid == pid:
+                    return proc, current[1]
+        time.sleep(0.005)
+    raise RuntimeError(f"nenhum líder novo em {timeout}s")
+
+
+def stale_write_rejected(client, token):
+    task = envelope.encode({"task_name": "send_email", "args": [], "kwargs": {}})
+    try:
+        transport.enqueue_unique(
+            client, [(transport.queue_name(), task, f"failover-check:{token}", None)], fencing=(leader.FENCING_KEY, token)
+        )
+    except transport.FencedError:
+        return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--lease", type=float, default=3.0)
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    args = parser.parse_args()
+
+    client = transport.redis_client()
+    replicas = [start_replica(args.lease) for _ in range(max(2, args.replicas))]
+    bound = args.lease + args.lease / 3
+    rounds = []
+    try:
+        current, token = wait_leader(client, replicas, timeout=bound * 3 + 10)
+        print(f"{len(replicas)} réplicas, lease={args.lease}s, limite esperado ~{bound:.2f}s")
+        for n in range(1, args.rounds + 1):
+            killed_at = time.monotonic()
+            current.send_signal(signal.SIGKILL)
+            current.wait()
+            replicas.remove(current)
+            new, new_token = wait_leader(client, replicas, timeout=bound * 3, previous_token=token)
+            failover = time.monotonic() - killed_at
+            fenced = stale_write_rejected(client, token)
+            rounds.append({"round": n, "failover_seconds": round(failover, 4), "old_token": token,
+                           "new_token": new_token, "stale_write_rejected": fenced})
+            print(f"rodada {n}: failover {failover:6.3f}s  token {token} -> {new_token}  "
+                  f"escrita do líder antigo recusada: {'sim' if fenced else 'NÃO'}")
+            replicas.append(start_replica(args.lease))
+            current, token = new, new_token
+    finally:
+        for proc in replicas:
+            proc.send_signal(signal.SIGTERM)
+        for proc in replicas:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    times = [r["failover_seconds"] for r in rounds]
+    summary = {
+        "replicas": len(replicas),
+        "lease_seconds": args.lease,
+        "expected_bound_seconds": round(bound, 4),
+        "min_seconds": min(times),
+        "mean_seconds": round(statistics.mean(times), 4),
+        "max_seconds": max(times),
+        "all_stale_writes_rejected": all(r["stale_write_rejected"] for r in rounds),
+        "rounds": rounds,
+    }
+    print(f"failover: min {summary['min_seconds']:.3f}s  média {summary['mean_seconds']:.3f}s  "
+          f"máx {summary['max_seconds']:.3f}s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,39 @@
 import typer
 import redis
 import json
+import os
+import sys
+import time
+import envelope
+from datetime import datetime
+import transport
+import progress
+import registry
+import results
 from rich.console import Console
-from typing import Optional, List
+from rich.progress import BarColumn, Progress, SpinnerColumn, TaskProgressColumn, TextColumn, TimeElapsedColumn
+from rich.table import Table
+from typing import Any, BinaryIO, Dict, Optional, List, Tuple
 from pathlib import Path
 
-r = redis.Redis(host='localhost', port=6379, decode_responses=True)
-QUEUE_NAME = 'task_queue'
+# REDIS_HOST/REDIS_PORT como no worker; fora do compose o padrão é o Redis local
+r = transport.redis_client(host=os.getenv("REDIS_HOST", "localhost"))
+QUEUE_NAME = transport.QUEUE_NAME
 
 app = typer.Typer()
 console = Console()
 
 @app.command()
-def enqueue(task_name:str, args_json: Optional[str]=typer.Argument(None), file: Optional[Path]=typer.Option(None, "--file", "-f", help="Caminho para um arquivo JSON com kwargs")):
+def enqueue(
+    task_name:str,
+    args_json: Optional[str]=typer.Argument(None),
+    file: Optional[Path]=typer.Option(None, "--file", "-f", help="Caminho para um arquivo JSON com kwargs"),
+    priority: str=typer.Option(transport.DEFAULT_PRIORITY, "--priority", "-p", help=f"Prioridade da tarefa: {', '.join(transport.PRIORITIES)}"),
+    delay: Optional[float]=typer.Option(None, "--delay", help="Executar daqui a N segundos"),
+    eta: Optional[datetime]=typer.Option(None, "--eta", help="Executar no horário informado (ex.: 2025-01-31T18:00:00)"),
+    wait: Optional[float]=typer.Option(None, "--wait", "-w", help="Aguardar o resultado por até N segundos"),
+    idempotency_key: Optional[str]=typer.Option(None, "--idempotency-key", "-k", help="Ignora o envio se a mesma chave já foi enfileirada (IDEMPOTENCY_TTL)"),
+):
     """
     Enfileira uma nova tarefa no Redis.
 
@@ -20,8 +41,27 @@ def enqueue(task_name:str, args_json: Optional[str]=typer.Argument(None), file:
       python3 cli.py enqueue send_email '{"email":"a@b.com","message":"Oi"}'
       python3 cli.py enqueue send_email -- '{"email":"a@b.com","message":"Oi"}'
       python3 cli.py enqueue send_email -f payload.json
+      python3 cli.py enqueue generate_report -p low '{"report_type":"vendas","filters":{}}'
+      python3 cli.py enqueue send_email --delay 30 '{"email":"a@b.com","message":"Oi"}'
+      python3 cli.py enqueue send_email --wait 10 '{"email":"a@b.com","message":"Oi"}'
+      python3 cli.py enqueue send_email -k pedido-42 '{"email":"a@b.com","message":"Oi"}'
     """
      
+    try:
+        queue = transport.queue_name(priority, task_name)
+    except ValueError as e:
+        console.print(f"[bold red]❌ {e}[/bold red]")
+        raise typer.Exit(code=1)
+
+    if delay is not None and eta is not None:
+        console.print("[bold red]❌ Use apenas uma das opções --delay ou --eta.[/bold red]")
+        raise typer.Exit(code=1)
+    run_at: Optional[float] = None
+    if delay is not None:
+        run_at = time.time() + delay
+    elif eta is not None:
+        run_at = eta.timestamp()
+
     try:
         if file:
             if not file.exists():
@@ -29,7 +69,7 @@ def enqueue(task_name:str, args_json: Optional[str]=typer.Argument(None), file:
                 raise typer.Exit(code=1)
             json_text = file.read_text()
         else:
-            json_text = "{}" if not args_json else " ".join(args_json)
+            json_text = args_json or "{}"
         
         kwargs = json.loads(json_text)
         
@@ -37,17 +77,34 @@ def enqueue(task_name:str, args_json: Optional[str]=typer.Argument(None), file:
             console.print("[bold red]❌ Erro: Os argumentos fornecidos devem ser um objeto JSON (dicionário).[/bold red]")
             raise typer.Exit(code=1)
 
+        task_id = results.new_task_id(idempotency_key)
         task_payload = {
+            "task_id": task_id,
             "task_name":task_name,
             "args": [],
             "kwargs": kwargs
         }
+        if idempotency_key:
+            task_payload["idempotency_key"] = idempotency_key
 
-        task_json = json.dumps(task_payload)
-        r.rpush(QUEUE_NAME, task_json)
+        encoded = envelope.encode(task_payload)
+        if idempotency_key:
+            added = transport.enqueue_unique(r, [(queue, encoded, idempotency_key, run_at)])[0]
+        elif run_at is not None:
+            added = transport.schedule_many(r, [(queue, encoded, run_at)]) > 0
+        else:
+            added = transport.push_tasks(r, [encoded], queue) > 0
 
-        console.print(f"[bold green]✅ Tarefa '{task_name}' enfileirada com sucesso![/bold green]")
-        console.print(f" Payload: [cyan]{task_json}[/cyan]")
+        if not added:
+            console.print(f"[bold yellow]⚠️ Tarefa com a chave '{idempotency_key}' já foi enfileirada; envio ignorado.[/bold yellow]")
+        elif run_at is not None:
+            console.print(f"[bold green]⏰ Tarefa '{task_name}' agendada para {datetime.fromtimestamp(run_at):%Y-%m-%d %H:%M:%S} em '{queue}'.[/bold green]")
+        else:
+            console.print(f"[bold green]✅ Tarefa '{task_name}' enfileirada com sucesso em '{queue}'![/bold green]")
+        console.print(f" Payload: [cyan]{json.dumps(task_payload)}[/cyan]")
+        console.print(f" ID da tarefa: [bold]{task_id}[/bold]")
+        if wait is not None:
+            _print_result(task_id, results.wait_for_result(r, task_id, timeout=wait))
 
     except json.JSONDecodeError:
         console.print("[bold red]❌ Erro: O texto de argumentos fornecido não é um JSON válido.[/bold red]")
@@ -55,6 +112,313 @@ def enqueue(task_name:str, args_json: Optional[str]=typer.Argument(None), file:
         console.print(f"[bold red]🚨 Erro de conexão com o Redis: {e}[/bold red]")
     except Exception as e:
         console.print(f"[bold red]🔥 Ocorreu um erro inesperado: {e}[/bold red]")
-    
+
+
+def _parse_bulk_line(line: bytes, default_task: Optional[str], priority: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Valida uma linha do NDJSON e retorna (fila, tarefa). A linha é uma tarefa completa
+    ({"task_name", "args", "kwargs", "priority", "idempotency_key"}) ou, com --task, só os kwargs.
+    Levanta ValueError com o motivo se a linha for inválida.
+    """
+    try:
+        data = json.loads(line)
+    except ValueError as e:
+        raise ValueError(f"JSON inválido ({e})")
+    if not isinstance(data, dict):
+        raise ValueError("a linha deve ser um objeto JSON")
+
+    if "task_name" in data:
+        task_name = data["task_name"]
+        args, kwargs = data.get("args", []), data.get("kwargs", {})
+        task_priority = data.get("priority", priority)
+    elif default_task:
+        task_name, args, kwargs, task_priority = default_task, [], data, priority
+    else:
+        raise ValueError("sem task_name (use --task para linhas só com kwargs)")
+    if not isinstance(task_name, str) or not task_name:
+        raise ValueError("task_name deve ser uma string não vazia")
+    if not isinstance(args, list) or not isinstance(kwargs, dict):
+        raise ValueError("args deve ser lista e kwargs objeto")
+
+    task_payload: Dict[str, Any] = {"task_name": task_name, "args": args, "kwargs": kwargs}
+    key = data.get("idempotency_key") if "task_name" in data else None
+    if key:
+        task_payload["idempotency_key"] = str(key)
+        task_payload["task_id"] = results.new_task_id(str(key))
+    elif "task_name" in data and data.get("task_id"):
+        task_payload["task_id"] = str(data["task_id"])
+    return transport.queue_name(task_priority, task_name), task_payload
+
+
+@app.command("enqueue-bulk")
+def enqueue_bulk(
+    source: str=typer.Argument("-", help="Arquivo NDJSON (uma tarefa por linha) ou '-' para stdin"),
+    task: Optional[str]=typer.Option(None, "--task", "-t", help="Tarefa das linhas que trazem só os kwargs"),
+    priority: str=typer.Option(transport.DEFAULT_PRIORITY, "--priority", "-p", help=f"Prioridade padrão: {', '.join(transport.PRIORITIES)}"),
+    chunk_size: int=typer.Option(1000, "--chunk-size", "-c", help="Tarefas por pipeline enviado ao Redis"),
+    skip: int=typer.Option(0, "--skip", help="Pula as N primeiras linhas (para retomar um envio interrompido)"),
+    strict: bool=typer.Option(False, "--strict", help="Interrompe na primeira linha inválida"),
+):
+    """
+    Enfileira tarefas em massa a partir de NDJSON, em streaming e com memória constante.
+
+    Exemplos:
+      python3 cli.py enqueue-bulk tarefas.ndjson
+      python3 cli.py enqueue-bulk emails.ndjson --task send_email -c 5000
+      gzip -dc backfill.ndjson.gz | python3 cli.py enqueue-bulk - -t send_email
+    """
+    try:
+        transport.queue_name(priority)
+    except ValueError as e:
+        console.print(f"[bold red]❌ {e}[/bold red]")
+        raise typer.Exit(code=1)
+
+    if source == "-":
+        stream: BinaryIO = sys.stdin.buffer
+        total_bytes: Optional[int] = None
+    else:
+        path = Path(source)
+        if not path.exists():
+            console.print(f"[bold red]❌ Arquivo não encontrado: {path}[/bold red]")
+            raise typer.Exit(code=1)
+        stream = path.open("rb")
+        total_bytes = path.stat().st_size
+
+    producer = transport.BatchProducer(r, batch_size=chunk_size)
+    keyed: List[Tuple[str, envelope.Payload, str, None]] = []
+    sent_keyed = duplicates = invalid = pending = 0
+    line_no = flushed_line = 0
+    started = time.monotonic()
+
+    def confirmed() -> int:
+        """Tarefas que o Redis já confirmou (as do producer e as com idempotency_key)."""
+        return producer.sent + sent_keyed
+
+    def flush() -> None:
+        nonlocal sent_keyed, duplicates, pending, flushed_line
+        # as com idempotency_key vão antes: se o flush do producer falhar, reenviá-las no
+        # --skip não duplica nada
+        if keyed:
+            added = transport.enqueue_unique(r, keyed, batch_size=chunk_size)
+            sent_keyed += added.count(True)
+            duplicates += added.count(False)
+            keyed.clear()
+        producer.flush()
+        pending = 0
+        # só avança o ponto de retomada depois que o Redis confirmou todo o lote
+        flushed_line = line_no
+
+    display = Progress(
+        SpinnerColumn(),
+        TextColumn("[bold]{task.fields[sent]}[/bold] enviadas"),
+        BarColumn(),
+        TextColumn("{task.fields[rate]:.0f} tarefas/s"),
+        TextColumn("[red]{task.fields[invalid]} inválidas"),
+        TimeElapsedColumn(),
+        console=console,
+        transient=False,
+    )
+    try:
+        with display, stream:
+            bar = display.add_task("enqueue", total=total_bytes, sent=0, rate=0.0, invalid=0)
+            for line in stream:
+                line_no += 1
+                display.advance(bar, len(line))
+                if line_no <= skip or not line.strip():
+                    continue
+                try:
+                    queue, task_payload = _parse_bulk_line(line, task, priority)
+                except ValueError as e:
+                    invalid += 1
+                    if invalid <= 20:
+                        display.console.print(f"[yellow]⚠️ Linha {line_no}: {e}[/yellow]")
+                    if strict:
+                        break
+                    continue
+
+                encoded = envelope.encode(task_payload)
+                if "idempotency_key" in task_payload:
+                    keyed.append((queue, encoded, task_payload["idempotency_key"], None))
+                else:
+                    producer.push(encoded, queue)
+                pending += 1
+                if pending >= chunk_size:
+                    flush()
+                    elapsed = max(time.monotonic() - started, 1e-9)
+                    display.update(bar, sent=confirmed(), rate=confirmed() / elapsed, invalid=invalid)
+            flush()
+            elapsed = max(time.monotonic() - started, 1e-9)
+            display.update(bar, sent=confirmed(), rate=confirmed() / elapsed, invalid=invalid)
+    except redis.exceptions.RedisError as e:
+        console.print(f"[bold red]🚨 Erro de conexão com o Redis: {e}[/bold red]")
+        console.print(f" {confirmed()} tarefas confirmadas pelo Redis; retome com [bold]--skip {flushed_line}[/bold].")
+        raise typer.Exit(code=1)
+
+    sent = confirmed()
+    console.print(
+        f"[bold green]✅ {sent} tarefas enfileiradas em {elapsed:.1f}s ({sent / elapsed:.0f} tarefas/s).[/bold green]"
+        + (f" {duplicates} duplicadas ignoradas." if duplicates else "")
+    )
+    if invalid:
+        console.print(f"[bold yellow]⚠️ {invalid} linhas inválidas ignoradas.[/bold yellow]")
+        raise typer.Exit(code=1)
+
+
+def _print_result(task_id: str, record: Optional[dict]) -> None:
+    if record is None:
+        console.print(f"[yellow]⏳ {task_id}: sem resultado (pendente, expirado ou desconhecido).[/yellow]")
+    elif record["status"] == results.STATUS_SUCCESS:
+        console.print(f"[bold green]✅ {task_id}:[/bold green] [cyan]{json.dumps(record['result'], default=str)}[/cyan]")
+    else:
+        console.print(f"[bold red]❌ {task_id}: {record.get('error')}[/bold red]")
+
+
+@app.command()
+def result(
+    task_ids: List[str]=typer.Argument(..., help="IDs retornados pelo enqueue"),
+    wait: Optional[float]=typer.Option(None, "--wait", "-w", help="Aguardar cada resultado por até N segundos"),
+):
+    """
+    Mostra o resultado de uma ou mais tarefas.
+
+    Exemplos:
+      python3 cli.py result 3f2a... 9c1b...
+      python3 cli.py result 3f2a... --wait 30
+    """
+    try:
+        if wait is not None:
+            for task_id in task_ids:
+                _print_result(task_id, results.wait_for_result(r, task_id, timeout=wait))
+        else:
+            for task_id, record in results.get_results(r, task_ids).items():
+                _print_result(task_id, record)
+    except redis.exceptions.RedisError as e:
+        console.print(f"[bold red]🚨 Erro de conexão com o Redis: {e}[/bold red]")
+        raise typer.Exit(code=1)
+
+
+@app.command("progress")
+def show_progress(
+    task_ids: Optional[List[str]]=typer.Argument(None, help="IDs das tarefas (padrão: todas com progresso publicado)"),
+    follow: bool=typer.Option(False, "--follow", "-f", help="Acompanhar ao vivo até todas terminarem"),
+    interval: float=typer.Option(0.5, "--interval", help="Segundos entre atualizações com --follow"),
+):
+    """
+    Mostra o progresso de tarefas longas (ex.: generate_report) publicado pelos workers.
+
+    Exemplos:
+      python3 cli.py progress
+      python3 cli.py progress 3f2a... --follow
+    """
+    try:
+        refs = list(task_ids) if task_ids else progress.tracked_refs(r)
+        records = progress.get_progress(r, refs)
+    except redis.exceptions.RedisError as e:
+        console.print(f"[bold red]🚨 Erro de conexão com o Redis: {e}[/bold red]")
+        raise typer.Exit(code=1)
+    if not refs:
+        console.print("[yellow]Nenhuma tarefa com progresso publicado.[/yellow]")
+        return
+
+    if not follow:
+        table = Table(title="Progresso das tarefas")
+        for column in ("ID", "Tarefa", "Status", "Progresso", "Atualizado há"):
+            table.add_column(column)
+        now = time.time()
+        for ref, record in records.items():
+            if record is None:
+                table.add_row(ref, "-", "desconhecido", "-", "-")
+                continue
+            pct = f"{100 * record['current'] / record['total']:.0f}%" if record["total"] else "-"
+            table.add_row(
+                ref, record["task_name"] or "-", record["status"] or "-",
+                f"{record['current']}/{record['total']} ({pct})", f"{now - record['updated_at']:.0f}s",
+            )
+        console.print(table)
+        return
+
+    # interrompidas voltam à fila e são retomadas por outro worker, então seguem acompanhadas
+    finished = {progress.STATUS_DONE, progress.STATUS_FAILED}
+    columns = (
+        SpinnerColumn(), TextColumn("{task.description}"), BarColumn(), TaskProgressColumn(),
+        TextColumn("{task.fields[status]}"), TimeElapsedColumn(),
+    )
+    try:
+        with Progress(*columns, console=console) as bars:
+            ids = {ref: bars.add_task(ref[:12], total=None, status="aguardando") for ref in refs}
+            while True:
+                for ref, record in records.items():
+                    if record is None:
+                        continue
+                    bars.update(
+                        ids[ref],
+                        description=f"{ref[:12]} {record['task_name'] or ''}",
+                        completed=record["current"],
+                        total=record["total"] or None,
+                        status=record["status"],
+                    )
+                if all(record is not None and record["status"] in finished for record in records.values()):
+                    break
+                time.sleep(interval)
+                records = progress.get_progress(r, refs)
+    except redis.exceptions.RedisError as e:
+        console.print(f"[bold red]🚨 Erro de conexão com o Redis: {e}[/bold red]")
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def workers(
+    target_seconds: float=typer.Option(60, "--target-seconds", help="Prazo desejado para esvaziar o backlog"),
+    min_workers: int=typer.Option(1, "--min", help="Mínimo de workers recomendado"),
+    max_workers: Optional[int]=typer.Option(None, "--max", help="Máximo de workers recomendado"),
+    as_json: bool=typer.Option(False, "--json", help="Saída em JSON (para o autoscaler)"),
+):
+    """
+    Lista os workers vivos e recomenda quantos workers rodar, pela profundidade das filas
+    e pelo tempo de serviço medido por tipo de tarefa.
+
+    Exemplos:
+      python3 cli.py workers
+      python3 cli.py workers --target-seconds 30 --max 20 --json
+    """
+    try:
+        alive = registry.live_workers(r)
+        depths = registry.queue_depths(r, registry.ready_queues(r))
+    except redis.exceptions.RedisError as e:
+        console.print(f"[bold red]🚨 Erro de conexão com o Redis: {e}[/bold red]")
+        raise typer.Exit(code=1)
+
+    service = registry.service_times(alive)
+    capacity = sum(w["capacity"] for w in alive) / len(alive) if alive else 1
+    recommended = registry.recommend_workers(depths, service, capacity, target_seconds, min_workers, max_workers)
+
+    if as_json:
+        print(json.dumps({
+            "workers": alive,
+            "backlog": depths,
+            "service_time": service,
+            "capacity_per_worker": capacity,
+            "recommended_workers": recommended,
+        }))
+        return
+
+    table = Table(title=f"Workers vivos ({len(alive)})")
+    for column in ("ID", "Host", "Modo", "Em andamento", "Tarefas/s", "Concluídas", "Falhas", "Visto há"):
+        table.add_column(column)
+    now = time.time()
+    for w in alive:
+        table.add_row(
+            w["id"], w["host"], w["mode"], ", ".join(w["current"]) or "-", f"{w['tasks_per_sec']:.2f}",
+            str(w["done"]), str(w["failed"]), f"{now - w['last_seen']:.0f}s",
+        )
+    console.print(table)
+    backlog = ", ".join(
+        f"{name}={depth} ({f'~{service[name]:.2f}s' if name in service else 'sem medição'})"
+        for name, depth in sorted(depths.items())
+    )
+    console.print(f" Backlog: [cyan]{backlog or 'vazio'}[/cyan]")
+    console.print(f" Workers recomendados para {target_seconds:g}s: [bold]{recommended}[/bold]")
+
+
 if __name__ == "__main__":
     app()
\ No newline at end of file
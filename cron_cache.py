@@ -0,0 +1,67 @@
+"""
+Cache de expressões cron compiladas.
+
+Montar um croniter faz o parse da expressão a cada chamada, o que pesa quando milhares de
+jobs compartilham poucas expressões. Aqui cada (expressão, timezone) é compilada uma vez
+(LRU) e reposicionada com set_current() a cada cálculo. Em um tick todos os jobs usam a
+mesma base, então next_fire_times() calcula uma vez por expressão distinta do lote.
+
+Os objetos croniter são mutáveis: use este módulo a partir de uma única thread
+(o loop do scheduler) ou proteja as chamadas externamente.
+"""
+import os
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+from croniter import croniter
+
+logger = logging.getLogger(__name__)
+
+CRON_CACHE_SIZE = int(os.getenv("CRON_CACHE_SIZE", "1024"))
+
+
+@lru_cache(maxsize=CRON_CACHE_SIZE)
+def compile_cron(expr: str, tz: Optional[str] = None) -> croniter:
+    """Faz o parse da expressão uma única vez por (expr, tz). Levanta ValueError se inválida."""
+    start = datetime.now(ZoneInfo(tz)) if tz else datetime.now()
+    return croniter(expr, start)
+
+
+def next_fire(expr: str, base: datetime, tz: Optional[str] = None) -> datetime:
+    """
+    Próximo disparo de `expr` após `base`. Com `tz`, a expressão é avaliada naquele
+    fuso e o resultado volta como horário local sem tzinfo (como na tabela jobs).
+    """
+    cron = compile_cron(expr, tz)
+    if tz:
+        cron.set_current(base.astimezone(ZoneInfo(tz)))
+        return cron.get_next(datetime).astimezone().replace(tzinfo=None)
+    cron.set_current(base)
+    return cron.get_next(datetime)
+
+
+def next_fire_times(schedules: Sequence[str], base: datetime, tz: Optional[str] = None) -> List[Optional[datetime]]:
+    """
+    Calcula o próximo disparo de um lote de expressões com a mesma base, uma vez por
+    expressão distinta. Retorna a lista alinhada com `schedules`; None para expressões inválidas.
+    """
+    computed: Dict[str, Optional[datetime]] = {}
+    result: List[Optional[datetime]] = []
+    for expr in schedules:
+        if expr not in computed:
+            try:
+                computed[expr] = next_fire(expr, base, tz)
+            except Exception as e:
+                logger.debug("Expressão cron inválida %r: %s", expr, e)
+                computed[expr] = None
+        result.append(computed[expr])
+    return result
+
+
+def cache_info() -> Tuple[int, int, int]:
+    """(hits, misses, tamanho atual) do cache de expressões compiladas."""
+    info = compile_cron.cache_info()
+    return info.hits, info.misses, info.currsize
@@ -1,12 +1,45 @@
+"""
+Acesso ao PostgreSQL: pool de conexões, helpers de consulta e schema (init_db).
+
+O pool (ConnectionPool) mantém entre DB_POOL_MIN e DB_POOL_MAX conexões. Com todas em uso,
+get_connection() espera na fila até DB_POOL_TIMEOUT segundos e então levanta PoolTimeout
+(subclasse de psycopg2.pool.PoolError). Conexões fechadas ou em estado desconhecido são
+descartadas na devolução; as ociosas há mais de DB_POOL_IDLE_CHECK segundos passam por um
+SELECT 1 antes de sair do pool (todas, depois que uma conexão quebra em uso), e as ociosas
+há mais de DB_POOL_MAX_IDLE segundos (acima do mínimo) são fechadas. A devolução só faz
+rollback se a conexão ficou com transação aberta.
+
+pool_stats() expõe tamanho, conexões em uso/ociosas, checkouts/s e espera; com
+DB_POOL_STATS_INTERVAL > 0 o pool loga esse resumo periodicamente.
+
+execute_prepared() roda consultas do caminho quente como prepared statements nomeados
+(PREPARE uma vez por conexão, depois EXECUTE), poupando o parse e o planejamento a cada
+chamada. Desligue com DB_PREPARED_STATEMENTS=false atrás de um PgBouncer em modo transaction.
+
+Ajustes via env:
+  DB_POOL_MIN / DB_POOL_MAX   -> conexões mínimas/máximas (padrão 1 / 5)
+  DB_POOL_TIMEOUT             -> espera máxima por uma conexão livre, em segundos (padrão 30)
+  DB_POOL_IDLE_CHECK          -> ociosidade (s) a partir da qual a conexão é validada (padrão 30)
+  DB_POOL_MAX_IDLE            -> ociosidade (s) a partir da qual a conexão é fechada (padrão 300)
+  DB_POOL_STATS_INTERVAL      -> segundos entre logs de estatísticas do pool (padrão 60, 0 desliga)
+  DB_PREPARED_STATEMENTS      -> usa prepared statements nomeados (padrão true)
+"""
 import os
+import re
 import time
 import logging
+import threading
+from collections import deque
 from contextlib import contextmanager
-from typing import Optional, Any, Iterator
+from functools import lru_cache
+from typing import Optional, Any, Deque, Dict, Iterator, List, Sequence, Set, Tuple
 
 import psycopg2
+import psycopg2.errors
 from psycopg2 import pool, sql, extras
 
+import metrics
+
 logger = logging.getLogger(__name__)
 if not logger.handlers:
     logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
@@ -18,25 +51,328 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "admin")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = int(os.getenv("DB_PORT", "5432"))
 
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_IDLE_CHECK = float(os.getenv("DB_POOL_IDLE_CHECK", "30"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_STATS_INTERVAL = float(os.getenv("DB_POOL_STATS_INTERVAL", "60"))
+PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "true").lower() in ("1", "true", "yes")
+
+# canal do LISTEN/NOTIFY disparado quando um job é criado, editado ou removido
+JOBS_CHANNEL = "jobs_changed"
+
+# histogramas das consultas (ver metrics.py), com labels resolvidos uma vez
+_EXECUTE_TIME = metrics.DB_QUERY.labels("execute")
+_FETCH_ONE_TIME = metrics.DB_QUERY.labels("fetch_one")
+_FETCH_ALL_TIME = metrics.DB_QUERY.labels("fetch_all")
+_POOL_IN_USE = metrics.DB_POOL_CONNECTIONS.labels("in_use")
+_POOL_IDLE = metrics.DB_POOL_CONNECTIONS.labels("idle")
+
+
+class PoolTimeout(pool.PoolError):
+    """Nenhuma conexão ficou livre dentro do timeout do checkout."""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Conexão do pool: guarda os prepared statements já criados nela e quando foi devolvida."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.prepared: Set[str] = set()
+        self.returned_at = time.monotonic()
+
+
+class _Waiter:
+    """Lugar na fila de espera do pool: recebe uma conexão devolvida ou a vez de abrir uma nova."""
+
+    __slots__ = ("event", "conn", "may_connect")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.conn: Optional[PooledConnection] = None
+        self.may_connect = False
+
+
+class ConnectionPool:
+    """
+    Pool thread-safe com fila de espera FIFO: a conexão devolvida vai direto para quem espera
+    há mais tempo, sem disputa com checkouts novos. Conexões ociosas saem em ordem LIFO (a mais
+    recente, com cache e prepared statements quentes) e as mais antigas são as primeiras a expirar.
+    """
+
+    def __init__(
+        self,
+        minconn: int = DB_POOL_MIN,
+        maxconn: int = DB_POOL_MAX,
+        timeout: float = DB_POOL_TIMEOUT,
+        idle_check: float = DB_POOL_IDLE_CHECK,
+        max_idle: float = DB_POOL_MAX_IDLE,
+        stats_interval: float = DB_POOL_STATS_INTERVAL,
+        **dsn: Any,
+    ) -> None:
+        if maxconn < max(1, minconn):
+            raise ValueError("maxconn deve ser >= minconn e >= 1")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self.max_idle = max_idle
+        self.stats_interval = stats_interval
+        self._dsn = dsn
+        self._lock = threading.Lock()
+        self._idle: Deque[PooledConnection] = deque()
+        self._waiters: Deque[_Waiter] = deque()
+        self._size = 0
+        self._closed = False
+        # conexões devolvidas antes deste instante são validadas no checkout: quando uma conexão
+        # quebra em uso (servidor reiniciado, failover) as ociosas provavelmente caíram junto
+        self._suspect_before = 0.0
+        # contadores acumulados e da janela atual (zerada a cada pool_stats/log)
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._window_start = time.monotonic()
+        self._window_checkouts = 0
+        self._window_wait_max = 0.0
+        self._next_log = time.monotonic() + stats_interval
+        try:
+            for _ in range(minconn):
+                self._idle.append(self._connect())
+                self._size += 1
+        except Exception:
+            # não deixa abertas as conexões do preenchimento que já tinham conectado
+            while self._idle:
+                self._close(self._idle.pop())
+            raise
+        self._update_gauges()
+
+    def _connect(self) -> PooledConnection:
+        return psycopg2.connect(connection_factory=PooledConnection, **self._dsn)
+
+    def _update_gauges(self) -> None:
+        _POOL_IN_USE.set(self._size - len(self._idle))
+        _POOL_IDLE.set(len(self._idle))
+
+    def _close(self, conn: PooledConnection) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _validate(self, conn: PooledConnection) -> bool:
+        """Confere uma conexão ociosa antes de entregá-la. Chamada fora do lock."""
+        if conn.closed:
+            return False
+        if conn.returned_at >= self._suspect_before and time.monotonic() - conn.returned_at < self.idle_check:
+            return True
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.autocommit = False
+            return True
+        except psycopg2.Error as e:
+            logger.warning("Conexão ociosa do pool inválida, descartando: %s", e)
+            return False
+
+    def _prune_idle(self) -> None:
+        """Fecha as conexões ociosas há mais de max_idle, preservando minconn. Chamada com o lock."""
+        now = time.monotonic()
+        while self._idle and self._size > self.minconn and now - self._idle[0].returned_at > self.max_idle:
+            self._close(self._idle.popleft())
+            self._size -= 1
+
+    def _release_slot(self) -> None:
+        """Libera o lugar de uma conexão descartada; o primeiro da fila pode abrir outra. Chamada com o lock."""
+        self._size -= 1
+        if self._waiters:
+            waiter = self._waiters.popleft()
+            self._size += 1
+            waiter.may_connect = True
+            waiter.event.set()
+
+    def getconn(self, timeout: Optional[float] = None) -> PooledConnection:
+        """Entrega uma conexão, esperando na fila (FIFO) até `timeout` (padrão: o do pool). Levanta PoolTimeout."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        conn: Optional[PooledConnection] = None
+        connect = False
+        waiter: Optional[_Waiter] = None
+        with self._lock:
+            if self._closed:
+                raise pool.PoolError("connection pool is closed")
+            if self._idle:
+                conn = self._idle.pop()
+            elif self._size < self.maxconn:
+                self._size += 1
+                connect = True
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+
+        if waiter is not None:
+            waiter.event.wait(timeout)
+            with self._lock:
+                if waiter.conn is None and not waiter.may_connect:
+                    # nada recebido: timeout (ou pool fechado); sai da fila
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                    if self._closed:
+                        raise pool.PoolError("connection pool is closed")
+                    self._timeouts += 1
+                    metrics.DB_POOL_TIMEOUTS.inc()
+                    raise PoolTimeout(
+                        f"Nenhuma conexão livre no pool após {timeout:.1f}s ({self.maxconn} em uso, "
+                        f"{len(self._waiters)} na fila)."
+                    )
+            conn, connect = waiter.conn, waiter.may_connect
+
+        if conn is not None and not self._validate(conn):
+            # mantém o lugar da conexão descartada e abre outra no lugar
+            self._close(conn)
+            with self._lock:
+                self._discarded += 1
+            conn, connect = None, True
+        if connect:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._release_slot()
+                    self._update_gauges()
+                raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._checkouts += 1
+            self._window_checkouts += 1
+            self._wait_total += waited
+            self._window_wait_max = max(self._window_wait_max, waited)
+            self._update_gauges()
+        metrics.DB_POOL_WAIT.observe(waited)
+        return conn
+
+    def putconn(self, conn: PooledConnection, discard: bool = False) -> None:
+        """
+        Devolve a conexão, entregando-a direto ao primeiro da fila de espera se houver.
+        Fechada, quebrada ou com `discard` ela é descartada e o lugar fica livre.
+        """
+        if not discard and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    logger.debug("rollback falhou ao retornar conexão; descartando")
+                    discard = True
+        if discard or conn.closed or self._closed:
+            broken = bool(conn.closed)
+            self._close(conn)
+            with self._lock:
+                if broken:
+                    self._suspect_before = time.monotonic()
+                if not self._closed:
+                    self._discarded += 1
+                self._release_slot()
+                self._update_gauges()
+            return
+
+        conn.returned_at = time.monotonic()
+        log = False
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.conn = conn
+                waiter.event.set()
+            else:
+                self._idle.append(conn)
+                self._prune_idle()
+            self._update_gauges()
+            if self.stats_interval > 0 and conn.returned_at >= self._next_log:
+                self._next_log = conn.returned_at + self.stats_interval
+                log = True
+        if log:
+            self.log_stats()
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado atual, contadores acumulados e a janela desde a chamada anterior (que é zerada)."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = max(now - self._window_start, 1e-9)
+            out = {
+                "size": self._size,
+                "max_size": self.maxconn,
+                "in_use": self._size - len(self._idle),
+                "idle": len(self._idle),
+                "waiting": len(self._waiters),
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "wait_avg_ms": round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                "window_seconds": round(elapsed, 3),
+                "checkouts_per_sec": round(self._window_checkouts / elapsed, 2),
+                "wait_max_ms": round(self._window_wait_max * 1000, 3),
+            }
+            self._window_start = now
+            self._window_checkouts = 0
+            self._window_wait_max = 0.0
+        return out
+
+    def log_stats(self) -> None:
+        s = self.stats()
+        logger.info(
+            "🐘 Pool: %s/%s em uso, %s ociosas, %s na fila | %.1f checkouts/s, espera máx %.1f ms "
+            "| timeouts=%s descartadas=%s",
+            s["in_use"], s["max_size"], s["idle"], s["waiting"], s["checkouts_per_sec"], s["wait_max_ms"],
+            s["timeouts"], s["discarded"],
+        )
+
+    def closeall(self) -> None:
+        """Fecha as conexões ociosas; as em uso são fechadas ao serem devolvidas."""
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                self._close(self._idle.pop())
+                self._size -= 1
+            while self._waiters:
+                self._waiters.popleft().event.set()
+            self._update_gauges()
+
+
 # pool global (inicializado via init_pool)
-_connection_pool: Optional[pool.ThreadedConnectionPool] = None
+_connection_pool: Optional[ConnectionPool] = None
+# serializa init_pool/close_pool: chamadas sob demanda de várias threads criam um único pool
+_pool_lock = threading.Lock()
 
 
-def init_pool(minconn: int = 1, maxconn: int = 5, retries: int = 3, retry_delay: float = 2.0) -> None:
+def init_pool(
+    minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX, retries: int = 3, retry_delay: float = 2.0
+) -> None:
     """
-    Inicializa o pool de conexões. Pode ser chamada no startup da aplicação.
+    Inicializa o pool de conexões. Pode ser chamada no startup da aplicação ou sob demanda
+    (thread-safe: chamadas concorrentes esperam e reaproveitam o mesmo pool).
     Faz tentativas em caso de falha temporária.
     """
-    global _connection_pool
     if _connection_pool:
         logger.debug("Connection pool já inicializado")
         return
+    with _pool_lock:
+        if _connection_pool:
+            return
+        _create_pool(minconn, maxconn, retries, retry_delay)
 
+
+def _create_pool(minconn: int, maxconn: int, retries: int, retry_delay: float) -> None:
+    global _connection_pool
     attempt = 0
     last_exc: Optional[BaseException] = None
     while attempt < retries:
         try:
-            _connection_pool = pool.ThreadedConnectionPool(
+            _connection_pool = ConnectionPool(
                 minconn=minconn,
                 maxconn=maxconn,
                 dbname=DB_NAME,
@@ -60,72 +396,156 @@ def init_pool(minconn: int = 1, maxconn: int = 5, retries: int = 3, retry_delay:
 def close_pool() -> None:
     """Fecha o pool e todas as conexões (chamar no shutdown)."""
     global _connection_pool
-    if _connection_pool:
-        try:
-            _connection_pool.closeall()
-            logger.info("Pool de conexões fechado.")
-        except Exception:
-            logger.exception("Erro ao fechar connection pool")
-        finally:
-            _connection_pool = None
+    with _pool_lock:
+        if _connection_pool:
+            try:
+                _connection_pool.closeall()
+                logger.info("Pool de conexões fechado.")
+            except Exception:
+                logger.exception("Erro ao fechar connection pool")
+            finally:
+                _connection_pool = None
+
+
+def pool_stats() -> Optional[Dict[str, Any]]:
+    """Estatísticas do pool (ver ConnectionPool.stats), ou None se não inicializado."""
+    return _connection_pool.stats() if _connection_pool else None
 
 
 @contextmanager
-def get_connection() -> Iterator[psycopg2.extensions.connection]:
+def get_connection(autocommit: bool = False) -> Iterator[psycopg2.extensions.connection]:
     """
     Context manager que fornece uma conexão do pool e garante seu retorno.
+    Com autocommit=True cada comando é sua própria transação (sem BEGIN/ROLLBACK extras),
+    o que serve para leituras de um único comando.
     Uso:
       with get_connection() as conn:
           with conn.cursor() as cur:
               cur.execute(...)
     """
-    if not _connection_pool:
+    conn_pool = _connection_pool
+    if not conn_pool:
         raise RuntimeError("Connection pool não inicializado. Chame init_pool() antes.")
-    conn = _connection_pool.getconn()
+    conn = conn_pool.getconn()
+    if autocommit:
+        conn.autocommit = True
     try:
         yield conn
     finally:
-        try:
-            # resetar estado de transação caso a conexão tenha sido usada
-            if conn:
-                conn.rollback()
-        except Exception:
-            logger.debug("rollback falhou ao retornar conexão")
-        _connection_pool.putconn(conn)
+        if autocommit and not conn.closed:
+            try:
+                conn.autocommit = False
+            except psycopg2.Error:
+                pass
+        # o pool só faz rollback se sobrou transação aberta, e descarta conexões quebradas
+        conn_pool.putconn(conn)
+
+
+@lru_cache(maxsize=256)
+def _to_pyformat(query: str) -> Tuple[str, Tuple[int, ...]]:
+    """Converte os $n de um prepared statement em %s e devolve a ordem dos parâmetros."""
+    order: List[int] = []
+
+    def sub(match: "re.Match[str]") -> str:
+        order.append(int(match.group(1)) - 1)
+        return "%s"
+
+    return re.sub(r"\$(\d+)", sub, query), tuple(order)
+
+
+@lru_cache(maxsize=256)
+def _statement_name(name: str) -> str:
+    if not re.fullmatch(r"[a-z_][a-z0-9_]*", name):
+        raise ValueError(f"Nome de prepared statement inválido: {name!r}")
+    return name
+
+
+@lru_cache(maxsize=256)
+def _execute_sql(name: str, nparams: int) -> str:
+    args = f" ({', '.join(['%s'] * nparams)})" if nparams else ""
+    return f"EXECUTE {_statement_name(name)}{args}"
+
+
+def execute_prepared(cur: psycopg2.extensions.cursor, name: str, query: str, params: Sequence[Any] = ()) -> None:
+    """
+    Executa `query` (com parâmetros $1, $2...) como o prepared statement `name` da conexão
+    do cursor, criando-o na primeira vez. Sem prepared statements (DB_PREPARED_STATEMENTS=false
+    ou conexão fora do pool) roda a mesma consulta normalmente.
+    """
+    conn = cur.connection
+    if not PREPARED_STATEMENTS or not isinstance(conn, PooledConnection):
+        text, order = _to_pyformat(query)
+        cur.execute(text, [params[i] for i in order])
+        return
+    if name not in conn.prepared:
+        cur.execute(f"PREPARE {_statement_name(name)} AS {query}")
+        conn.prepared.add(name)
+    try:
+        cur.execute(_execute_sql(name, len(params)), params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # a sessão perdeu o statement (ex.: DISCARD ALL); recria na próxima chamada
+        conn.prepared.discard(name)
+        raise
+
+
+def connect_listener(channel: str = JOBS_CHANNEL) -> psycopg2.extensions.connection:
+    """
+    Abre uma conexão dedicada (fora do pool, em autocommit) já inscrita via LISTEN no canal.
+    Use select() no objeto retornado e conn.poll() para ler conn.notifies.
+    """
+    conn = psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT)
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+    return conn
 
 
 def execute(query: str, params: Optional[tuple] = None, commit: bool = True) -> None:
     """Helper para executar comandos (INSERT/UPDATE/DDL)."""
     with get_connection() as conn:
         try:
-            with conn.cursor() as cur:
+            with metrics.timer(_EXECUTE_TIME), conn.cursor() as cur:
                 cur.execute(query, params)
-            if commit:
-                conn.commit()
+                if commit:
+                    conn.commit()
         except Exception:
             conn.rollback()
             logger.exception("Erro ao executar query")
             raise
 
 
-def fetch_one(query: str, params: Optional[tuple] = None) -> Optional[Any]:
-    with get_connection() as conn:
-        with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+def fetch_one(query: str, params: Optional[tuple] = None, as_dict: bool = True) -> Optional[Any]:
+    """Primeira linha da consulta: dict (padrão) ou tupla com as_dict=False, mais leve."""
+    with get_connection(autocommit=True) as conn:
+        factory = extras.RealDictCursor if as_dict else None
+        with metrics.timer(_FETCH_ONE_TIME), conn.cursor(cursor_factory=factory) as cur:
             cur.execute(query, params)
             return cur.fetchone()
 
 
-def fetch_all(query: str, params: Optional[tuple] = None) -> list:
-    with get_connection() as conn:
-        with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+def fetch_all(query: str, params: Optional[tuple] = None, as_dict: bool = True) -> list:
+    """Todas as linhas da consulta: dicts (padrão) ou tuplas com as_dict=False, mais leves."""
+    with get_connection(autocommit=True) as conn:
+        factory = extras.RealDictCursor if as_dict else None
+        with metrics.timer(_FETCH_ALL_TIME), conn.cursor(cursor_factory=factory) as cur:
             cur.execute(query, params)
             return cur.fetchall()
 
 
+def fetch_prepared(name: str, query: str, params: Sequence[Any] = (), as_dict: bool = True) -> list:
+    """fetch_all de uma consulta do caminho quente via execute_prepared (parâmetros $1, $2...)."""
+    with get_connection(autocommit=True) as conn:
+        factory = extras.RealDictCursor if as_dict else None
+        with metrics.timer(metrics.DB_QUERY.labels(name)), conn.cursor(cursor_factory=factory) as cur:
+            execute_prepared(cur, name, query, params)
+            return cur.fetchall()
+
+
 def init_db() -> None:
-    """Cria a tabela jobs se não existir. Deve ser chamada no startup."""
+    """Cria as tabelas jobs e task_results se não existirem. Deve ser chamada no startup."""
     init_pool()  # garante pool disponível
     create_sql = """
+    CREATE SEQUENCE IF NOT EXISTS jobs_version_seq;
     CREATE TABLE IF NOT EXISTS jobs (
         id SERIAL PRIMARY KEY,
         job_name VARCHAR(255) NOT NULL,
@@ -134,11 +554,79 @@ def init_db() -> None:
         last_run_at TIMESTAMP,
         next_run_at TIMESTAMP NOT NULL,
         is_active BOOLEAN DEFAULT TRUE,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        version BIGINT NOT NULL DEFAULT nextval('jobs_version_seq'),
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
     );
+    ALTER TABLE jobs ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT nextval('jobs_version_seq');
+    ALTER TABLE jobs ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+    """
+    # version vem de uma sequência global e muda a cada alteração da definição do job
+    # (schedule, payload, is_active), não nos avanços de next_run_at: o scheduler guarda as
+    # definições em cache e busca só as linhas com version maior que a última sincronizada
+    version_sql = """
+    CREATE INDEX IF NOT EXISTS idx_jobs_version ON jobs (version);
+
+    CREATE OR REPLACE FUNCTION bump_job_version() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.schedule IS DISTINCT FROM OLD.schedule
+           OR NEW.payload IS DISTINCT FROM OLD.payload
+           OR NEW.is_active IS DISTINCT FROM OLD.is_active THEN
+            NEW.version := nextval('jobs_version_seq');
+            NEW.updated_at := CURRENT_TIMESTAMP;
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS jobs_bump_version ON jobs;
+    CREATE TRIGGER jobs_bump_version
+        BEFORE UPDATE ON jobs
+        FOR EACH ROW EXECUTE FUNCTION bump_job_version();
+    """
+    # índice parcial usado pelo claim de jobs vencidos no scheduler
+    index_sql = """
+    CREATE INDEX IF NOT EXISTS idx_jobs_due_active ON jobs (next_run_at) WHERE is_active;
+    """
+    # resultados de tarefas grandes demais para o Redis (ver results.py)
+    results_sql = """
+    CREATE TABLE IF NOT EXISTS task_results (
+        task_id VARCHAR(64) PRIMARY KEY,
+        result TEXT NOT NULL,
+        expires_at TIMESTAMPTZ NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_task_results_expires ON task_results (expires_at);
+    """
+    # payload "id,next_run_at,is_active"; updates feitos pelo próprio scheduler
+    # (SET LOCAL scheduler.skip_notify = 'on') não notificam
+    notify_sql = """
+    CREATE OR REPLACE FUNCTION notify_jobs_changed() RETURNS trigger AS $$
+    BEGIN
+        IF current_setting('scheduler.skip_notify', true) IS DISTINCT FROM 'on' THEN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('jobs_changed', OLD.id || ',,f');
+            ELSE
+                PERFORM pg_notify(
+                    'jobs_changed',
+                    NEW.id || ',' || to_char(NEW.next_run_at, 'YYYY-MM-DD"T"HH24:MI:SS.US') || ',' || NEW.is_active::text
+                );
+            END IF;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS jobs_changed_notify ON jobs;
+    CREATE TRIGGER jobs_changed_notify
+        AFTER INSERT OR UPDATE OR DELETE ON jobs
+        FOR EACH ROW EXECUTE FUNCTION notify_jobs_changed();
     """
     try:
         execute(create_sql)
+        execute(index_sql)
+        execute(version_sql)
+        execute(notify_sql)
+        execute(results_sql)
         logger.info("Tabela 'jobs' criada ou já existente.")
     except Exception:
         logger.exception("Erro ao inicializar o banco de dados")
@@ -0,0 +1,171 @@
+"""
+Envelope das tarefas trafegadas na fila.
+
+Formatos:
+  - JSON (legado): o objeto da tarefa serializado com json.dumps, começando por "{".
+  - binário v1: b"\\xc1" + versão (1 byte) + codec (1 byte) + corpo msgpack, opcionalmente
+    comprimido com zlib ou lz4 quando passa de TASK_COMPRESS_THRESHOLD bytes. 0xC1 nunca
+    aparece no início de um JSON nem é usado pelo msgpack, então decode() distingue os
+    formatos pelo primeiro byte e continua lendo entradas JSON já enfileiradas.
+
+Ajustes via env:
+  TASK_ENVELOPE              -> "msgpack" (padrão, se instalado) ou "json"
+  TASK_COMPRESSION           -> "zlib" (padrão), "lz4" (se instalado) ou "none"
+  TASK_COMPRESS_THRESHOLD    -> tamanho mínimo (bytes) do corpo para comprimir (padrão 1024)
+
+Os clientes Redis usam decode_responses=True com encoding_errors="surrogateescape"
+(ver transport.redis_client), então o envelope binário chega como str e volta aos bytes
+originais sem perda; decode() aceita str ou bytes.
+"""
+import os
+import json
+import zlib
+import logging
+from typing import Any, Dict, Optional, Union
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - dependência opcional
+    msgpack = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - dependência opcional
+    lz4_frame = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"\xc1"
+VERSION = 1
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_LZ4 = 2
+
+ENVELOPE_FORMAT = os.getenv("TASK_ENVELOPE", "msgpack" if msgpack else "json")
+COMPRESSION = os.getenv("TASK_COMPRESSION", "zlib")
+COMPRESS_THRESHOLD = int(os.getenv("TASK_COMPRESS_THRESHOLD", "1024"))
+
+Payload = Union[str, bytes]
+
+
+class EnvelopeError(ValueError):
+    """Payload que não pode ser decodificado como tarefa."""
+
+
+def to_bytes(payload: Payload) -> bytes:
+    """Bytes originais de um payload lido do Redis como str (surrogateescape)."""
+    if isinstance(payload, bytes):
+        return payload
+    return payload.encode("utf-8", "surrogateescape")
+
+
+def encode(
+    task: Dict[str, Any],
+    fmt: str = ENVELOPE_FORMAT,
+    compression: str = COMPRESSION,
+    threshold: int = COMPRESS_THRESHOLD,
+) -> Payload:
+    """Serializa a tarefa. Retorna str para JSON e bytes para o envelope binário."""
+    if fmt == "json" or msgpack is None:
+        return json.dumps(task)
+
+    return _frame(msgpack.packb(task, use_bin_type=True), compression, threshold)
+
+
+def _frame(body: bytes, compression: str, threshold: int) -> bytes:
+    """Envelope binário v1 em volta de um corpo msgpack, comprimido se passar de `threshold`."""
+    codec = CODEC_RAW
+    if len(body) >= threshold:
+        if compression == "lz4" and lz4_frame is not None:
+            body, codec = lz4_frame.compress(body), CODEC_LZ4
+        elif compression in ("zlib", "lz4"):
+            body, codec = zlib.compress(body, 1), CODEC_ZLIB
+    return MAGIC + bytes((VERSION, codec)) + body
+
+
+def _map_header(size: int) -> bytes:
+    if size < 16:
+        return bytes((0x80 | size,))
+    if size < 1 << 16:
+        return b"\xde" + size.to_bytes(2, "big")
+    return b"\xdf" + size.to_bytes(4, "big")
+
+
+class Template:
+    """
+    Tarefa pré-serializada para disparos repetidos: os campos fixos são codificados uma vez e
+    encode() só serializa os campos do disparo (ex.: idempotency_key) e os concatena ao corpo.
+    O resultado é idêntico a encode() do dicionário completo, lido pelo mesmo decode().
+    Os campos do disparo não podem repetir chaves da tarefa base.
+    """
+
+    __slots__ = ("fmt", "compression", "threshold", "_size", "_body")
+
+    def __init__(
+        self,
+        task: Dict[str, Any],
+        fmt: str = ENVELOPE_FORMAT,
+        compression: str = COMPRESSION,
+        threshold: int = COMPRESS_THRESHOLD,
+    ) -> None:
+        self.fmt = "json" if msgpack is None else fmt
+        self.compression = compression
+        self.threshold = threshold
+        self._size = len(task)
+        if self.fmt == "json":
+            # "{...}" sem a chave de fechamento
+            self._body = json.dumps(task)[:-1]
+        else:
+            self._body = b"".join(
+                msgpack.packb(key, use_bin_type=True) + msgpack.packb(value, use_bin_type=True)
+                for key, value in task.items()
+            )
+
+    def encode(self, extra: Optional[Dict[str, Any]] = None) -> Payload:
+        extra = extra or {}
+        if self.fmt == "json":
+            if not extra:
+                return self._body + "}"
+            fields = json.dumps(extra)[1:]
+            return self._body + (", " if self._size else "") + fields
+        body = _map_header(self._size + len(extra)) + self._body
+        if extra:
+            body += b"".join(
+                msgpack.packb(key, use_bin_type=True) + msgpack.packb(value, use_bin_type=True)
+                for key, value in extra.items()
+            )
+        return _frame(body, self.compression, self.threshold)
+
+
+def decode(payload: Payload) -> Dict[str, Any]:
+    """Desserializa um payload em qualquer formato suportado. Levanta EnvelopeError se inválido."""
+    data = to_bytes(payload)
+    if not data.startswith(MAGIC):
+        try:
+            task = json.loads(data)
+        except ValueError as e:
+            raise EnvelopeError(f"Payload não é JSON válido: {e}") from e
+    else:
+        if len(data) < 3 or data[1] != VERSION:
+            raise EnvelopeError("Envelope binário com versão desconhecida.")
+        if msgpack is None:
+            raise EnvelopeError("Envelope msgpack recebido, mas o pacote msgpack não está instalado.")
+        codec, body = data[2], data[3:]
+        try:
+            if codec == CODEC_ZLIB:
+                body = zlib.decompress(body)
+            elif codec == CODEC_LZ4:
+                if lz4_frame is None:
+                    raise EnvelopeError("Envelope lz4 recebido, mas o pacote lz4 não está instalado.")
+                body = lz4_frame.decompress(body)
+            elif codec != CODEC_RAW:
+                raise EnvelopeError(f"Codec de envelope desconhecido: {codec}")
+            task = msgpack.unpackb(body, raw=False)
+        except EnvelopeError:
+            raise
+        except Exception as e:
+            raise EnvelopeError(f"Envelope binário corrompido: {e}") from e
+
+    if not isinstance(task, dict):
+        raise EnvelopeError("Payload inválido: não é um objeto.")
+    return task
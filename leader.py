@@ -0,0 +1,153 @@
+"""
+Eleição de líder entre réplicas do scheduler, com lease no Redis e fencing token.
+
+A réplica que consegue gravar `task_queue:scheduler:leader` (SET NX PX) vira líder por
+SCHEDULER_LEADER_LEASE segundos e renova o lease a cada terço desse prazo; as demais ficam
+em standby tentando assumir no mesmo intervalo. Se o líder morre, o lease expira e um
+standby assume em no máximo lease + intervalo de renovação.
+
+Cada aquisição incrementa o contador `task_queue:scheduler:fencing` e o valor vira o
+fencing token do mandato. O scheduler envia o token junto com as tarefas e o script de
+enqueue do transport recusa escritas com token menor que o contador atual, então um líder
+antigo (pausado por GC, rede lenta...) não enfileira nada depois que outro assumiu.
+
+O líder também só age enquanto o lease local (medido antes de cada renovação, com margem
+para diferença de relógio) é válido; sem renovar a tempo ele se considera rebaixado.
+
+Ajustes via env:
+  SCHEDULER_LEADER_LEASE  -> duração (s) do lease do líder (padrão 10)
+"""
+import os
+import time
+import socket
+import logging
+from typing import Optional, Tuple
+
+import redis
+
+import metrics
+import transport
+
+logger = logging.getLogger(__name__)
+
+LEADER_KEY = f"{transport.QUEUE_NAME}:scheduler:leader"
+FENCING_KEY = f"{transport.QUEUE_NAME}:scheduler:fencing"
+LEADER_LEASE = float(os.getenv("SCHEDULER_LEADER_LEASE", "10"))
+# fração do lease descontada do prazo local para cobrir diferença de relógio entre processos
+CLOCK_DRIFT = 0.05
+
+# KEYS[1] = lock do líder, KEYS[2] = contador de fencing; ARGV = id da réplica, lease em ms.
+# Retorna o fencing token se a réplica é (ou acabou de virar) líder, senão 0.
+_ACQUIRE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current then
+  local owner, token = string.match(current, '^(.*):(%d+)$')
+  if owner == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return tonumber(token)
+  end
+  return 0
+end
+local token = redis.call('INCR', KEYS[2])
+redis.call('SET', KEYS[1], ARGV[1] .. ':' .. token, 'PX', ARGV[2])
+return token
+"""
+
+# Renova só se o lock ainda é deste mandato (id:token). ARGV = valor esperado, lease em ms.
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def default_node_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def current_leader(client: redis.Redis) -> Optional[Tuple[str, int]]:
+    """(id da réplica, fencing token) do líder atual, ou None se não há líder."""
+    value = client.get(LEADER_KEY)
+    if not value:
+        return None
+    node_id, _, token = value.rpartition(":")
+    return node_id, int(token)
+
+
+class LeaderElection:
+    """
+    Lease de liderança de uma réplica. Chame step() periodicamente (a cada `renew_interval`):
+    tenta assumir em standby e renova quando líder. is_leader() só consulta o prazo local.
+    """
+
+    def __init__(self, client: redis.Redis, node_id: Optional[str] = None, lease: float = LEADER_LEASE) -> None:
+        self.node_id = node_id or default_node_id()
+        self.lease = lease
+        self.renew_interval = lease / 3
+        self.token: Optional[int] = None
+        self._valid_until = 0.0
+        self.set_client(client)
+
+    def set_client(self, client: redis.Redis) -> None:
+        self.client = client
+        self._acquire = client.register_script(_ACQUIRE_SCRIPT)
+        self._renew = client.register_script(_RENEW_SCRIPT)
+        self._release = client.register_script(_RELEASE_SCRIPT)
+
+    @property
+    def fencing(self) -> Optional[Tuple[str, int]]:
+        """(chave do contador, token) a passar para transport.enqueue_unique, ou None fora da liderança."""
+        return (FENCING_KEY, self.token) if self.token is not None else None
+
+    def is_leader(self) -> bool:
+        return self.token is not None and time.monotonic() < self._valid_until
+
+    def _lock_value(self) -> str:
+        return f"{self.node_id}:{self.token}"
+
+    @metrics.timed(metrics.REDIS_RTT.labels("leader_step"))
+    def step(self) -> bool:
+        """Tenta assumir ou renova a liderança. Retorna se esta réplica é líder."""
+        start = time.monotonic()
+        lease_ms = int(self.lease * 1000)
+        if self.token is not None and self.is_leader():
+            if self._renew(keys=[LEADER_KEY], args=[self._lock_value(), lease_ms]):
+                self._valid_until = start + self.lease * (1 - CLOCK_DRIFT)
+                return True
+            self.demote("lease tomado por outra réplica")
+            return False
+        if self.token is not None:
+            self.demote("lease expirou sem renovação")
+
+        token = int(self._acquire(keys=[LEADER_KEY, FENCING_KEY], args=[self.node_id, lease_ms]))
+        if not token:
+            return False
+        self.token = token
+        self._valid_until = start + self.lease * (1 - CLOCK_DRIFT)
+        logger.info("👑 %s assumiu a liderança do scheduler (fencing token %s).", self.node_id, token)
+        return True
+
+    def demote(self, reason: str) -> None:
+        """Abandona o mandato localmente (o lease expira sozinho no Redis)."""
+        logger.warning("⚠️ %s deixou de ser líder: %s.", self.node_id, reason)
+        self.token = None
+        self._valid_until = 0.0
+
+    def release(self) -> None:
+        """Libera o lease no encerramento para um standby assumir sem esperar a expiração."""
+        if self.token is None:
+            return
+        try:
+            self._release(keys=[LEADER_KEY], args=[self._lock_value()])
+        except redis.exceptions.RedisError as e:
+            logger.warning("Não foi possível liberar a liderança: %s", e)
+        self.token = None
+        self._valid_until = 0.0
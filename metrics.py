@@ -0,0 +1,187 @@
+"""
+Métricas Prometheus e logs amostrados do caminho quente.
+
+As métricas são registradas no import e expostas por start_server() em
+http://<host>:METRICS_PORT/metrics (desligado com METRICS_PORT=0). Sem o pacote
+prometheus_client instalado, todas viram no-ops e o resto do código não muda.
+
+Métricas do worker (worker.py / async_worker.py):
+  worker_dequeue_wait_seconds            espera bloqueada no pop/claim
+  worker_tasks_total{task_name,status}   tarefas concluídas/falhas
+  worker_task_duration_seconds{task_name}
+
+Métricas do scheduler:
+  scheduler_tick_duration_seconds        duração de cada tick (sync do cache + todos os lotes claim-and-advance)
+  scheduler_due_job_lag_seconds          agora - next_run_at dos jobs disparados
+
+Métricas de Redis e PostgreSQL, emitidas pelos dois; o label `component` identifica o
+processo (METRICS_COMPONENT, ou o nome do script: worker, async_worker, scheduler, ...):
+  scheduler_db_query_seconds{component,query}     tempo das consultas ao PostgreSQL
+  scheduler_redis_rtt_seconds{component,op}       round trip das operações não bloqueantes no Redis
+  scheduler_db_pool_wait_seconds{component}       espera por uma conexão livre no pool do PostgreSQL
+  scheduler_db_pool_connections{component,state}  conexões do pool em uso / ociosas
+  scheduler_db_pool_timeouts_total{component}     checkouts que desistiram após DB_POOL_TIMEOUT
+
+Logs por tarefa (recebida/executando/concluída, com payload e resultado) saem em DEBUG;
+LOG_SAMPLE_RATE (0 a 1, padrão 0) promove essa fração deles para INFO.
+
+Ajustes via env:
+  METRICS_PORT       -> porta do endpoint HTTP (padrão 0 = desligado)
+  METRICS_COMPONENT  -> valor do label `component` (padrão: nome do script em execução)
+  LOG_SAMPLE_RATE    -> fração dos logs por tarefa emitidos em INFO (padrão 0)
+"""
+import os
+import sys
+import time
+import random
+import logging
+import functools
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, TypeVar
+
+try:
+    import prometheus_client
+except ImportError:  # pragma: no cover - dependência opcional
+    prometheus_client = None
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0"))
+COMPONENT = os.getenv("METRICS_COMPONENT") or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+
+# operações de Redis e banco ficam na casa de sub-milissegundos a poucos ms
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class _NoopMetric:
+    def labels(self, *args: Any, **kwargs: Any) -> "_NoopMetric":
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, value: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+
+class _WithComponent:
+    """Métrica com o label `component` preenchido com o processo que a emite."""
+
+    def __init__(self, metric: Any) -> None:
+        self._metric = metric
+
+    def labels(self, *args: Any) -> Any:
+        return self._metric.labels(COMPONENT, *args)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def inc(self, value: float = 1) -> None:
+        self.labels().inc(value)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+def _shared(metric: Any) -> Any:
+    return metric if prometheus_client is None else _WithComponent(metric)
+
+
+def _histogram(name: str, doc: str, labels: tuple = (), buckets: tuple = ()) -> Any:
+    if prometheus_client is None:
+        return _NoopMetric()
+    kwargs = {"buckets": buckets} if buckets else {}
+    return prometheus_client.Histogram(name, doc, labels, **kwargs)
+
+
+def _counter(name: str, doc: str, labels: tuple = ()) -> Any:
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Counter(name, doc, labels)
+
+
+def _gauge(name: str, doc: str, labels: tuple = ()) -> Any:
+    if prometheus_client is None:
+        return _NoopMetric()
+    return prometheus_client.Gauge(name, doc, labels)
+
+
+DEQUEUE_WAIT = _histogram("worker_dequeue_wait_seconds", "Espera bloqueada no pop/claim de tarefas")
+TASKS = _counter("worker_tasks", "Tarefas executadas por tipo e status", ("task_name", "status"))
+TASK_DURATION = _histogram("worker_task_duration_seconds", "Tempo de execução por tipo de tarefa", ("task_name",))
+TICK_DURATION = _histogram("scheduler_tick_duration_seconds", "Duração de cada tick do scheduler (todos os lotes claim-and-advance)")
+DUE_JOB_LAG = _histogram("scheduler_due_job_lag_seconds", "Atraso entre next_run_at e o disparo do job")
+DB_QUERY = _shared(
+    _histogram("scheduler_db_query_seconds", "Tempo das consultas ao PostgreSQL", ("component", "query"), FAST_BUCKETS)
+)
+REDIS_RTT = _shared(
+    _histogram("scheduler_redis_rtt_seconds", "Round trip das operações no Redis", ("component", "op"), FAST_BUCKETS)
+)
+DB_POOL_WAIT = _shared(
+    _histogram("scheduler_db_pool_wait_seconds", "Espera por uma conexão livre no pool", ("component",), FAST_BUCKETS)
+)
+DB_POOL_CONNECTIONS = _shared(
+    _gauge("scheduler_db_pool_connections", "Conexões do pool do PostgreSQL por estado", ("component", "state"))
+)
+DB_POOL_TIMEOUTS = _shared(
+    _counter("scheduler_db_pool_timeouts", "Checkouts do pool que estouraram DB_POOL_TIMEOUT", ("component",))
+)
+
+
+def start_server(port: int = METRICS_PORT) -> bool:
+    """Sobe o endpoint /metrics em uma thread. Retorna False se desligado ou indisponível."""
+    if not port:
+        return False
+    if prometheus_client is None:
+        logger.warning("METRICS_PORT definido, mas o pacote prometheus_client não está instalado.")
+        return False
+    try:
+        prometheus_client.start_http_server(port)
+    except OSError as e:
+        logger.warning("Não foi possível abrir o endpoint de métricas na porta %s: %s", port, e)
+        return False
+    logger.info("📈 Métricas em http://0.0.0.0:%s/metrics", port)
+    return True
+
+
+@contextmanager
+def timer(metric: Any) -> Iterator[None]:
+    """Observa em `metric` (já com labels) a duração do bloco."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric.observe(time.perf_counter() - start)
+
+
+def timed(metric: Any) -> Callable[[F], F]:
+    """Decorator equivalente a timer() para a função inteira."""
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - start)
+        return wrapper  # type: ignore[return-value]
+    return decorator
+
+
+def record_task(task_name: str, ok: bool, elapsed: float) -> None:
+    TASKS.labels(task_name, "success" if ok else "failure").inc()
+    TASK_DURATION.labels(task_name).observe(elapsed)
+
+
+def log_sampled(log: logging.Logger, msg: str, *args: Any) -> None:
+    """Log do caminho quente: INFO para a fração LOG_SAMPLE_RATE das chamadas, DEBUG para o resto."""
+    if LOG_SAMPLE_RATE > 0 and random.random() < LOG_SAMPLE_RATE:
+        log.info(msg, *args)
+    else:
+        log.debug(msg, *args)
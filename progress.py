@@ -0,0 +1,196 @@
+"""
+Progresso e checkpoints de tarefas longas, publicados no Redis.
+
+Tarefas com "progress": True em AVAILABLE_TASKS (ex.: generate_report) rodam via
+run_tracked(), que injeta nos kwargs:
+  - progress_callback(current, total) -> hash `task_progress:<ref>` (current, total, status,
+    task_name, updated_at), lido pela CLI (`cli.py progress`);
+  - checkpoint / checkpoint_callback   -> estado salvo em `task_checkpoint:<ref>` após cada bloco;
+  - should_stop                        -> True depois que o worker recebeu SIGINT/SIGTERM.
+
+`ref` é o task_id da tarefa (ou a chave de idempotência, ou um hash da chamada), estável entre
+retentativas. No encerramento do worker a tarefa para no fim do bloco atual e levanta
+tasks.TaskInterrupted; o worker a devolve ao início da fila sem contar tentativa e a próxima
+execução continua do checkpoint.
+
+O sinal de parada é um multiprocessing.Event compartilhado com o process pool via
+init_process(), então chega também às tarefas em outros processos.
+
+Ajustes via env:
+  PROGRESS_TTL  -> segundos que progresso e checkpoints ficam no Redis (padrão 86400)
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import multiprocessing
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import redis
+
+import tasks
+import transport
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_PREFIX = "task_progress"
+CHECKPOINT_PREFIX = "task_checkpoint"
+PROGRESS_TTL = int(os.getenv("PROGRESS_TTL", "86400"))
+
+STATUS_RUNNING = "running"
+STATUS_INTERRUPTED = "interrupted"
+STATUS_FAILED = "failed"
+STATUS_DONE = "done"
+
+# evento de parada do worker (criado sob demanda) e cliente Redis de cada processo do pool
+_stop_event: Optional[Any] = None
+_client: Optional[redis.Redis] = None
+
+
+def stop_event() -> Any:
+    global _stop_event
+    if _stop_event is None:
+        _stop_event = multiprocessing.Event()
+    return _stop_event
+
+
+def init_process(event: Any) -> None:
+    """Initializer do ProcessPoolExecutor: compartilha o evento de parada com o processo filho."""
+    global _stop_event
+    _stop_event = event
+
+
+def request_stop() -> None:
+    stop_event().set()
+
+
+def stop_requested() -> bool:
+    return _stop_event is not None and _stop_event.is_set()
+
+
+def task_ref(task_data: Dict[str, Any]) -> str:
+    """Identificador estável da tarefa entre retentativas."""
+    if task_data.get("task_id"):
+        return str(task_data["task_id"])
+    if task_data.get("idempotency_key"):
+        return str(task_data["idempotency_key"])
+    digest = hashlib.sha256(
+        json.dumps(
+            [task_data.get("task_name"), task_data.get("args", []), task_data.get("kwargs", {})],
+            sort_keys=True, separators=(",", ":"), default=str,
+        ).encode()
+    ).hexdigest()
+    return digest[:32]
+
+
+def progress_key(ref: str) -> str:
+    return f"{PROGRESS_PREFIX}:{ref}"
+
+
+def checkpoint_key(ref: str) -> str:
+    return f"{CHECKPOINT_PREFIX}:{ref}"
+
+
+class TaskProgress:
+    """Publica progresso e checkpoints de uma execução. Falhas do Redis só geram warnings."""
+
+    def __init__(self, ref: str, task_name: Optional[str] = None, ttl: int = PROGRESS_TTL) -> None:
+        global _client
+        if _client is None:
+            _client = transport.redis_client()
+        self.client = _client
+        self.ref = ref
+        self.task_name = task_name or ""
+        self.ttl = ttl
+
+    def _set(self, **fields: Any) -> None:
+        fields.update(task_name=self.task_name, updated_at=time.time())
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hset(progress_key(self.ref), mapping=fields)
+            pipe.expire(progress_key(self.ref), self.ttl)
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.warning("Não foi possível publicar o progresso de %s: %s", self.ref, e)
+
+    def publish(self, current: int, total: int) -> None:
+        self._set(current=current, total=total, status=STATUS_RUNNING)
+
+    def mark(self, status: str) -> None:
+        self._set(status=status)
+
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        try:
+            raw = self.client.get(checkpoint_key(self.ref))
+        except redis.exceptions.RedisError as e:
+            logger.warning("Checkpoint de %s indisponível; recomeçando: %s", self.ref, e)
+            return None
+        return json.loads(raw) if raw else None
+
+    def save_checkpoint(self, state: Dict[str, Any]) -> None:
+        try:
+            self.client.set(checkpoint_key(self.ref), json.dumps(state, separators=(",", ":")), ex=self.ttl)
+        except redis.exceptions.RedisError as e:
+            logger.warning("Não foi possível salvar o checkpoint de %s: %s", self.ref, e)
+
+    def finish(self) -> None:
+        self.mark(STATUS_DONE)
+        try:
+            self.client.delete(checkpoint_key(self.ref))
+        except redis.exceptions.RedisError as e:
+            logger.warning("Não foi possível remover o checkpoint de %s: %s", self.ref, e)
+
+
+def run_tracked(
+    func: Callable[..., Any], args: List[Any], kwargs: Dict[str, Any], ref: str, task_name: Optional[str] = None
+) -> Any:
+    """Executa a tarefa com progresso, checkpoint e sinal de parada injetados nos kwargs."""
+    tracker = TaskProgress(ref, task_name)
+    checkpoint = tracker.load_checkpoint()
+    try:
+        result = func(
+            *args,
+            **kwargs,
+            progress_callback=tracker.publish,
+            checkpoint=checkpoint,
+            checkpoint_callback=tracker.save_checkpoint,
+            should_stop=stop_requested,
+        )
+    except tasks.TaskInterrupted:
+        tracker.mark(STATUS_INTERRUPTED)
+        raise
+    except Exception:
+        tracker.mark(STATUS_FAILED)
+        raise
+    tracker.finish()
+    return result
+
+
+def get_progress(client: redis.Redis, refs: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Progresso de vários refs em um único round trip; None para os desconhecidos ou expirados."""
+    refs = list(refs)
+    pipe = client.pipeline(transaction=False)
+    for ref in refs:
+        pipe.hgetall(progress_key(ref))
+    replies = pipe.execute() if refs else []
+    out: Dict[str, Optional[Dict[str, Any]]] = {}
+    for ref, fields in zip(refs, replies):
+        if not fields:
+            out[ref] = None
+            continue
+        out[ref] = {
+            "ref": ref,
+            "task_name": fields.get("task_name") or None,
+            "status": fields.get("status"),
+            "current": int(fields.get("current", 0)),
+            "total": int(fields.get("total", 0)),
+            "updated_at": float(fields.get("updated_at", 0)),
+        }
+    return out
+
+
+def tracked_refs(client: redis.Redis) -> List[str]:
+    """Refs com progresso publicado (em andamento, interrompidos ou concluídos dentro do TTL)."""
+    prefix = f"{PROGRESS_PREFIX}:"
+    return sorted(key[len(prefix):] for key in client.scan_iter(match=f"{prefix}*", count=1000))
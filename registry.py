@@ -0,0 +1,218 @@
+"""
+Registro de workers vivos e sinal para autoscaling.
+
+Cada worker publica a cada HEARTBEAT_INTERVAL segundos, em um único pipeline, o hash
+`task_queue:worker:<id>` (id, host, pid, modo, capacidade, tarefas em andamento,
+tarefas/s, totais, tempo de serviço por tipo de tarefa e last_seen) com TTL de três
+intervalos, e seu score no zset `task_queue:workers`. Workers que param de publicar
+somem sozinhos: o hash expira e live_workers() descarta os scores antigos.
+
+recommend_workers() estima quantos workers esvaziam o backlog em `target_seconds` a partir
+da profundidade das filas (amostrando os tipos de tarefa de cada fila) e do tempo de
+serviço médio medido pelos workers vivos.
+
+Ajustes via env:
+  HEARTBEAT_INTERVAL  -> segundos entre heartbeats (padrão 5)
+"""
+import os
+import json
+import math
+import time
+import socket
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import redis
+
+import envelope
+import transport
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_KEY = f"{transport.QUEUE_NAME}:workers"
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "5"))
+HEARTBEAT_TTL = HEARTBEAT_INTERVAL * 3
+# tempo de serviço assumido para tipos de tarefa que nenhum worker vivo executou ainda
+DEFAULT_SERVICE_TIME = 1.0
+
+
+def worker_key(worker_id: str) -> str:
+    return f"{transport.QUEUE_NAME}:worker:{worker_id}"
+
+
+class Heartbeat:
+    """
+    Thread que publica o estado do worker no registro. `snapshot` deve retornar o dict de
+    ThroughputStats.snapshot() (done, failed, current, service).
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        worker_id: str,
+        mode: str,
+        capacity: int,
+        snapshot: Callable[[], Dict[str, Any]],
+        interval: float = HEARTBEAT_INTERVAL,
+    ) -> None:
+        self.client = client
+        self.worker_id = worker_id
+        self.interval = interval
+        self._snapshot = snapshot
+        self._static = {
+            "id": worker_id,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "mode": mode,
+            "capacity": capacity,
+            "started_at": time.time(),
+        }
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_total = 0
+        self._last_at = time.monotonic()
+
+    def start(self) -> "Heartbeat":
+        self._thread = threading.Thread(target=self._run, name="heartbeat", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.publish()
+            except Exception as e:
+                logger.warning("Falha ao publicar heartbeat: %s", e)
+            if self._stop.wait(self.interval):
+                return
+
+    def publish(self) -> None:
+        snap = self._snapshot()
+        now = time.monotonic()
+        total = snap["done"] + snap["failed"]
+        rate = (total - self._last_total) / max(now - self._last_at, 1e-9)
+        self._last_total, self._last_at = total, now
+
+        fields = dict(
+            self._static,
+            current=json.dumps(snap["current"]),
+            tasks_per_sec=round(rate, 3),
+            done=snap["done"],
+            failed=snap["failed"],
+            service=json.dumps(snap["service"]),
+            last_seen=time.time(),
+        )
+        key = worker_key(self.worker_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, math.ceil(HEARTBEAT_TTL))
+        pipe.zadd(REGISTRY_KEY, {self.worker_id: fields["last_seen"]})
+        pipe.execute()
+
+    def stop(self) -> None:
+        """Para a thread e remove o worker do registro."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.delete(worker_key(self.worker_id))
+            pipe.zrem(REGISTRY_KEY, self.worker_id)
+            pipe.execute()
+        except redis.exceptions.RedisError:
+            logger.warning("Não foi possível remover o worker %s do registro.", self.worker_id)
+
+
+def live_workers(client: redis.Redis) -> List[Dict[str, Any]]:
+    """Workers com heartbeat dentro do TTL, já decodificados; remove do registro os expirados."""
+    client.zremrangebyscore(REGISTRY_KEY, "-inf", time.time() - HEARTBEAT_TTL)
+    ids = client.zrange(REGISTRY_KEY, 0, -1)
+    pipe = client.pipeline(transaction=False)
+    for worker_id in ids:
+        pipe.hgetall(worker_key(worker_id))
+    workers = []
+    for fields in pipe.execute() if ids else []:
+        if not fields:
+            continue
+        workers.append({
+            "id": fields["id"],
+            "host": fields.get("host"),
+            "pid": int(fields.get("pid", 0)),
+            "mode": fields.get("mode"),
+            "capacity": int(fields.get("capacity", 1)),
+            "current": json.loads(fields.get("current", "[]")),
+            "tasks_per_sec": float(fields.get("tasks_per_sec", 0)),
+            "done": int(fields.get("done", 0)),
+            "failed": int(fields.get("failed", 0)),
+            "service": json.loads(fields.get("service", "{}")),
+            "last_seen": float(fields.get("last_seen", 0)),
+        })
+    return workers
+
+
+def ready_queues(client: redis.Redis) -> List[str]:
+    """Listas de tarefas prontas (todas as prioridades e tipos), sem as de processamento e a dead-letter."""
+    return sorted(
+        key for key in client.scan_iter(match=f"{transport.QUEUE_NAME}*", count=1000, _type="list")
+        if ":processing:" not in key and key != transport.DEAD_LETTER_KEY
+    )
+
+
+def queue_depths(client: redis.Redis, queues: Iterable[str], sample: int = 100) -> Dict[str, int]:
+    """
+    Backlog estimado por tipo de tarefa: LLEN de cada fila e os tipos das `sample` primeiras
+    tarefas, extrapolados para a fila inteira. Um round trip para todas as filas.
+    """
+    queues = list(queues)
+    pipe = client.pipeline(transaction=False)
+    for queue in queues:
+        pipe.llen(queue)
+        pipe.lrange(queue, 0, sample - 1)
+    replies = pipe.execute() if queues else []
+
+    depths: Dict[str, float] = {}
+    for length, head in zip(replies[::2], replies[1::2]):
+        if not length:
+            continue
+        names: Dict[str, int] = {}
+        for task_json in head:
+            try:
+                name = envelope.decode(task_json).get("task_name") or "?"
+            except envelope.EnvelopeError:
+                name = "?"
+            names[name] = names.get(name, 0) + 1
+        for name, seen in names.items():
+            depths[name] = depths.get(name, 0) + length * seen / len(head)
+    return {name: round(depth) for name, depth in depths.items()}
+
+
+def service_times(workers: Iterable[Dict[str, Any]]) -> Dict[str, float]:
+    """Tempo de serviço médio por tipo de tarefa, ponderado pelas execuções de cada worker vivo."""
+    totals: Dict[str, List[float]] = {}
+    for w in workers:
+        for name, (avg, count) in w["service"].items():
+            acc = totals.setdefault(name, [0.0, 0])
+            acc[0] += avg * count
+            acc[1] += count
+    return {name: total / count for name, (total, count) in totals.items() if count}
+
+
+def recommend_workers(
+    depths: Dict[str, int],
+    service: Dict[str, float],
+    capacity: float,
+    target_seconds: float = 60,
+    min_workers: int = 1,
+    max_workers: Optional[int] = None,
+) -> int:
+    """
+    Workers necessários para processar o backlog em `target_seconds`: soma de
+    profundidade x tempo de serviço de cada tipo, dividida pelo trabalho que um worker
+    com `capacity` tarefas simultâneas faz no prazo.
+    """
+    default = sum(service.values()) / len(service) if service else DEFAULT_SERVICE_TIME
+    work = sum(depth * service.get(name, default) for name, depth in depths.items())
+    needed = math.ceil(work / (max(target_seconds, 1e-9) * max(capacity, 1)))
+    needed = max(min_workers, needed)
+    return min(needed, max_workers) if max_workers is not None else needed
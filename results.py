@@ -0,0 +1,214 @@
+"""
+Backend de resultados das tarefas.
+
+Tarefas enfileiradas com "task_id" (a CLI gera um por tarefa) têm o resultado gravado pelo
+worker no hash `task_result:<id>` com os campos status ("success"/"failure"), task_name,
+result (JSON compacto), error e finished_at, expirando após RESULT_TTL segundos.
+Resultados maiores que RESULT_MAX_BYTES vão para a tabela `task_results` no PostgreSQL;
+o hash guarda só os metadados e spilled=1.
+
+Tarefas com "memoize" (segundos) em AVAILABLE_TASKS passam por memoized_call(): chamadas
+com o mesmo task_name, args e kwargs dentro da janela reaproveitam o resultado guardado em
+`task_memo:<task_name>:<sha256>` em vez de recalcular.
+
+Junto com o hash o worker empurra um token em `task_result:<id>:ready`; wait_for_result()
+bloqueia nessa lista com BLPOP (sem polling) e devolve o token para outros que aguardam.
+
+Ajustes via env:
+  RESULT_TTL        -> segundos que o resultado fica disponível (padrão 86400)
+  RESULT_MAX_BYTES  -> tamanho máximo (bytes) do resultado no Redis (padrão 65536)
+"""
+import os
+import json
+import hashlib
+import time
+import uuid
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import redis
+
+import database as db
+import metrics
+import transport
+
+logger = logging.getLogger(__name__)
+
+RESULT_PREFIX = "task_result"
+MEMO_PREFIX = "task_memo"
+RESULT_TTL = int(os.getenv("RESULT_TTL", "86400"))
+RESULT_MAX_BYTES = int(os.getenv("RESULT_MAX_BYTES", "65536"))
+
+STATUS_SUCCESS = "success"
+STATUS_FAILURE = "failure"
+
+# cliente do cache de memoização, criado sob demanda em cada processo do pool
+_memo_client: Optional[redis.Redis] = None
+
+SPILL_SQL = """
+INSERT INTO task_results (task_id, result, expires_at)
+VALUES (%s, %s, now() + make_interval(secs => %s))
+ON CONFLICT (task_id) DO UPDATE SET result = EXCLUDED.result, expires_at = EXCLUDED.expires_at;
+DELETE FROM task_results WHERE expires_at < now();
+"""
+
+
+def new_task_id(idempotency_key: Optional[str] = None) -> str:
+    """Id aleatório; com chave de idempotência o id é derivado dela, então reenvios apontam para o mesmo resultado."""
+    if idempotency_key:
+        return uuid.uuid5(uuid.NAMESPACE_URL, f"{RESULT_PREFIX}:{idempotency_key}").hex
+    return uuid.uuid4().hex
+
+
+def result_key(task_id: str) -> str:
+    return f"{RESULT_PREFIX}:{task_id}"
+
+
+def ready_key(task_id: str) -> str:
+    return f"{RESULT_PREFIX}:{task_id}:ready"
+
+
+@metrics.timed(metrics.REDIS_RTT.labels("store_result"))
+def store_result(
+    client: redis.Redis,
+    task_id: str,
+    task_name: Optional[str],
+    result: Any = None,
+    error: Optional[BaseException] = None,
+    ttl: int = RESULT_TTL,
+    max_bytes: int = RESULT_MAX_BYTES,
+) -> None:
+    """
+    Grava o resultado (ou a falha, se `error`) e sinaliza quem aguarda, num único round trip
+    ao Redis. Resultados acima de `max_bytes` vão para o PostgreSQL antes; se essa gravação
+    falhar, o hash registra status "failure" com error "spill failed".
+    """
+    fields: Dict[str, Any] = {
+        "status": STATUS_SUCCESS if error is None else STATUS_FAILURE,
+        "task_name": task_name or "",
+        "finished_at": time.time(),
+    }
+    if error is not None:
+        fields["error"] = repr(error)
+    else:
+        encoded = json.dumps(result, separators=(",", ":"), default=str)
+        if len(encoded) > max_bytes:
+            try:
+                db.init_pool()
+                db.execute(SPILL_SQL, (task_id, encoded, ttl))
+                fields["spilled"] = 1
+            except Exception:
+                # grava a falha mesmo assim, para quem aguarda não ficar bloqueado até o timeout
+                logger.exception("Falha ao gravar no PostgreSQL o resultado grande da tarefa %s.", task_id)
+                fields["status"], fields["error"] = STATUS_FAILURE, "spill failed"
+        else:
+            fields["result"] = encoded
+
+    pipe = client.pipeline(transaction=True)
+    pipe.hset(result_key(task_id), mapping=fields)
+    pipe.expire(result_key(task_id), ttl)
+    pipe.rpush(ready_key(task_id), 1)
+    pipe.expire(ready_key(task_id), ttl)
+    pipe.execute()
+
+
+def _decode_record(task_id: str, fields: Dict[str, str]) -> Dict[str, Any]:
+    record: Dict[str, Any] = {
+        "task_id": task_id,
+        "status": fields.get("status"),
+        "task_name": fields.get("task_name") or None,
+        "finished_at": float(fields["finished_at"]) if fields.get("finished_at") else None,
+        "result": json.loads(fields["result"]) if "result" in fields else None,
+    }
+    if "error" in fields:
+        record["error"] = fields["error"]
+    return record
+
+
+@metrics.timed(metrics.REDIS_RTT.labels("get_results"))
+def get_results(client: redis.Redis, task_ids: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Resultados de vários ids com um único round trip ao Redis (HGETALL em pipeline) e, se
+    algum foi para o PostgreSQL, uma única consulta. None para ids sem resultado (pendentes,
+    expirados ou desconhecidos).
+    """
+    ids: List[str] = list(dict.fromkeys(task_ids))
+    pipe = client.pipeline(transaction=False)
+    for task_id in ids:
+        pipe.hgetall(result_key(task_id))
+    replies = pipe.execute() if ids else []
+
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+    spilled: List[str] = []
+    for task_id, fields in zip(ids, replies):
+        if not fields:
+            results[task_id] = None
+            continue
+        results[task_id] = _decode_record(task_id, fields)
+        if fields.get("spilled"):
+            spilled.append(task_id)
+
+    if spilled:
+        db.init_pool()
+        rows = db.fetch_all(
+            "SELECT task_id, result FROM task_results WHERE task_id = ANY(%s) AND expires_at >= now()", (spilled,)
+        )
+        for row in rows:
+            results[row["task_id"]]["result"] = json.loads(row["result"])
+    return results
+
+
+def get_result(client: redis.Redis, task_id: str) -> Optional[Dict[str, Any]]:
+    return get_results(client, [task_id])[task_id]
+
+
+def wait_for_result(client: redis.Redis, task_id: str, timeout: float = 30) -> Optional[Dict[str, Any]]:
+    """
+    Bloqueia até o resultado existir ou `timeout` segundos (0 = sem limite) e o retorna;
+    None se o prazo acabar. Usa BLPOP na lista de sinalização, sem polling.
+    """
+    record = get_result(client, task_id)
+    if record is not None:
+        return record
+    # o token fica na lista até expirar, então não há corrida com o worker
+    if client.blpop([ready_key(task_id)], timeout=timeout) is None:
+        return None
+    # devolve o token para outros clientes aguardando o mesmo id
+    pipe = client.pipeline(transaction=False)
+    pipe.rpush(ready_key(task_id), 1)
+    pipe.expire(ready_key(task_id), RESULT_TTL)
+    pipe.execute()
+    return get_result(client, task_id)
+
+
+def memo_key(task_name: str, args: List[Any], kwargs: Dict[str, Any]) -> str:
+    digest = hashlib.sha256(
+        json.dumps([args, kwargs], sort_keys=True, separators=(",", ":"), default=str).encode()
+    ).hexdigest()
+    return f"{MEMO_PREFIX}:{task_name}:{digest}"
+
+
+def memoized_call(task_name: str, args: List[Any], kwargs: Dict[str, Any], ttl: int, compute: Callable[[], Any]) -> Any:
+    """
+    Retorna o resultado guardado para a mesma chamada nos últimos `ttl` segundos ou executa
+    `compute()` e o guarda. Falhas do Redis não impedem a execução.
+    """
+    global _memo_client
+    if _memo_client is None:
+        _memo_client = transport.redis_client()
+    key = memo_key(task_name, args, kwargs)
+    try:
+        cached = _memo_client.get(key)
+    except redis.exceptions.RedisError as e:
+        logger.warning("Cache de memoização indisponível: %s", e)
+        cached = None
+    if cached is not None:
+        logger.info("♻️ Resultado de '%s' reaproveitado do cache.", task_name)
+        return json.loads(cached)
+
+    result = compute()
+    try:
+        _memo_client.set(key, json.dumps(result, separators=(",", ":"), default=str), ex=ttl)
+    except redis.exceptions.RedisError as e:
+        logger.warning("Não foi possível guardar o resultado de '%s' no cache: %s", task_name, e)
+    return result
@@ -1,24 +1,37 @@
-from ast import main
+import heapq
+import select
 import time
 import json
 import logging
 import os
 import signal
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
 
 import redis
-from croniter import croniter
+import psycopg2
+from psycopg2 import extras
 
+import cron_cache
 import database as db
+import envelope
+import leader
+import metrics
+import transport
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
 
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
-QUEUE_NAME = os.getenv("QUEUE_NAME", "task_queue")
+QUEUE_NAME = transport.QUEUE_NAME
+# espera antes de reavaliar jobs que continuaram vencidos após um disparo (erro ao enfileirar, lock de outra réplica)
 SLEEP_INTERVAL = int(os.getenv("SLEEP_INTERVAL", "10"))
+# espera máxima sem nenhum job agendado nem notificação; rede de segurança contra NOTIFY perdido
+MAX_IDLE_SLEEP = float(os.getenv("SCHEDULER_MAX_IDLE_SLEEP", "300"))
+WAKE_CHECK_INTERVAL = 1.0
+# máximo de jobs reivindicados por transação em cada ciclo de claim-and-advance
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "500"))
 
 running = True
 
@@ -34,79 +47,378 @@ signal.signal(signal.SIGTERM, handle_signal)
 
 
 def make_redis_client() -> redis.Redis:
-    return redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    return transport.redis_client(REDIS_HOST, REDIS_PORT)
 
 
-def get_due_jobs() -> List[Dict[str, Any]]:
+# As consultas do tick rodam como prepared statements (db.execute_prepared), daí os $n.
+
+# SKIP LOCKED faz cada réplica do scheduler pegar um lote disjunto de jobs vencidos;
+# usa o índice parcial idx_jobs_due_active (next_run_at) WHERE is_active. schedule e payload
+# vêm do cache de definições (JobCache); a version só confirma que a entrada está atual
+CLAIM_DUE_JOBS_SQL = """
+  SELECT id, next_run_at, version FROM jobs
+  WHERE is_active AND next_run_at <= $1
+  ORDER BY next_run_at
+  LIMIT $2
+  FOR UPDATE SKIP LOCKED
+"""
+
+# arrays em vez de VALUES: o texto não depende do tamanho do lote e o plano é reaproveitado
+ADVANCE_JOBS_SQL = """
+  UPDATE jobs AS j
+  SET last_run_at = $2, next_run_at = v.next_run_at
+  FROM unnest($1::integer[], $3::timestamp[]) AS v(id, next_run_at)
+  WHERE j.id = v.id
+"""
+
+# jobs que nunca poderão disparar (cron ou payload inválido) saem do claim até serem corrigidos
+DEACTIVATE_JOBS_SQL = """
+  UPDATE jobs SET is_active = false
+  WHERE id = ANY($1::integer[])
+"""
+
+# evita que o trigger de NOTIFY dispare para os avanços feitos pelo próprio scheduler
+SKIP_NOTIFY_SQL = "SET LOCAL scheduler.skip_notify = 'on'"
+
+# definições alteradas desde a última sincronização (índice idx_jobs_version)
+SYNC_JOBS_SQL = """
+  SELECT id, schedule, payload, version, is_active FROM jobs
+  WHERE version > $1
+  ORDER BY version
+"""
+
+LOAD_JOBS_SQL = """
+  SELECT id, schedule, payload, version, is_active FROM jobs
+  WHERE id = ANY($1::integer[])
+"""
+
+
+def claim_and_advance(
+    redis_conn: redis.Redis,
+    limit: int = SCHEDULER_BATCH_SIZE,
+    fencing: Optional[Tuple[str, int]] = None,
+    cache: Optional["JobCache"] = None,
+) -> Tuple[int, List[Tuple[int, datetime, datetime]]]:
     """
-    Busca os jobs cujo next_run_at indica execução agora.
+    Executa um lote do tick em uma única transação: trava até `limit` jobs vencidos,
+    enfileira todos em um pipeline e avança next_run_at com um único UPDATE.
+    Os payloads saem do cache de definições (padrão: job_cache); só jobs ausentes ou com
+    version diferente da cacheada têm a definição lida do banco, na mesma transação.
+    Se o Redis falhar ou o fencing token do líder for superado, os jobs continuam vencidos.
+    Jobs com cron ou payload inválido são desativados (is_active = false) na mesma transação,
+    para não ocuparem o início do claim a cada tick; voltam ao corrigir e reativar o job.
+    Retorna (claimed, linhas): claimed é quantos jobs do lote saíram da lista de vencidos
+    (enfileirados e avançados, ou desativados) e as linhas (id, last_run_at, next_run_at) são
+    as dos jobs enfileirados e avançados. Um lote com claimed == `limit` indica que pode
+    haver mais jobs vencidos; se o enfileiramento falhar, os jobs continuam vencidos e não
+    contam.
     """
+    cache = job_cache if cache is None else cache
     now = datetime.now()
-    query = """
-      SELECT * FROM jobs
-      WHERE next_run_at <= %s
-        AND is_active = TRUE
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            with metrics.timer(metrics.DB_QUERY.labels("claim_due_jobs")):
+                db.execute_prepared(cur, "claim_due_jobs", CLAIM_DUE_JOBS_SQL, (now, limit))
+                jobs = cur.fetchall()
+            if not jobs:
+                conn.commit()
+                return 0, []
+            for _, due_at, _ in jobs:
+                metrics.DUE_JOB_LAG.observe((now - due_at).total_seconds())
+            entries = cache.resolve(conn, jobs)
+            # jobs sem entrada têm payload inválido (o erro já foi registrado ao montar o cache)
+            fireable = [job for job in jobs if job[0] in entries]
+            broken = [job[0] for job in jobs if job[0] not in entries]
+
+            # calcula o próximo disparo antes de enfileirar para não disparar jobs com cron inválido
+            rows: List[tuple] = []
+            fires: List[Tuple[str, envelope.Payload, str, None]] = []
+            next_runs = cron_cache.next_fire_times([entries[job[0]].schedule for job in fireable], now)
+            for (job_id, due_at, _), next_run_at in zip(fireable, next_runs):
+                if next_run_at is None:
+                    logger.error("Job %s com schedule inválido: %r", job_id, entries[job_id].schedule)
+                    broken.append(job_id)
+                    continue
+                rows.append((job_id, now, next_run_at))
+                fires.append(fire_payload(job_id, due_at, entries[job_id], fencing))
+
+            if fires and not enqueue_jobs(redis_conn, fires, fencing):
+                rows = []
+            if rows or broken:
+                cur.execute(SKIP_NOTIFY_SQL)
+            if rows:
+                with metrics.timer(metrics.DB_QUERY.labels("advance_jobs")):
+                    db.execute_prepared(
+                        cur, "advance_jobs", ADVANCE_JOBS_SQL, ([row[0] for row in rows], now, [row[2] for row in rows])
+                    )
+            if broken:
+                logger.error("🚫 Jobs desativados por cron ou payload inválido: %s", broken)
+                with metrics.timer(metrics.DB_QUERY.labels("deactivate_jobs")):
+                    db.execute_prepared(cur, "deactivate_jobs", DEACTIVATE_JOBS_SQL, (broken,))
+        with metrics.timer(metrics.DB_QUERY.labels("commit")):
+            conn.commit()
+
+    logger.info("Lote do scheduler: %s jobs reivindicados, %s enfileirados.", len(jobs), len(rows))
+    return len(rows) + len(broken), rows
+
+
+class WakeupHeap:
     """
-    try:
-        return db.fetch_all(query, (now,))
-    except Exception as e:
-        logger.error("Erro ao buscar jobs: %s", e)
-        return []
+    Min-heap de (next_run_at, job_id) com invalidação preguiçosa: cada job tem um único
+    horário válido em `_due`; entradas antigas são descartadas ao chegar ao topo.
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[datetime, int]] = []
+        self._due: Dict[int, datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def set(self, job_id: int, next_run_at: Optional[datetime]) -> None:
+        """Registra o próximo disparo do job; None remove o job."""
+        if next_run_at is None:
+            self._due.pop(job_id, None)
+            return
+        if self._due.get(job_id) == next_run_at:
+            return
+        self._due[job_id] = next_run_at
+        heapq.heappush(self._heap, (next_run_at, job_id))
+
+    def next_time(self) -> Optional[datetime]:
+        while self._heap:
+            when, job_id = self._heap[0]
+            if self._due.get(job_id) == when:
+                return when
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now: datetime) -> List[int]:
+        """Remove e retorna os ids com disparo em `now` ou antes."""
+        due: List[int] = []
+        while self._heap and self._heap[0][0] <= now:
+            when, job_id = heapq.heappop(self._heap)
+            if self._due.get(job_id) == when:
+                del self._due[job_id]
+                due.append(job_id)
+        return due
+
+    def clear(self) -> None:
+        self._heap = []
+        self._due = {}
+
+
+class CachedJob(NamedTuple):
+    version: int
+    schedule: str
+    queue: str
+    template: envelope.Template
+
+
+class JobCache:
+    """
+    Definições dos jobs ativos já normalizadas e serializadas (envelope.Template), por id,
+    com a version da linha. sync() busca só as linhas com version maior que a última vista.
+    Como uma alteração pode ser commitada depois de outra com version maior, o claim confere
+    a version de cada job vencido e recarrega as entradas divergentes (resolve()).
+    Usado só pela thread do loop do scheduler.
+    """
+
+    def __init__(self) -> None:
+        self._jobs: Dict[int, CachedJob] = {}
+        self.last_version = 0
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def _put(self, row: Dict[str, Any]) -> None:
+        if not row["is_active"]:
+            self._jobs.pop(row["id"], None)
+            return
+        try:
+            task_payload = build_task_payload(row)
+            # campos de cada disparo, acrescentados por fire_payload()
+            task_payload.pop("idempotency_key", None)
+            task_payload.pop("fencing_token", None)
+            self._jobs[row["id"]] = CachedJob(
+                row["version"], row["schedule"], job_queue(row, task_payload), envelope.Template(task_payload)
+            )
+        except Exception as e:
+            logger.error("Erro ao montar payload do job %s: %s", row["id"], e)
+            self._jobs.pop(row["id"], None)
+
+    def get(self, job_id: int, version: int) -> Optional[CachedJob]:
+        entry = self._jobs.get(job_id)
+        return entry if entry is not None and entry.version == version else None
+
+    def discard(self, job_id: int) -> None:
+        self._jobs.pop(job_id, None)
+
+    def clear(self) -> None:
+        self._jobs = {}
+        self.last_version = 0
+
+    def sync(self) -> int:
+        """Aplica as definições alteradas desde a última sincronização. Retorna quantas linhas leu."""
+        rows = db.fetch_prepared("sync_job_cache", SYNC_JOBS_SQL, (self.last_version,))
+        for row in rows:
+            self._put(row)
+            self.last_version = max(self.last_version, row["version"])
+        if rows:
+            logger.info("Cache de jobs: %s definições sincronizadas (%s em cache, version %s).",
+                        len(rows), len(self._jobs), self.last_version)
+        return len(rows)
+
+    def resolve(self, conn, jobs: List[Tuple[int, datetime, int]]) -> Dict[int, CachedJob]:
+        """
+        Entradas dos jobs reivindicados (id, next_run_at, version). As ausentes ou desatualizadas
+        são lidas na transação do claim (`conn`); jobs com payload inválido ficam de fora.
+        """
+        stale = [job_id for job_id, _, version in jobs if self.get(job_id, version) is None]
+        if stale:
+            with metrics.timer(metrics.DB_QUERY.labels("load_job_definitions")), \
+                    conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+                db.execute_prepared(cur, "load_job_definitions", LOAD_JOBS_SQL, (stale,))
+                for row in cur.fetchall():
+                    self._put(row)
+        entries: Dict[int, CachedJob] = {}
+        for job_id, _, version in jobs:
+            entry = self.get(job_id, version)
+            if entry is not None:
+                entries[job_id] = entry
+        return entries
+
+
+job_cache = JobCache()
 
 
-def enqueue_job(redis_conn: redis.Redis, job: Dict[str, Any]) -> bool:
-    """Enfileira um job no Redis. Retorna True se OK."""
+def load_wakeups(heap: WakeupHeap) -> None:
+    """Carrega no heap o próximo disparo de todos os jobs ativos."""
+    heap.clear()
+    for job_id, next_run_at in db.fetch_all("SELECT id, next_run_at FROM jobs WHERE is_active", as_dict=False):
+        heap.set(job_id, next_run_at)
+    logger.info("%s jobs ativos carregados no heap de disparos.", len(heap))
+
+
+def refresh_wakeups(heap: WakeupHeap, job_ids: List[int], now: datetime) -> None:
+    """
+    Relê do banco jobs que venceram mas não foram avançados por este scheduler
+    (outra réplica os pegou, foram desativados ou houve erro ao enfileirar).
+    Os que continuam vencidos são reavaliados após SLEEP_INTERVAL.
+    """
+    rows = db.fetch_all("SELECT id, next_run_at FROM jobs WHERE is_active AND id = ANY(%s)", (job_ids,), as_dict=False)
+    retry_at = now + timedelta(seconds=SLEEP_INTERVAL)
+    for job_id, next_run_at in rows:
+        heap.set(job_id, retry_at if next_run_at <= now else next_run_at)
+
+
+def apply_notification(heap: WakeupHeap, payload: str) -> None:
+    """Aplica um NOTIFY do trigger jobs_changed_notify ("id,next_run_at,is_active") ao heap."""
     try:
-        task_payload = job.get("payload") or {}
-        # normaliza kwargs: se for string, tenta desserializar; se ausente, usa {}
-        kwargs = task_payload.get("kwargs", {}) 
-        if isinstance(kwargs, str):
-            try:
-                kwargs = json.loads(kwargs)
-            except json.JSONDecodeError:
-                logger.warning("Job %s: kwargs em string inválido JSON, usando {}.", job.get("id"))
-                kwargs = {}
-        if not isinstance(kwargs, dict):
-            logger.warning("Job %s: kwargs não é um objeto, convertendo para {}.", job.get("id"))
+        job_id, next_run_at, is_active = payload.split(",")
+        if is_active in ("true", "t") and next_run_at:
+            heap.set(int(job_id), datetime.fromisoformat(next_run_at))
+        else:
+            heap.set(int(job_id), None)
+            job_cache.discard(int(job_id))
+    except ValueError:
+        logger.warning("Notificação de job inválida: %r", payload)
+
+
+def wait_for_changes(listener, heap: WakeupHeap, timeout: float) -> None:
+    """Dorme até `timeout` segundos ou até chegar um NOTIFY, aplicando as notificações recebidas."""
+    if select.select([listener], [], [], max(0.0, timeout)) == ([], [], []):
+        return
+    listener.poll()
+    while listener.notifies:
+        apply_notification(heap, listener.notifies.pop(0).payload)
+
+
+def build_task_payload(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Monta o payload da tarefa a partir do job, normalizando kwargs e args."""
+    task_payload = job.get("payload") or {}
+    # normaliza kwargs: se for string, tenta desserializar; se ausente, usa {}
+    kwargs = task_payload.get("kwargs", {}) 
+    if isinstance(kwargs, str):
+        try:
+            kwargs = json.loads(kwargs)
+        except json.JSONDecodeError:
+            logger.warning("Job %s: kwargs em string inválido JSON, usando {}.", job.get("id"))
             kwargs = {}
+    if not isinstance(kwargs, dict):
+        logger.warning("Job %s: kwargs não é um objeto, convertendo para {}.", job.get("id"))
+        kwargs = {}
 
-        task_payload["kwargs"] = kwargs
-        # garante que args existe como lista
-        task_payload.setdefault("args", [])
+    task_payload["kwargs"] = kwargs
+    # garante que args existe como lista
+    task_payload.setdefault("args", [])
+    return task_payload
 
-        redis_conn.rpush(QUEUE_NAME, json.dumps(task_payload))
-        logger.info("Job %s enfileirado com payload: %s", job.get("id"), task_payload)
-        return True
-    except Exception as e:
-        logger.error("Erro ao enfileirar job %s: %s", job.get("id"), e)
-        return False
+
+def job_queue(job: Dict[str, Any], task_payload: Dict[str, Any]) -> str:
+    """Fila de destino do job, pela "priority" opcional do payload e pelo task_name."""
+    priority = task_payload.get("priority", transport.DEFAULT_PRIORITY)
+    try:
+        return transport.queue_name(priority, task_payload.get("task_name"))
+    except ValueError:
+        logger.warning("Job %s: prioridade %r inválida, usando '%s'.", job.get("id"), priority, transport.DEFAULT_PRIORITY)
+        return transport.queue_name(transport.DEFAULT_PRIORITY, task_payload.get("task_name"))
 
 
-def update_job_schedule(job: Dict[str, Any]) -> None:
+def fire_key(job_id: Any, next_run_at: Any) -> str:
     """
-    Atualiza last_run_at e next_run_at do job.
+    Chave de idempotência de um disparo: o mesmo job no mesmo next_run_at gera a mesma chave,
+    então um disparo repetido (ex.: o UPDATE falhou após o enqueue) não é enfileirado de novo.
+    """
+    fire = next_run_at.isoformat() if isinstance(next_run_at, datetime) else str(next_run_at)
+    return f"job:{job_id}:{fire}"
+
+
+def fire_payload(
+    job_id: int, next_run_at: datetime, entry: CachedJob, fencing: Optional[Tuple[str, int]] = None
+) -> Tuple[str, envelope.Payload, str, None]:
+    """Item de enqueue_unique de um disparo: o payload cacheado com a chave de idempotência e o fencing token."""
+    key = fire_key(job_id, next_run_at)
+    extra: Dict[str, Any] = {"idempotency_key": key}
+    if fencing:
+        extra["fencing_token"] = fencing[1]
+    return entry.queue, entry.template.encode(extra), key, None
+
+
+def enqueue_jobs(
+    redis_conn: redis.Redis,
+    fires: List[Tuple[str, envelope.Payload, str, None]],
+    fencing: Optional[Tuple[str, int]] = None,
+) -> bool:
+    """
+    Enfileira os disparos (ver fire_payload) em um único round trip, deduplicando cada um
+    pela chave de idempotência. Retorna True se o lote foi aceito (inclusive disparos que já
+    estavam na fila); em erro de Redis nenhum é considerado enfileirado. Com `fencing` (ver
+    leader.py) o lote é recusado com FencedError se outra réplica assumiu.
     """
-    now = datetime.now()
     try:
-        base = job.get("last_run_at") or now
-        cron = croniter(job["cron_schedule"], base)
-        next_run = cron.get_next(datetime)
-        query = """
-          UPDATE jobs
-          SET last_run_at = %s, next_run_at = %s
-          WHERE id = %s
-        """
-        db.execute(query, (now, next_run, job["id"]))
-        logger.info("Job %s atualizado: last_run_at=%s next_run_at=%s", job["id"], now, next_run)
+        added = transport.enqueue_unique(redis_conn, fires, fencing=fencing)
+    except (redis.exceptions.ConnectionError, transport.FencedError):
+        raise
     except Exception as e:
-        logger.error("Erro ao atualizar schedule do job %s: %s", job.get("id"), e)
+        logger.error("Erro ao enfileirar lote de %s jobs: %s", len(fires), e)
+        return False
+    duplicates = added.count(False)
+    logger.info("%s jobs enfileirados (%s disparos duplicados ignorados).", len(fires) - duplicates, duplicates)
+    return True
 
 
 def main_loop():
-    logger.info("🚀 Scheduler iniciado. Verificando jobs a cada %s segundos.", SLEEP_INTERVAL)
+    logger.info("🚀 Scheduler iniciado. Disparos guiados por heap + LISTEN %s.", db.JOBS_CHANNEL)
 
     # tenta criar cliente Redis com backoff simples
     redis_client = None
+    listener = None
+    election: Optional[leader.LeaderElection] = None
+    leading: Optional[bool] = None
+    next_election = time.monotonic()
+    heap = WakeupHeap()
+    next_sweep = time.monotonic()
     backoff = 1.0
     max_backoff = 30.0
 
@@ -118,37 +430,114 @@ def main_loop():
                 redis_client.ping()
                 backoff = 1.0
                 logger.info("Conectado ao Redis em %s:%s", REDIS_HOST, REDIS_PORT)
+                if election is None:
+                    election = leader.LeaderElection(redis_client)
+                else:
+                    election.set_client(redis_client)
             except Exception as e:
                 logger.warning("Falha ao conectar Redis: %s. Retry em ~%s s", e, backoff)
                 time.sleep(backoff)
                 backoff = min(max_backoff, backoff * 2)
                 continue
 
+        if listener is None:
+            try:
+                # LISTEN antes da carga: nenhuma alteração feita entre os dois passos se perde
+                listener = db.connect_listener(db.JOBS_CHANNEL)
+                load_wakeups(heap)
+                # exclusões feitas sem LISTEN ativo não chegaram: recarrega as definições
+                job_cache.clear()
+                job_cache.sync()
+                next_sweep = time.monotonic()
+                backoff = 1.0
+            except Exception as e:
+                logger.warning("Falha ao escutar %s: %s. Retry em ~%s s", db.JOBS_CHANNEL, e, backoff)
+                listener = None
+                time.sleep(backoff)
+                backoff = min(max_backoff, backoff * 2)
+                continue
+
         try:
-            due_jobs = get_due_jobs()
-            for job in due_jobs:
-                if not running:
-                    break
-                try:
-                    ok = enqueue_job(redis_client, job)
-                    if ok:
-                        update_job_schedule(job)
-                except Exception:
-                    logger.exception("Erro ao processar job %s", job.get("id"))
-            time.sleep(SLEEP_INTERVAL)
+            if time.monotonic() >= next_election:
+                was_leading = election.is_leader()
+                if election.step() and not was_leading:
+                    # os avanços do líder anterior não geram NOTIFY: recarrega o heap e varre os vencidos
+                    load_wakeups(heap)
+                    next_sweep = time.monotonic()
+                next_election = time.monotonic() + election.renew_interval
+            if leading is not False and not election.is_leader():
+                logger.info("⏸️ Scheduler em standby; líder atual: %s", leader.current_leader(redis_client))
+            leading = election.is_leader()
+
+            if not leading:
+                # standby: só acompanha as notificações até poder assumir
+                wait_for_changes(listener, heap, min(WAKE_CHECK_INTERVAL, next_election - time.monotonic()))
+                continue
+
+            now = datetime.now()
+            due_ids = heap.pop_due(now)
+            sweep = time.monotonic() >= next_sweep
+
+            if due_ids or sweep:
+                # o banco é a fonte da verdade: o claim também pega jobs vencidos fora do heap
+                advanced: Dict[int, datetime] = {}
+                with metrics.timer(metrics.TICK_DURATION):
+                    job_cache.sync()
+                    while running and election.is_leader():
+                        claimed, rows = claim_and_advance(redis_client, SCHEDULER_BATCH_SIZE, election.fencing)
+                        for job_id, _, next_run_at in rows:
+                            advanced[job_id] = next_run_at
+                        # lote incompleto: não há mais jobs vencidos agora
+                        if claimed < SCHEDULER_BATCH_SIZE:
+                            break
+                        # renova o lease entre os lotes para um claim longo não deixar a liderança vencer
+                        if election.is_leader() and time.monotonic() >= next_election:
+                            election.step()
+                            next_election = time.monotonic() + election.renew_interval
+                for job_id, next_run_at in advanced.items():
+                    heap.set(job_id, next_run_at)
+                leftovers = [job_id for job_id in due_ids if job_id not in advanced]
+                if leftovers:
+                    refresh_wakeups(heap, leftovers, now)
+                next_sweep = time.monotonic() + MAX_IDLE_SLEEP
+
+            # a espera é limitada a WAKE_CHECK_INTERVAL só para reagir a sinais; sem jobs
+            # vencidos nem notificações nenhuma query é feita
+            timeout = min(WAKE_CHECK_INTERVAL, next_sweep - time.monotonic(), next_election - time.monotonic())
+            next_time = heap.next_time()
+            if next_time is not None:
+                timeout = min(timeout, (next_time - datetime.now()).total_seconds())
+            wait_for_changes(listener, heap, timeout)
+        except transport.FencedError as e:
+            election.demote(str(e))
         except redis.exceptions.ConnectionError:
             logger.warning("Perda de conexão com Redis. Forçando reconectar...")
             redis_client = None
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            logger.warning("Perda da conexão LISTEN com o PostgreSQL. Recarregando jobs...")
+            try:
+                listener.close()
+            except Exception:
+                pass
+            listener = None
         except Exception:
             logger.exception("Erro inesperado no loop do scheduler. Aguardando antes de continuar...")
             time.sleep(1)
 
+    if listener is not None:
+        try:
+            listener.close()
+        except Exception:
+            pass
+    if election is not None:
+        election.release()
     logger.info("Scheduler finalizando.")
 
 
 if __name__ == "__main__":
     try:
         db.init_pool()
+        metrics.start_server()
         main_loop()
     except Exception:
         logger.exception("Scheduler encerrado por erro")
@@ -1,7 +1,12 @@
 import time
+import json
+import zlib
 import random
+import asyncio
 import logging
-from typing import Callable, Dict, Any, Optional, Tuple
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 if not logger.handlers:
@@ -9,6 +14,7 @@ if not logger.handlers:
 
 DelayRange = Tuple[float, float]
 ProgressCallback = Callable[[int,int], None]
+CheckpointCallback = Callable[[Dict[str, Any]], None]
 
 def _validate_str(name: str, value: str) -> None:
     if not isinstance(value, str) or not value.strip():
@@ -43,57 +49,184 @@ def send_email(email:str, message:str, delay_range: DelayRange =(0.5, 2.0), verb
     
     return {"status": "success", "recipient": email, "delay": round(delay, 3)}
 
+async def send_email_async(email: str, message: str, delay_range: DelayRange = (0.5, 2.0), verbose: bool = False) -> Dict[str, Any]:
+    """
+    Versão assíncrona de send_email: a espera simulada não bloqueia o event loop,
+    então um único worker asyncio executa milhares em paralelo.
+    """
+    _validate_str("email", email)
+    _validate_str("message", message)
+
+    if delay_range[0] < 0 or delay_range[1] < delay_range[0]:
+        raise ValueError("delay_range inválido.")
+
+    if verbose:
+        logger.info("Preparando para enviar email para %s", email)
+
+    delay = random.uniform(delay_range[0], delay_range[1])
+    await asyncio.sleep(delay)
+
+    if verbose:
+        logger.info("Email enviado para %s", email)
+
+    return {"status": "success", "recipient": email, "delay": round(delay, 3)}
+
+class TaskInterrupted(Exception):
+    """A tarefa parou entre dois blocos a pedido do worker; o checkpoint permite retomá-la."""
+
+
+def _report_seed(report_type: str, filters: Dict[str, Any]) -> int:
+    """Semente estável por relatório: a retomada recalcula exatamente os mesmos blocos."""
+    return zlib.crc32(json.dumps([report_type, filters], sort_keys=True, default=str).encode())
+
+
 def generate_report(
   report_type: str,
   filters: Dict[str, Any],
   total_iterations: int = 200_000,
   progress_callback: Optional[ProgressCallback] = None,
-  verbose: bool = False
+  verbose: bool = False,
+  chunk_size: int = 20_000,
+  groups: int = 12,
+  checkpoint: Optional[Dict[str, Any]] = None,
+  checkpoint_callback: Optional[CheckpointCallback] = None,
+  should_stop: Optional[Callable[[], bool]] = None,
 ) -> Dict[str, Any]:
     """
-    Simula a geração de um relatório pesado.
+    Simula a geração de um relatório pesado, processando os dados em blocos vetorizados com NumPy.
 
     - report_type: identificador do relatório
     - filters: dicionário de filtros
-    - total_iterations: controla a "carga" da simulação (tornar menor para desenvolvimento)
-    - progress_callback: função opcional chamada como progress_callback(current, total)
+    - total_iterations: quantidade de linhas simuladas (tornar menor para desenvolvimento)
+    - progress_callback: função opcional chamada como progress_callback(current, total) a cada bloco
     - verbose: se True, registra progresso via logger.info
+    - chunk_size: linhas por bloco
+    - groups: quantidade de grupos (linhas do relatório) na agregação
+    - checkpoint: estado salvo de uma execução interrompida; a geração continua do próximo bloco
+    - checkpoint_callback: recebe o estado (dict serializável em JSON) após cada bloco
+    - should_stop: consultada entre blocos; se retornar True levanta TaskInterrupted
 
-    Retorna um dict com metadados do relatório.
+    Retorna um dict com metadados e agregados do relatório.
     """
     _validate_str("report_type", report_type)
     if not isinstance(filters, dict):
         raise ValueError("filters deve ser um dicionário.")
     if total_iterations <= 0:
         raise ValueError("total_iterations deve ser um inteiro positivo.")
-    
-    checkpoint = max(1, total_iterations // 4)
+    if chunk_size <= 0 or groups <= 0:
+        raise ValueError("chunk_size e groups devem ser inteiros positivos.")
+
+    seed = _report_seed(report_type, filters)
+    chunks = -(-total_iterations // chunk_size)
+    # o checkpoint só vale para a mesma divisão em blocos
+    params = {"seed": seed, "total_iterations": total_iterations, "chunk_size": chunk_size, "groups": groups}
+    if checkpoint and checkpoint.get("params") == params:
+        state = checkpoint
+        logger.info("⏯️ Relatório %s retomado do bloco %s/%s.", report_type, state["next_chunk"], chunks)
+    else:
+        state = {
+            "params": params,
+            "next_chunk": 0,
+            "count": 0,
+            "sum": 0.0,
+            "sumsq": 0.0,
+            "min": None,
+            "max": None,
+            "group_sums": [0.0] * groups,
+            "group_counts": [0] * groups,
+            "work_time": random.uniform(2, 4),
+        }
+    resumed_from = state["next_chunk"]
+    group_sums = np.asarray(state["group_sums"], dtype=np.float64)
+    group_counts = np.asarray(state["group_counts"], dtype=np.int64)
     last_logged = -1
-    
-    for i in range(total_iterations):
-        if i % checkpoint == 0:
-            pct = int((i / total_iterations) * 100)
-            if progress_callback:
-                try:
-                    progress_callback(i, total_iterations)
-                except Exception:
-                    logger.exception("progress_callback falhou")
-            elif verbose and pct != last_logged:
-                logger.info("Progresso do relatório: %s%%", pct)
-                last_logged = pct
-    work_time = random.uniform(2,4)
-    time.sleep(work_time)
-    
+
+    for index in range(state["next_chunk"], chunks):
+        if should_stop is not None and should_stop():
+            raise TaskInterrupted(f"Relatório {report_type} interrompido no bloco {index}/{chunks}.")
+
+        start = index * chunk_size
+        size = min(chunk_size, total_iterations - start)
+        rng = np.random.default_rng([seed, index])
+        amounts = rng.lognormal(mean=3.0, sigma=0.75, size=size)
+        keys = rng.integers(0, groups, size=size)
+        group_sums += np.bincount(keys, weights=amounts, minlength=groups)
+        group_counts += np.bincount(keys, minlength=groups)
+
+        chunk_min, chunk_max = float(amounts.min()), float(amounts.max())
+        state["count"] += size
+        state["sum"] += float(amounts.sum())
+        state["sumsq"] += float(np.dot(amounts, amounts))
+        state["min"] = chunk_min if state["min"] is None else min(state["min"], chunk_min)
+        state["max"] = chunk_max if state["max"] is None else max(state["max"], chunk_max)
+        state["group_sums"] = group_sums.tolist()
+        state["group_counts"] = group_counts.tolist()
+        state["next_chunk"] = index + 1
+        # latência simulada (consultas, I/O), distribuída entre os blocos
+        time.sleep(state["work_time"] / chunks)
+
+        if checkpoint_callback:
+            try:
+                checkpoint_callback(state)
+            except Exception:
+                logger.exception("checkpoint_callback falhou")
+        current = start + size
+        pct = int((current / total_iterations) * 100)
+        if progress_callback:
+            try:
+                progress_callback(current, total_iterations)
+            except Exception:
+                logger.exception("progress_callback falhou")
+        elif verbose and pct != last_logged:
+            logger.info("Progresso do relatório: %s%%", pct)
+            last_logged = pct
+
     if verbose:
         logger.info("Relatório %s gerado com sucesso", report_type)
-    
+
+    count = state["count"]
+    mean = state["sum"] / count
     return {
         "status": "success",
         "report_type": report_type,
-        "rows": random.randint(100, 1000),
+        "rows": count,
+        "groups_with_data": int(np.count_nonzero(group_counts)),
         "iterations": total_iterations,
-        "work_time": round(work_time, 3),
+        "total": round(state["sum"], 2),
+        "mean": round(mean, 4),
+        "std": round(max(0.0, state["sumsq"] / count - mean * mean) ** 0.5, 4),
+        "min": round(state["min"], 4),
+        "max": round(state["max"], 4),
+        "groups": [round(v, 2) for v in group_sums.tolist()],
+        "chunks": chunks,
+        "resumed_from_chunk": resumed_from,
+        "work_time": round(state["work_time"], 3),
+    }
+
+
+def merge_reports(reports: List[Dict[str, Any]], verbose: bool = False) -> Dict[str, Any]:
+    """
+    Consolida relatórios de generate_report (ex.: callback de um chord sobre um group de relatórios).
+
+    - reports: lista de resultados de generate_report, na ordem dos membros do grupo
+    - verbose: se True, registra o resumo via logger.info
+
+    Retorna um dict com os totais combinados e os totais por relatório.
+    """
+    if not isinstance(reports, list) or not reports:
+        raise ValueError("reports deve ser uma lista não vazia.")
+    if not all(isinstance(report, dict) and "total" in report for report in reports):
+        raise ValueError("reports deve conter resultados de generate_report.")
+
+    total = sum(report["total"] for report in reports)
+    iterations = sum(report.get("iterations", 0) for report in reports)
+    if verbose:
+        logger.info("Consolidados %s relatórios: total %.2f", len(reports), total)
+    return {
+        "status": "success",
+        "reports": len(reports),
+        "iterations": iterations,
+        "total": round(total, 2),
+        "mean": round(total / iterations, 4) if iterations else None,
+        "totals": [report["total"] for report in reports],
     }
-    
-  
-  
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""
+Limites de taxa e de concorrência por tipo de tarefa, compartilhados por todos os workers.
+
+Configurados em AVAILABLE_TASKS:
+  "rate_limit"       -> tarefas por segundo no cluster (token bucket)
+  "rate_burst"       -> capacidade do bucket (padrão: max(1, rate_limit))
+  "max_concurrency"  -> execuções simultâneas no cluster (semáforo)
+
+Um único script Lua verifica o semáforo (zset `task_queue:limit:<task>:running`, membro =
+token da execução, score = fim da concessão) e o bucket (hash `task_queue:limit:<task>:bucket`)
+e só então consome o token e ocupa a vaga, usando o relógio do Redis. Concessões de workers
+que morreram expiram após TASK_CONCURRENCY_LEASE segundos.
+
+Quando o limite é atingido, acquire() levanta Throttled com o tempo sugerido de espera; o
+worker devolve a tarefa ao zset de atrasadas sem contar tentativa, liberando a vaga para
+outros tipos de tarefa.
+
+Ajustes via env:
+  TASK_CONCURRENCY_LEASE  -> duração máxima (s) de uma vaga do semáforo (padrão 900)
+  THROTTLE_RETRY          -> espera (s) sugerida quando o semáforo está cheio (padrão 1)
+"""
+import os
+import uuid
+import random
+import logging
+from typing import Any, Dict, Optional
+
+import redis
+
+import metrics
+import transport
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY_LEASE = float(os.getenv("TASK_CONCURRENCY_LEASE", "900"))
+THROTTLE_RETRY = float(os.getenv("THROTTLE_RETRY", "1"))
+
+# KEYS[1] = bucket (hash tokens/ts), KEYS[2] = semáforo (zset token -> fim da concessão)
+# ARGV = rate, burst, max_concurrency, token, lease, retry quando o semáforo está cheio
+# Retorna {1} se liberado ou {0, espera sugerida em segundos (string)}.
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate, burst, max_conc = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+
+if max_conc > 0 then
+  redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+  if redis.call('ZCARD', KEYS[2]) >= max_conc then
+    return {0, ARGV[6]}
+  end
+end
+
+if rate > 0 then
+  local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+  local tokens = tonumber(b[1]) or burst
+  local ts = tonumber(b[2]) or now
+  tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+  if tokens < 1 then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    return {0, tostring((1 - tokens) / rate)}
+  end
+  redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+  redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+end
+
+if max_conc > 0 then
+  redis.call('ZADD', KEYS[2], now + tonumber(ARGV[5]), ARGV[4])
+  redis.call('EXPIRE', KEYS[2], math.ceil(tonumber(ARGV[5])) + 60)
+end
+return {1}
+"""
+
+
+class Throttled(Exception):
+    """A tarefa excedeu o limite do seu tipo; deve voltar à fila após `retry_after` segundos."""
+
+    def __init__(self, task_name: str, retry_after: float) -> None:
+        super().__init__(f"Tarefa '{task_name}' limitada; nova tentativa em {retry_after:.2f}s")
+        self.task_name = task_name
+        self.retry_after = retry_after
+
+    def __reduce__(self):
+        # volta do process pool com os mesmos argumentos do construtor
+        return Throttled, (self.task_name, self.retry_after)
+
+
+def limit_key(task_name: str, kind: str) -> str:
+    return f"{transport.QUEUE_NAME}:limit:{task_name}:{kind}"
+
+
+def has_limits(spec: Dict[str, Any]) -> bool:
+    return bool(spec.get("rate_limit") or spec.get("max_concurrency"))
+
+
+def limits(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Só as chaves de limite do spec (serializável para o process pool); {} se não houver limites."""
+    if not has_limits(spec):
+        return {}
+    return {k: spec[k] for k in ("rate_limit", "rate_burst", "max_concurrency") if spec.get(k)}
+
+
+class Limiter:
+    """Aplica os limites de AVAILABLE_TASKS. Tarefas sem limites não fazem nenhuma chamada ao Redis."""
+
+    def __init__(self, client: redis.Redis, lease: float = CONCURRENCY_LEASE, retry: float = THROTTLE_RETRY) -> None:
+        self.client = client
+        self.lease = lease
+        self.retry = retry
+        self._script = client.register_script(_ACQUIRE_SCRIPT)
+
+    def set_client(self, client: redis.Redis) -> None:
+        self.client = client
+        self._script = client.register_script(_ACQUIRE_SCRIPT)
+
+    @metrics.timed(metrics.REDIS_RTT.labels("throttle_acquire"))
+    def acquire(self, task_name: str, spec: Dict[str, Any]) -> Optional[str]:
+        """
+        Reserva a execução. Retorna o token a passar para release() (None se a tarefa não
+        ocupa vaga no semáforo) ou levanta Throttled.
+        """
+        if not has_limits(spec):
+            return None
+        rate = float(spec.get("rate_limit") or 0)
+        burst = float(spec.get("rate_burst") or max(1.0, rate))
+        max_conc = int(spec.get("max_concurrency") or 0)
+        token = uuid.uuid4().hex
+        res = self._script(
+            keys=[limit_key(task_name, "bucket"), limit_key(task_name, "running")],
+            args=[rate, burst, max_conc, token, self.lease, self.retry],
+        )
+        if not res[0]:
+            # jitter para as tarefas adiadas não voltarem todas no mesmo instante
+            wait = float(res[1])
+            raise Throttled(task_name, wait + random.uniform(0, max(wait, self.retry / 2)))
+        return token if max_conc > 0 else None
+
+    def release(self, task_name: str, token: Optional[str]) -> None:
+        """Libera a vaga do semáforo; falhas só atrasam a liberação até a concessão expirar."""
+        if token is None:
+            return
+        try:
+            self.client.zrem(limit_key(task_name, "running"), token)
+        except redis.exceptions.RedisError as e:
+            logger.warning("Não foi possível liberar a vaga de '%s': %s", task_name, e)
@@ -0,0 +1,696 @@
+"""
+Camada de transporte da fila de tarefas no Redis, compartilhada por worker, scheduler e CLI.
+
+Agrupa operações para reduzir round trips:
+  - consumidor: pop_batch retira até N tarefas por chamada (BLMPOP no Redis 7+,
+    BLPOP + LPOP com count em versões anteriores);
+  - produtor: push_tasks / push_many / BatchProducer enviam RPUSH com vários itens em pipeline.
+
+As variantes *_async (pop_batch_async, promote_due_async) fazem o mesmo com um cliente
+redis.asyncio (async_redis_client) para o worker asyncio.
+
+Filas: cada prioridade tem sua lista (`task_queue` para "default", `task_queue:<prioridade>`
+para as demais) e, com QUEUE_ROUTE_BY_TASK, cada tipo de tarefa ganha uma sublista
+(`task_queue[:<prioridade>]:<task_name>`). Use queue_name() para montar o nome.
+
+Tarefas com "idempotency_key" são enviadas por enqueue_unique(), que registra a chave com
+SET NX EX e enfileira no mesmo script Lua: a mesma chave dentro de IDEMPOTENCY_TTL segundos
+não é enfileirada de novo. Com `fencing` (ver leader.py) o script também recusa lotes de um
+líder do scheduler cujo fencing token já foi superado.
+
+Tarefas atrasadas ficam no zset `task_queue:delayed` (score = horário de execução em epoch)
+até promote_due() movê-las para a fila de destino; tarefas que esgotaram as tentativas vão
+para a lista `task_queue:dead`.
+
+Ajustes via env:
+  QUEUE_BATCH_SIZE     -> máximo de tarefas por pop/push (padrão 50)
+  QUEUE_ROUTE_BY_TASK  -> "true" para separar as filas por tipo de tarefa
+  IDEMPOTENCY_TTL      -> segundos em que uma chave de idempotência bloqueia duplicatas (padrão 86400)
+"""
+import os
+import time
+import random
+import threading
+import logging
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+import redis
+import redis.asyncio
+
+import envelope
+import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUE_NAME = os.getenv("QUEUE_NAME", "task_queue")
+BATCH_SIZE = int(os.getenv("QUEUE_BATCH_SIZE", "50"))
+ROUTE_BY_TASK = os.getenv("QUEUE_ROUTE_BY_TASK", "false").lower() in ("1", "true", "yes")
+
+DELAYED_KEY = f"{QUEUE_NAME}:delayed"
+DEAD_LETTER_KEY = f"{QUEUE_NAME}:dead"
+DEAD_LETTER_MAX = int(os.getenv("DEAD_LETTER_MAX", "10000"))
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+
+# prioridades em ordem decrescente; o valor é o peso no round-robin ponderado
+PRIORITIES: Dict[str, int] = {"high": 6, "default": 3, "low": 1}
+DEFAULT_PRIORITY = "default"
+
+# None = ainda não testado; detectado na primeira chamada de pop_batch
+_blmpop_supported: Optional[bool] = None
+
+
+def redis_client(host: Optional[str] = None, port: Optional[int] = None) -> redis.Redis:
+    """
+    Cliente Redis para a fila (REDIS_HOST/REDIS_PORT por padrão). Respostas vêm como str;
+    surrogateescape mantém intactos os bytes do envelope binário (ver envelope.py).
+    """
+    return redis.Redis(
+        host=host or os.getenv("REDIS_HOST", "redis"),
+        port=port or int(os.getenv("REDIS_PORT", "6379")),
+        decode_responses=True,
+        encoding_errors="surrogateescape",
+    )
+
+
+def async_redis_client(host: Optional[str] = None, port: Optional[int] = None) -> redis.asyncio.Redis:
+    """Equivalente a redis_client() para redis.asyncio."""
+    return redis.asyncio.Redis(
+        host=host or os.getenv("REDIS_HOST", "redis"),
+        port=port or int(os.getenv("REDIS_PORT", "6379")),
+        decode_responses=True,
+        encoding_errors="surrogateescape",
+    )
+
+
+def queue_name(priority: str = DEFAULT_PRIORITY, task_name: Optional[str] = None) -> str:
+    """Nome da lista para a prioridade (e tipo de tarefa, se QUEUE_ROUTE_BY_TASK). Levanta ValueError se a prioridade não existir."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Prioridade inválida: {priority!r}. Use uma de {', '.join(PRIORITIES)}.")
+    parts = [QUEUE_NAME]
+    if priority != DEFAULT_PRIORITY:
+        parts.append(priority)
+    if task_name and ROUTE_BY_TASK:
+        parts.append(task_name)
+    return ":".join(parts)
+
+
+def worker_queues(task_names: Iterable[str], task_weights: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    Filas que um worker deve consumir, da mais para a menos prioritária, com o peso de cada
+    uma (peso da prioridade x peso da tarefa). A fila sem tipo de cada prioridade é sempre
+    incluída para não abandonar tarefas enfileiradas antes do roteamento por tipo.
+    """
+    task_weights = task_weights or {}
+    queues: Dict[str, int] = {}
+    for priority, weight in PRIORITIES.items():
+        if ROUTE_BY_TASK:
+            for task_name in task_names:
+                queues[queue_name(priority, task_name)] = weight * max(1, task_weights.get(task_name, 1))
+        queues.setdefault(queue_name(priority), weight)
+    return queues
+
+
+class QueueSelector:
+    """
+    Define a ordem em que as filas são consultadas a cada pop.
+      - "strict": sempre da mais para a menos prioritária (filas baixas podem esperar indefinidamente);
+      - "weighted": round-robin ponderado suave; a fila escolhida vai para a frente e as demais
+        seguem em ordem de prioridade, então nenhuma fila com tarefas fica sem atendimento.
+    """
+
+    def __init__(self, weights: Dict[str, int], policy: str = "weighted") -> None:
+        if policy not in ("strict", "weighted"):
+            raise ValueError(f"Política de fila inválida: {policy!r}")
+        self.policy = policy
+        self.queues = list(weights)
+        self._weights = {q: max(1, w) for q, w in weights.items()}
+        self._total = sum(self._weights.values())
+        self._current = {q: 0 for q in self.queues}
+
+    def order(self) -> List[str]:
+        if self.policy == "strict" or len(self.queues) == 1:
+            return self.queues
+        for q in self.queues:
+            self._current[q] += self._weights[q]
+        chosen = max(self.queues, key=lambda q: self._current[q])
+        self._current[chosen] -= self._total
+        return [chosen] + [q for q in self.queues if q != chosen]
+
+
+def pop_batch(
+    client: redis.Redis,
+    queues: Union[str, Sequence[str]] = QUEUE_NAME,
+    count: int = BATCH_SIZE,
+    timeout: float = 5,
+) -> List[Tuple[str, str]]:
+    """
+    Bloqueia até `timeout` segundos pela primeira tarefa e retorna até `count` pares
+    (fila, tarefa) já disponíveis, todos da primeira fila não vazia na ordem dada, sem
+    esperar a fila acumular. Retorna [] se o timeout expirar.
+    """
+    global _blmpop_supported
+    if isinstance(queues, str):
+        queues = [queues]
+    if count <= 1:
+        item = client.blpop(queues, timeout=timeout)
+        return [(item[0], item[1])] if item else []
+
+    if _blmpop_supported is not False:
+        try:
+            res = client.blmpop(timeout, len(queues), *queues, direction="LEFT", count=count)
+            _blmpop_supported = True
+            return [(res[0], task_json) for task_json in res[1]] if res else []
+        except redis.exceptions.ResponseError as e:
+            if "unknown command" not in str(e).lower():
+                raise
+            logger.info("Servidor Redis sem BLMPOP; usando BLPOP + LPOP count.")
+            _blmpop_supported = False
+
+    item = client.blpop(queues, timeout=timeout)
+    if item is None:
+        return []
+    queue, first = item
+    rest = client.lpop(queue, count - 1) or []
+    return [(queue, first)] + [(queue, task_json) for task_json in rest]
+
+
+async def pop_batch_async(
+    client: redis.asyncio.Redis,
+    queues: Union[str, Sequence[str]] = QUEUE_NAME,
+    count: int = BATCH_SIZE,
+    timeout: float = 5,
+) -> List[Tuple[str, str]]:
+    """Versão asyncio de pop_batch: bloqueia só a conexão, não o event loop."""
+    global _blmpop_supported
+    if isinstance(queues, str):
+        queues = [queues]
+    if count <= 1:
+        item = await client.blpop(queues, timeout=timeout)
+        return [(item[0], item[1])] if item else []
+
+    if _blmpop_supported is not False:
+        try:
+            res = await client.blmpop(timeout, len(queues), *queues, direction="LEFT", count=count)
+            _blmpop_supported = True
+            return [(res[0], task_json) for task_json in res[1]] if res else []
+        except redis.exceptions.ResponseError as e:
+            if "unknown command" not in str(e).lower():
+                raise
+            logger.info("Servidor Redis sem BLMPOP; usando BLPOP + LPOP count.")
+            _blmpop_supported = False
+
+    item = await client.blpop(queues, timeout=timeout)
+    if item is None:
+        return []
+    queue, first = item
+    rest = await client.lpop(queue, count - 1) or []
+    return [(queue, first)] + [(queue, task_json) for task_json in rest]
+
+
+@metrics.timed(metrics.REDIS_RTT.labels("push_many"))
+def push_many(client: redis.Redis, items: Iterable[Tuple[str, envelope.Payload]], batch_size: int = BATCH_SIZE) -> int:
+    """Envia pares (fila, tarefa) agrupados por fila em RPUSH de até `batch_size` itens, num único pipeline."""
+    by_queue: Dict[str, List[envelope.Payload]] = {}
+    for queue, task_json in items:
+        by_queue.setdefault(queue, []).append(task_json)
+    pipe = client.pipeline(transaction=False)
+    sent = 0
+    for queue, tasks_json in by_queue.items():
+        for start in range(0, len(tasks_json), batch_size):
+            chunk = tasks_json[start:start + batch_size]
+            pipe.rpush(queue, *chunk)
+            sent += len(chunk)
+    if sent:
+        pipe.execute()
+    return sent
+
+
+def push_tasks(client: redis.Redis, tasks_json: Iterable[envelope.Payload], queue: str = QUEUE_NAME, batch_size: int = BATCH_SIZE) -> int:
+    """Envia as tarefas em RPUSH de até `batch_size` itens, todos em um único pipeline. Retorna quantas foram enviadas."""
+    return push_many(client, ((queue, task_json) for task_json in tasks_json), batch_size)
+
+
+@metrics.timed(metrics.REDIS_RTT.labels("requeue_front"))
+def requeue_front(client: redis.Redis, items: List[Tuple[str, str]]) -> None:
+    """Devolve pares (fila, tarefa) retirados e não processados ao início de suas filas, preservando a ordem."""
+    if not items:
+        return
+    pipe = client.pipeline(transaction=False)
+    for queue, task_json in reversed(items):
+        pipe.lpush(queue, task_json)
+    pipe.execute()
+
+
+def _delayed_member(queue: str, task_json: envelope.Payload) -> bytes:
+    return f"{uuid.uuid4().hex}|{queue}|".encode() + envelope.to_bytes(task_json)
+
+
+@metrics.timed(metrics.REDIS_RTT.labels("schedule_many"))
+def schedule_many(client: redis.Redis, items: Iterable[Tuple[str, envelope.Payload, float]]) -> int:
+    """
+    Agenda triplas (fila, tarefa, horário em epoch) no zset de tarefas atrasadas com um único
+    ZADD. Cada membro recebe um id próprio, então payloads idênticos não colidem.
+    """
+    mapping = {_delayed_member(queue, task_json): eta for queue, task_json, eta in items}
+    if mapping:
+        client.zadd(DELAYED_KEY, mapping)
+    return len(mapping)
+
+
+# Para cada item: registra a chave de idempotência com SET NX EX e, só se ela for nova,
+# enfileira a tarefa (RPUSH na fila, ou ZADD no zset de atrasadas se houver score).
+# Com fencing token (ARGV[2]), recusa o lote inteiro se o contador em KEYS[1] já passou dele.
+# KEYS[1] = contador de fencing, depois pares (chave de idempotência, destino);
+# ARGV[1] = ttl, ARGV[2] = fencing token ou "", depois pares (tarefa, score ou "")
+_PUSH_UNIQUE_SCRIPT = """
+if ARGV[2] ~= '' and tonumber(redis.call('GET', KEYS[1]) or '0') > tonumber(ARGV[2]) then
+  return redis.error_reply('FENCED token ' .. ARGV[2] .. ' superado')
+end
+local out = {}
+for i = 2, #KEYS, 2 do
+  local task, score = ARGV[i + 1], ARGV[i + 2]
+  if redis.call('SET', KEYS[i], '1', 'NX', 'EX', tonumber(ARGV[1])) then
+    if score == '' then
+      redis.call('RPUSH', KEYS[i + 1], task)
+    else
+      redis.call('ZADD', KEYS[i + 1], score, task)
+    end
+    out[#out + 1] = 1
+  else
+    out[#out + 1] = 0
+  end
+end
+return out
+"""
+
+
+class FencedError(Exception):
+    """O fencing token do produtor foi superado: outra réplica assumiu a liderança."""
+
+
+def idempotency_key(key: str) -> str:
+    return f"{QUEUE_NAME}:idem:{key}"
+
+
+@metrics.timed(metrics.REDIS_RTT.labels("enqueue_unique"))
+def enqueue_unique(
+    client: redis.Redis,
+    items: Iterable[Tuple[str, envelope.Payload, str, Optional[float]]],
+    ttl: int = IDEMPOTENCY_TTL,
+    batch_size: int = 500,
+    fencing: Optional[Tuple[str, int]] = None,
+) -> List[bool]:
+    """
+    Enfileira quádruplas (fila, tarefa, chave de idempotência, horário em epoch ou None)
+    descartando as chaves já vistas nos últimos `ttl` segundos. Registro da chave e envio
+    são atômicos; os lotes vão em um único pipeline. Retorna, alinhado com `items`, True
+    para as enfileiradas e False para as duplicatas.
+
+    Com `fencing` (chave do contador, token), levanta FencedError se o token foi superado.
+    """
+    script = client.register_script(_PUSH_UNIQUE_SCRIPT)
+    pipe = client.pipeline(transaction=False)
+    items = list(items)
+    for start in range(0, len(items), batch_size):
+        # sem fencing o script não lê KEYS[1]; o nome é só para manter as posições
+        keys: List[str] = [fencing[0] if fencing else DELAYED_KEY]
+        args: List[Union[str, bytes, float, int]] = [ttl, fencing[1] if fencing else ""]
+        for queue, task_json, key, eta in items[start:start + batch_size]:
+            if eta is None:
+                keys += [idempotency_key(key), queue]
+                args += [task_json, ""]
+            else:
+                keys += [idempotency_key(key), DELAYED_KEY]
+                args += [_delayed_member(queue, task_json), eta]
+        script(keys=keys, args=args, client=pipe)
+    try:
+        replies = pipe.execute() if items else []
+    except redis.exceptions.ResponseError as e:
+        if "FENCED" in str(e):
+            raise FencedError(str(e)) from e
+        raise
+    return [bool(flag) for reply in replies for flag in reply]
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Espera da tentativa `attempt` (1, 2, ...): exponencial limitada a `cap`, com metade aleatória (equal jitter)."""
+    delay = min(cap, base * (2 ** max(0, attempt - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+@metrics.timed(metrics.REDIS_RTT.labels("dead_letter"))
+def dead_letter(client: redis.Redis, task_json: envelope.Payload) -> None:
+    """Envia a tarefa para a dead-letter queue, mantendo só as DEAD_LETTER_MAX mais recentes."""
+    pipe = client.pipeline(transaction=False)
+    pipe.rpush(DEAD_LETTER_KEY, task_json)
+    pipe.ltrim(DEAD_LETTER_KEY, -DEAD_LETTER_MAX, -1)
+    pipe.execute()
+
+
+# Move para as filas de destino os membros de ARGV (tarefas atrasadas já vencidas,
+# "<id>|<fila>|<tarefa>") que ainda estiverem no zset; outro worker pode ter promovido antes.
+# KEYS[1] = zset de tarefas atrasadas, KEYS[2..] = filas de destino
+# ARGV = pares (índice da fila em KEYS, membro)
+# Retorna {quantidade movida[, score da próxima tarefa]}.
+_PROMOTE_SCRIPT = """
+local moved = 0
+for i = 1, #ARGV, 2 do
+  local m = ARGV[i + 1]
+  if redis.call('ZREM', KEYS[1], m) == 1 then
+    local b = string.find(m, '|', string.find(m, '|', 1, true) + 1, true)
+    redis.call('RPUSH', KEYS[tonumber(ARGV[i])], string.sub(m, b + 1))
+    moved = moved + 1
+  end
+end
+local nxt = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if nxt[2] then
+  return {moved, nxt[2]}
+end
+return {moved}
+"""
+
+
+def _promote_call(due: List[str]) -> Tuple[List[str], List[Any]]:
+    """KEYS e ARGV do _PROMOTE_SCRIPT: as filas de destino dos membros vencidos, agrupadas."""
+    keys = [DELAYED_KEY]
+    index: Dict[str, int] = {}
+    args: List[Any] = []
+    for member in due:
+        queue = member.split("|", 2)[1]
+        if queue not in index:
+            keys.append(queue)
+            index[queue] = len(keys)
+        args += [index[queue], member]
+    return keys, args
+
+
+def _next_due(head: List[Tuple[str, float]]) -> Optional[float]:
+    return float(head[0][1]) if head else None
+
+
+@metrics.timed(metrics.REDIS_RTT.labels("promote_due"))
+def promote_due(client: redis.Redis, limit: int = 500) -> Tuple[int, Optional[float]]:
+    """
+    Promove as tarefas atrasadas vencidas para as filas prontas, em lotes de `limit`: lê os
+    membros vencidos e os move com uma chamada Lua que declara as filas de destino em KEYS.
+    Seguro com vários workers chamando ao mesmo tempo. Retorna (quantidade movida, horário
+    em epoch da próxima tarefa atrasada ou None).
+    """
+    script = client.register_script(_PROMOTE_SCRIPT)
+    total = 0
+    while True:
+        pipe = client.pipeline(transaction=False)
+        pipe.zrangebyscore(DELAYED_KEY, "-inf", time.time(), start=0, num=limit)
+        pipe.zrange(DELAYED_KEY, 0, 0, withscores=True)
+        due, head = pipe.execute()
+        if not due:
+            return total, _next_due(head)
+        keys, args = _promote_call(due)
+        res = script(keys=keys, args=args)
+        total += res[0]
+        if len(due) < limit:
+            return total, float(res[1]) if len(res) > 1 else None
+
+
+async def promote_due_async(client: redis.asyncio.Redis, limit: int = 500) -> Tuple[int, Optional[float]]:
+    """Versão asyncio de promote_due."""
+    script = client.register_script(_PROMOTE_SCRIPT)
+    total = 0
+    while True:
+        pipe = client.pipeline(transaction=False)
+        pipe.zrangebyscore(DELAYED_KEY, "-inf", time.time(), start=0, num=limit)
+        pipe.zrange(DELAYED_KEY, 0, 0, withscores=True)
+        due, head = await pipe.execute()
+        if not due:
+            return total, _next_due(head)
+        keys, args = _promote_call(due)
+        res = await script(keys=keys, args=args)
+        total += res[0]
+        if len(due) < limit:
+            return total, float(res[1]) if len(res) > 1 else None
+
+
+class BatchProducer:
+    """
+    Acumula tarefas e as envia em pipeline quando o lote atinge `batch_size`. Não há envio
+    por tempo: use como context manager ou chame flush() ao final (ou quando quiser limitar a
+    espera) para enviar o restante. `sent` conta
+    as tarefas já confirmadas pelo Redis (inclusive as enviadas por flush automático no push).
+    """
+
+    def __init__(self, client: redis.Redis, batch_size: int = BATCH_SIZE) -> None:
+        self.client = client
+        self.batch_size = max(1, batch_size)
+        self._buffers: Dict[str, List[envelope.Payload]] = {}
+        self._pending = 0
+        self.sent = 0
+
+    def push(self, task_json: envelope.Payload, queue: str = QUEUE_NAME) -> None:
+        self._buffers.setdefault(queue, []).append(task_json)
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """Envia tudo o que estiver no buffer em um único round trip. Retorna quantas tarefas foram enviadas."""
+        if not self._pending:
+            return 0
+        pipe = self.client.pipeline(transaction=False)
+        for queue, items in self._buffers.items():
+            if items:
+                pipe.rpush(queue, *items)
+        pipe.execute()
+        sent = self._pending
+        self.sent += sent
+        self._buffers = {}
+        self._pending = 0
+        return sent
+
+    def __enter__(self) -> "BatchProducer":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+
+
+# Move até ARGV[1] tarefas para as listas de processamento, consultando as filas na ordem.
+# KEYS = pares (fila, lista de processamento do worker nessa fila).
+# Retorna {fila, tarefa, fila, tarefa, ...}.
+_CLAIM_SCRIPT = """
+local out = {}
+local n = tonumber(ARGV[1])
+for i = 1, #KEYS, 2 do
+  while n > 0 do
+    local item = redis.call('LMOVE', KEYS[i], KEYS[i + 1], 'LEFT', 'RIGHT')
+    if not item then break end
+    out[#out + 1] = KEYS[i]
+    out[#out + 1] = item
+    n = n - 1
+  end
+  if n == 0 then break end
+end
+return out
+"""
+
+# Move para o início da fila de origem tudo o que estiver nas listas de processamento de
+# workers com prazo de visibilidade expirado (ou sem prazo registrado) e as tira do registro.
+# KEYS[1] = zset de prazos dos workers, KEYS[2] = registro de listas de processamento,
+# KEYS[3..] = pares (lista de processamento, fila de origem)
+# ARGV[1] = agora (epoch s), ARGV[2..] = worker de cada par, na mesma ordem
+# Retorna {workers recuperados, tarefas devolvidas}.
+_REAP_SCRIPT = """
+local now = tonumber(ARGV[1])
+local moved = 0
+local reaped = {}
+for i = 3, #KEYS, 2 do
+  local wid = ARGV[(i - 1) / 2 + 1]
+  local deadline = tonumber(redis.call('ZSCORE', KEYS[1], wid))
+  if deadline == nil or deadline <= now then
+    while redis.call('LMOVE', KEYS[i], KEYS[i + 1], 'RIGHT', 'LEFT') do
+      moved = moved + 1
+    end
+    redis.call('SREM', KEYS[2], KEYS[i])
+    reaped[wid] = true
+  end
+end
+local n = 0
+for wid in pairs(reaped) do
+  redis.call('ZREM', KEYS[1], wid)
+  n = n + 1
+end
+return {n, moved}
+"""
+
+
+class ReliableQueue:
+    """
+    Consumo at-least-once: cada tarefa é movida atomicamente (BLMOVE/LMOVE) da fila para a
+    lista de processamento do worker (`<fila>:processing:<worker_id>`) e só sai de lá no ack().
+
+    O prazo de visibilidade é mantido por worker no zset `<QUEUE_NAME>:inflight` (score = prazo
+    em epoch). O worker vivo chama renew() periodicamente; se ele morrer, o prazo expira e
+    reap() devolve as listas de processamento inteiras às filas de origem com um único script
+    Lua por lote de listas. As listas de processamento ficam registradas no set
+    `<QUEUE_NAME>:processing_lists` antes de receberem tarefas (só na primeira vez, ou depois
+    que o reaper recuperou o worker), então o reaper percorre o registro em vez de varrer o
+    keyspace.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        worker_id: str,
+        queues: Union[str, Sequence[str]] = QUEUE_NAME,
+        visibility_timeout: float = 300.0,
+    ) -> None:
+        self.worker_id = worker_id
+        self.queues = [queues] if isinstance(queues, str) else list(queues)
+        self.visibility_timeout = visibility_timeout
+        self.inflight_key = f"{QUEUE_NAME}:inflight"
+        self.registry_key = f"{QUEUE_NAME}:processing_lists"
+        # listas de processamento já registradas por este worker; claim() (loop principal) e a
+        # thread de renovação do prazo chamam renew(), então o set e o SADD ficam sob o lock
+        self._registered: Set[str] = set()
+        self._register_lock = threading.Lock()
+        self.set_client(client)
+
+    def set_client(self, client: redis.Redis) -> None:
+        """Troca o cliente (usado também após uma reconexão)."""
+        self.client = client
+        self._claim = client.register_script(_CLAIM_SCRIPT)
+        self._reap = client.register_script(_REAP_SCRIPT)
+
+    def processing_key(self, queue: str) -> str:
+        return f"{queue}:processing:{self.worker_id}"
+
+    @staticmethod
+    def _split_processing_key(key: str) -> Tuple[str, str]:
+        """(fila de origem, worker_id) de uma lista de processamento."""
+        queue, _, worker_id = key.rpartition(":processing:")
+        return queue, worker_id
+
+    @metrics.timed(metrics.REDIS_RTT.labels("reliable_renew"))
+    def renew(self, extra: float = 0.0, queues: Optional[Sequence[str]] = None) -> None:
+        """
+        Estende o prazo de visibilidade das tarefas deste worker e registra as listas de
+        processamento de `queues` ainda não registradas. Se o worker não estava no zset
+        (primeira chamada ou o reaper já o recuperou), registra todas de novo.
+        """
+        with self._register_lock:
+            if self.client.zadd(self.inflight_key, {self.worker_id: time.time() + self.visibility_timeout + extra}):
+                self._registered.clear()
+            keys = {self.processing_key(queue) for queue in (queues or self.queues)} - self._registered
+            if keys:
+                self.client.sadd(self.registry_key, *keys)
+                self._registered |= keys
+
+    def claim(self, count: int = BATCH_SIZE, timeout: float = 5, queues: Optional[Sequence[str]] = None) -> List[Tuple[str, str]]:
+        """
+        Move até `count` tarefas para as listas de processamento, consultando as filas na ordem
+        dada, e retorna pares (fila, tarefa). O prazo é renovado antes do movimento, então nunca
+        há tarefa em processamento sem prazo registrado.
+
+        Com uma fila só, bloqueia no BLMOVE e completa o lote com LMOVE. Com várias (não há
+        BLMOVE multi-fila), consulta todas uma vez em um script Lua; se estiverem vazias,
+        bloqueia no BLMOVE da primeira fila da ordem até `timeout` e, se chegar uma tarefa,
+        completa o lote com o script. Tarefas que chegarem às outras filas durante a espera
+        são vistas na próxima chamada; o worker limita `timeout` ao intervalo de promoção das
+        tarefas atrasadas.
+        """
+        queues = list(queues or self.queues)
+        self.renew(extra=timeout, queues=queues)
+        if len(queues) == 1:
+            queue = queues[0]
+            first = self.client.blmove(queue, self.processing_key(queue), timeout, "LEFT", "RIGHT")
+            if first is None:
+                return []
+            claimed = [(queue, first)]
+            if count > 1:
+                pipe = self.client.pipeline(transaction=False)
+                for _ in range(count - 1):
+                    pipe.lmove(queue, self.processing_key(queue), "LEFT", "RIGHT")
+                claimed.extend((queue, item) for item in pipe.execute() if item is not None)
+            return claimed
+
+        keys = [key for queue in queues for key in (queue, self.processing_key(queue))]
+        flat = self._claim(keys=keys, args=[count])
+        if flat:
+            return list(zip(flat[0::2], flat[1::2]))
+        queue = queues[0]
+        first = self.client.blmove(queue, self.processing_key(queue), timeout, "LEFT", "RIGHT")
+        if first is None:
+            return []
+        claimed = [(queue, first)]
+        if count > 1:
+            flat = self._claim(keys=keys, args=[count - 1])
+            claimed.extend(zip(flat[0::2], flat[1::2]))
+        return claimed
+
+    @metrics.timed(metrics.REDIS_RTT.labels("reliable_ack"))
+    def ack(self, items: List[Tuple[str, str]]) -> None:
+        """Remove tarefas concluídas das listas de processamento (um round trip para o lote)."""
+        if not items:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for queue, task_json in items:
+            pipe.lrem(self.processing_key(queue), 1, task_json)
+        pipe.execute()
+
+    @metrics.timed(metrics.REDIS_RTT.labels("reliable_release"))
+    def release(self, items: List[Tuple[str, str]]) -> None:
+        """Devolve ao início das filas tarefas reivindicadas e não executadas (ex.: no shutdown)."""
+        if not items:
+            return
+        pipe = self.client.pipeline(transaction=True)
+        for queue, task_json in reversed(items):
+            pipe.lrem(self.processing_key(queue), 1, task_json)
+            pipe.lpush(queue, task_json)
+        pipe.execute()
+
+    def deregister(self) -> None:
+        """
+        Remove o prazo e o registro das listas do worker se elas estiverem vazias (encerramento
+        limpo). Listas que receberam tarefas de outras filas (ex.: claim com `queues`) ficam
+        registradas e o reaper as limpa quando o prazo vence.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        for queue in self.queues:
+            pipe.llen(self.processing_key(queue))
+        if not any(pipe.execute()):
+            pipe = self.client.pipeline(transaction=True)
+            pipe.zrem(self.inflight_key, self.worker_id)
+            pipe.srem(self.registry_key, *(self.processing_key(queue) for queue in self.queues))
+            with self._register_lock:
+                pipe.execute()
+                self._registered.clear()
+
+    def reap(self, batch: int = 100) -> int:
+        """
+        Devolve às filas as tarefas das listas de processamento registradas cujo worker está
+        com o prazo expirado ou sem prazo. O script confere o prazo de novo antes de mover,
+        então um worker que renovou no meio não perde suas tarefas. Retorna quantas tarefas
+        foram recuperadas.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.smembers(self.registry_key)
+        pipe.zrangebyscore(self.inflight_key, f"({time.time()}", "+inf")
+        registered, alive = pipe.execute()
+        alive = set(alive)
+        candidates = sorted(key for key in registered if self._split_processing_key(key)[1] not in alive)
+
+        recovered = 0
+        for start in range(0, len(candidates), batch):
+            chunk = candidates[start:start + batch]
+            keys = [self.inflight_key, self.registry_key]
+            workers = []
+            for key in chunk:
+                queue, worker_id = self._split_processing_key(key)
+                keys += [key, queue]
+                workers.append(worker_id)
+            n_workers, moved = self._reap(keys=keys, args=[time.time(), *workers])
+            recovered += moved
+            if moved:
+                logger.warning("♻️ %s tarefas de %s workers expirados devolvidas à fila.", moved, n_workers)
+        return recovered
@@ -1,29 +1,87 @@
 import redis
+import asyncio
+import inspect
+import itertools
 import json
 import os
 
 import redis.exceptions
+import envelope
+import metrics
+import progress
+import registry
+import results
 import tasks
+import throttle
+import transport
+import workflow
 import time
 import logging
 import signal
+import socket
 import sys
-from typing import Any, Dict, Optional, Tuple
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
 
-QUEUE_NAME = 'task_queue'
+QUEUE_NAME = transport.QUEUE_NAME
 
-AVAILABLE_TASKS = {
-    "send_email": tasks.send_email,
-    "generate_report": tasks.generate_report
+# modo de execução: "sync" (uma tarefa por vez, no loop principal), "pool"
+# (thread pool para tarefas I/O-bound e process pool para CPU-bound) ou "async"
+# (event loop asyncio; ver async_worker.py)
+WORKER_MODE = os.getenv("WORKER_MODE", "sync")
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "8"))
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", str(os.cpu_count() or 2)))
+# quantas tarefas além da capacidade dos pools podem ficar retiradas da fila aguardando execução
+WORKER_PREFETCH = int(os.getenv("WORKER_PREFETCH", "4"))
+STATS_INTERVAL = float(os.getenv("WORKER_STATS_INTERVAL", "30"))
+
+# entrega at-least-once: tarefas ficam na lista de processamento do worker até o ack
+RELIABLE_QUEUE = os.getenv("RELIABLE_QUEUE", "false").lower() in ("1", "true", "yes")
+VISIBILITY_TIMEOUT = float(os.getenv("VISIBILITY_TIMEOUT", "300"))
+REAP_INTERVAL = float(os.getenv("REAP_INTERVAL", "30"))
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+# ordem de consumo das filas de prioridade: "strict" ou "weighted" (round-robin ponderado)
+WORKER_QUEUE_POLICY = os.getenv("WORKER_QUEUE_POLICY", "weighted")
+
+# retentativas com backoff exponencial; esgotadas, a tarefa vai para a dead-letter queue
+TASK_MAX_RETRIES = int(os.getenv("TASK_MAX_RETRIES", "3"))
+TASK_RETRY_BACKOFF = float(os.getenv("TASK_RETRY_BACKOFF", "2"))
+TASK_RETRY_BACKOFF_MAX = float(os.getenv("TASK_RETRY_BACKOFF_MAX", "300"))
+# intervalo máximo entre promoções de tarefas atrasadas para as filas
+DELAYED_POLL_INTERVAL = float(os.getenv("DELAYED_POLL_INTERVAL", "1"))
+# janela (s) para reaproveitar relatórios idênticos; 0 desliga
+REPORT_MEMOIZE_TTL = int(os.getenv("REPORT_MEMOIZE_TTL", "0"))
+# limites no cluster inteiro (0 desliga): envios de email por segundo e relatórios simultâneos
+SEND_EMAIL_RATE_LIMIT = float(os.getenv("SEND_EMAIL_RATE_LIMIT", "0"))
+REPORT_MAX_CONCURRENCY = int(os.getenv("REPORT_MAX_CONCURRENCY", "0"))
+
+# "func" pode ser síncrona ou `async def`.
+# "mode" indica onde a tarefa síncrona roda nos modos pool/async: "thread" ou "process".
+# "weight" (opcional, padrão 1) multiplica o peso da fila do tipo com QUEUE_ROUTE_BY_TASK.
+# "max_retries", "retry_backoff" e "retry_backoff_max" (opcionais) sobrescrevem os padrões TASK_*.
+# "memoize" (opcional, segundos) reaproveita o resultado de chamadas idênticas dentro da janela (ver results.py).
+# "rate_limit"/"rate_burst" e "max_concurrency" (opcionais) limitam o tipo no cluster (ver throttle.py).
+# "progress" (opcional) publica progresso e checkpoints e permite retomar após o encerramento (ver progress.py).
+AVAILABLE_TASKS: Dict[str, Dict[str, Any]] = {
+    "send_email": {"func": tasks.send_email, "mode": "thread", "rate_limit": SEND_EMAIL_RATE_LIMIT},
+    "send_email_async": {"func": tasks.send_email_async},
+    "generate_report": {
+        "func": tasks.generate_report,
+        "mode": "process",
+        "memoize": REPORT_MEMOIZE_TTL,
+        "max_concurrency": REPORT_MAX_CONCURRENCY,
+        "progress": True,
+    },
+    "merge_reports": {"func": tasks.merge_reports, "mode": "thread"},
 }
 
 def make_redis_client() -> redis.Redis:
-    host = os.getenv("REDIS_HOST", "redis")
-    port = int(os.getenv("REDIS_PORT", "6379"))
-    return redis.Redis(host=host, port=port, decode_responses=True)
+    return transport.redis_client()
 
 running = True
 
@@ -31,59 +89,553 @@ def handle_signal(signum, frame):
     global running
     logger.info("Sinal recebido (%s). Encerrando worker...", signum)
     running = False
+    # tarefas com checkpoint param no fim do bloco atual, inclusive nos processos do pool
+    progress.request_stop()
 
 signal.signal(signal.SIGINT, handle_signal)
 signal.signal(signal.SIGTERM, handle_signal)
 
-def process_task(task_json: str) -> None:
+# chamado ao fim de cada tarefa com (None, resultado) no sucesso ou (exceção, None) na falha
+DoneCallback = Callable[[Optional[BaseException], Any], None]
+
+
+class InvalidTaskError(ValueError):
+    """Payload que nunca poderá ser executado (não é objeto JSON ou tarefa desconhecida)."""
+
+
+class ThroughputStats:
+    """
+    Contadores de tarefas concluídas/falhas por modo de execução, tarefas em andamento e
+    tempo de serviço médio (média móvel exponencial) por tipo de tarefa (thread-safe).
+    """
+
+    # peso da execução mais recente na média móvel do tempo de serviço
+    SERVICE_ALPHA = 0.2
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._running: Dict[int, Tuple[str, float]] = {}
+        self._service: Dict[str, Tuple[float, int]] = {}
+        self._tokens = itertools.count()
+
+    def record(self, mode: str, ok: bool) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(mode, {"done": 0, "failed": 0})
+            counts["done" if ok else "failed"] += 1
+
+    def started(self, task_name: str) -> int:
+        """Marca o início de uma tarefa; passe o token retornado para finished()."""
+        token = next(self._tokens)
+        with self._lock:
+            self._running[token] = (task_name, time.monotonic())
+        return token
+
+    def discard(self, token: int) -> None:
+        """Esquece uma tarefa que não chegou a executar (ex.: limitada por throttle.py)."""
+        with self._lock:
+            self._running.pop(token, None)
+
+    def finished(self, token: int, ok: bool = True) -> None:
+        with self._lock:
+            task_name, started = self._running.pop(token, (None, 0.0))
+            if task_name is None:
+                return
+            elapsed = time.monotonic() - started
+            avg, count = self._service.get(task_name, (elapsed, 0))
+            self._service[task_name] = (avg + self.SERVICE_ALPHA * (elapsed - avg), count + 1)
+        metrics.record_task(task_name, ok, elapsed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Totais, tarefas em andamento e {task_name: [tempo de serviço médio, execuções]}."""
+        with self._lock:
+            return {
+                "done": sum(c["done"] for c in self._counts.values()),
+                "failed": sum(c["failed"] for c in self._counts.values()),
+                "current": [name for name, _ in self._running.values()],
+                "service": {name: [round(avg, 4), count] for name, (avg, count) in self._service.items()},
+            }
+
+    def log(self) -> None:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        with self._lock:
+            snapshot = {mode: dict(c) for mode, c in self._counts.items()}
+        for mode, c in sorted(snapshot.items()):
+            total = c["done"] + c["failed"]
+            logger.info(
+                "📊 [%s] concluídas=%s falhas=%s throughput=%.2f tarefas/s",
+                mode, c["done"], c["failed"], total / elapsed,
+            )
+
+
+class TaskPool:
+    """
+    Executa tarefas em paralelo, escolhendo o executor pelo "mode" de AVAILABLE_TASKS.
+    O número de tarefas retiradas da fila e ainda não concluídas é limitado a
+    threads + processes + prefetch; submit() bloqueia quando o limite é atingido.
+    """
+
+    def __init__(self, threads: int, processes: int, prefetch: int, stats: ThroughputStats) -> None:
+        self._executors = {
+            "thread": ThreadPoolExecutor(max_workers=threads, thread_name_prefix="task"),
+            "process": ProcessPoolExecutor(
+                max_workers=processes, initializer=progress.init_process, initargs=(progress.stop_event(),)
+            ),
+        }
+        self._capacity = threads + processes + max(0, prefetch)
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._stats = stats
+
+    def free_slots(self) -> int:
+        """Quantas tarefas ainda podem ser retiradas da fila sem passar do limite."""
+        with self._cond:
+            return self._capacity - self._pending
+
+    def wait_free(self, timeout: float) -> bool:
+        """Espera até `timeout` segundos por uma vaga livre. Retorna se há vaga."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending < self._capacity, timeout)
+
+    def _release_slot(self) -> None:
+        with self._cond:
+            self._pending -= 1
+            self._cond.notify_all()
+
+    def submit(
+        self,
+        task_name: str,
+        spec: Dict[str, Any],
+        args: List[Any],
+        kwargs: Dict[str, Any],
+        on_done: Optional[DoneCallback] = None,
+        progress_ref: Optional[str] = None,
+        limits: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        mode = spec.get("mode", "thread")
+        executor = self._executors.get(mode)
+        if executor is None:
+            logger.error("Modo '%s' inválido para a tarefa '%s'; usando thread.", mode, task_name)
+            mode, executor = "thread", self._executors["thread"]
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending < self._capacity)
+            self._pending += 1
+        token = self._stats.started(task_name)
+        try:
+            future = executor.submit(
+                run_limited, spec["func"], args, kwargs, task_name, spec.get("memoize", 0), progress_ref, limits
+            )
+        except Exception:
+            self._stats.finished(token, False)
+            self._release_slot()
+            raise
+        future.add_done_callback(lambda f: self._on_done(task_name, mode, token, f, on_done))
+
+    def _on_done(self, task_name: str, mode: str, token: int, future: Future, on_done: Optional[DoneCallback]) -> None:
+        error: Optional[BaseException] = None
+        result: Any = None
+        throttled = False
+        try:
+            result = future.result()
+            metrics.log_sampled(logger, "✅ Tarefa '%s' concluída com sucesso. Resultado: %s", task_name, result)
+            self._stats.record(mode, True)
+        except throttle.Throttled as e:
+            error = e
+            throttled = True
+            metrics.log_sampled(logger, "⏳ %s", e)
+        except tasks.TaskInterrupted as e:
+            error = e
+            logger.info("⏸️ %s", e)
+        except Exception as e:
+            error = e
+            logger.exception("🔥 Ocorreu um erro inesperado ao processar a tarefa '%s'.", task_name)
+            self._stats.record(mode, False)
+        finally:
+            if throttled:
+                self._stats.discard(token)
+            else:
+                self._stats.finished(token, error is None)
+            self._release_slot()
+        if on_done is not None:
+            try:
+                on_done(error, result)
+            except Exception:
+                logger.exception("Falha no callback de conclusão da tarefa '%s'.", task_name)
+
+    def shutdown(self) -> None:
+        """Aguarda as tarefas em andamento terminarem e encerra os executores."""
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+
+
+def run_task(
+    func: Callable[..., Any],
+    args: List[Any],
+    kwargs: Dict[str, Any],
+    task_name: Optional[str] = None,
+    memoize: int = 0,
+    progress_ref: Optional[str] = None,
+) -> Any:
+    """
+    Executa a tarefa; corrotinas (`async def`) rodam em um event loop próprio nos modos sync/pool.
+    Com `memoize` > 0 reaproveita o resultado de uma chamada idêntica recente. Com `progress_ref`
+    a tarefa publica progresso e checkpoints (ver progress.py).
+    """
+    if memoize > 0 and task_name:
+        return results.memoized_call(
+            task_name, args, kwargs, memoize, lambda: run_task(func, args, kwargs, task_name, 0, progress_ref)
+        )
+    if progress_ref:
+        return progress.run_tracked(func, args, kwargs, progress_ref, task_name)
+    result = func(*args, **kwargs)
+    if inspect.isawaitable(result):
+        result = asyncio.run(result)
+    return result
+
+
+# Limiter usado dentro dos executores do pool (um por processo, criado na primeira tarefa limitada)
+_pool_limiter: Optional[throttle.Limiter] = None
+_pool_limiter_lock = threading.Lock()
+
+
+def pool_limiter() -> throttle.Limiter:
+    global _pool_limiter
+    with _pool_limiter_lock:
+        if _pool_limiter is None:
+            _pool_limiter = throttle.Limiter(make_redis_client())
+        return _pool_limiter
+
+
+def run_limited(
+    func: Callable[..., Any],
+    args: List[Any],
+    kwargs: Dict[str, Any],
+    task_name: str,
+    memoize: int = 0,
+    progress_ref: Optional[str] = None,
+    limits: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    run_task no modo pool, reservando os `limits` de throttle.py dentro do executor, logo antes
+    de `func` rodar, como no modo sync: tarefas esperando por um slot não ocupam vaga do semáforo.
+    Levanta Throttled se o limite estiver atingido.
+    """
+    if not limits:
+        return run_task(func, args, kwargs, task_name, memoize, progress_ref)
+    limiter = pool_limiter()
+    lease = limiter.acquire(task_name, limits)
     try:
-        logger.info(f"📥 Tarefa recebida: %s", task_json)
-        task_data: Dict[str, Any] = json.loads(task_json)
-        
-        if not isinstance(task_data, dict):
-            logger.error("Payload inválido: não é um objeto JSON")
-            return
-        
-        task_name = task_data.get("task_name")
-        task_args = task_data.get("args", [])
-        task_kwargs = task_data.get("kwargs", {})
-        
-        func = AVAILABLE_TASKS.get(task_name)
-        if not func:
-            logger.error("❌ Tarefa '%s' não reconhecida.", task_name)
-            return
-        
-        logger.info("🏃 Executando '%s' com args=%s, kwargs=%s", task_name, task_args, task_kwargs)
-        result = func(*task_args, **task_kwargs)
-        logger.info("✅ Tarefa '%s' concluída com sucesso. Resultado: %s", task_name, result)
-        
-    except Exception:
+        return run_task(func, args, kwargs, task_name, memoize, progress_ref)
+    finally:
+        limiter.release(task_name, lease)
+
+
+def parse_task(task_json: envelope.Payload) -> Tuple[str, Dict[str, Any], List[Any], Dict[str, Any]]:
+    """Desserializa o envelope e resolve a tarefa. Levanta InvalidTaskError ou envelope.EnvelopeError se inválido."""
+    task_data: Dict[str, Any] = envelope.decode(task_json)
+    metrics.log_sampled(logger, "📥 Tarefa recebida: %s", task_data)
+
+    task_name = task_data.get("task_name")
+    task_args = workflow.resolve_args(task_data)
+    task_kwargs = task_data.get("kwargs", {})
+
+    spec = AVAILABLE_TASKS.get(task_name)
+    if not spec:
+        raise InvalidTaskError(f"Tarefa '{task_name}' não reconhecida.")
+
+    return task_name, spec, task_args, task_kwargs
+
+
+def progress_ref(task_json: envelope.Payload, spec: Dict[str, Any]) -> Optional[str]:
+    """Ref de progresso/checkpoint para tarefas com "progress" em AVAILABLE_TASKS; None para as demais."""
+    return progress.task_ref(envelope.decode(task_json)) if spec.get("progress") else None
+
+
+def process_task(
+    task_json: envelope.Payload,
+    stats: Optional[ThroughputStats] = None,
+    on_done: Optional[DoneCallback] = None,
+    limiter: Optional[throttle.Limiter] = None,
+) -> None:
+    error: Optional[BaseException] = None
+    result: Any = None
+    try:
+        task_name, spec, task_args, task_kwargs = parse_task(task_json)
+        lease = limiter.acquire(task_name, spec) if limiter else None
+
+        metrics.log_sampled(logger, "🏃 Executando '%s' com args=%s, kwargs=%s", task_name, task_args, task_kwargs)
+        token = stats.started(task_name) if stats else None
+        ok = False
+        try:
+            result = run_task(
+                spec["func"], task_args, task_kwargs, task_name, spec.get("memoize", 0), progress_ref(task_json, spec)
+            )
+            ok = True
+        finally:
+            if token is not None:
+                stats.finished(token, ok)
+            if limiter:
+                limiter.release(task_name, lease)
+        if stats:
+            stats.record("sync", True)
+        metrics.log_sampled(logger, "✅ Tarefa '%s' concluída com sucesso. Resultado: %s", task_name, result)
+
+    except throttle.Throttled as e:
+        error = e
+        metrics.log_sampled(logger, "⏳ %s", e)
+    except tasks.TaskInterrupted as e:
+        error = e
+        logger.info("⏸️ %s", e)
+    except (InvalidTaskError, envelope.EnvelopeError) as e:
+        error = e
+        logger.error("❌ %s", e)
+    except Exception as e:
+        error = e
+        if stats:
+            stats.record("sync", False)
+        logger.exception("🔥 Ocorreu um erro inesperado ao processar a tarefa.")
+    if on_done is not None:
+        on_done(error, result)
+
+
+def dispatch_task(
+    task_json: envelope.Payload,
+    pool: TaskPool,
+    on_done: Optional[DoneCallback] = None,
+    limiter: Optional[throttle.Limiter] = None,
+) -> None:
+    """
+    Equivalente a process_task no modo pool: valida e entrega ao executor adequado.
+    `on_done` é chamado quando a tarefa termina (ou imediatamente, se o payload for inválido).
+    Com `limiter`, os limites da tarefa são reservados dentro do executor (ver run_limited).
+    """
+    try:
+        task_name, spec, task_args, task_kwargs = parse_task(task_json)
+        limits = throttle.limits(spec) if limiter else None
+        metrics.log_sampled(logger, "🏃 Executando '%s' com args=%s, kwargs=%s", task_name, task_args, task_kwargs)
+        pool.submit(task_name, spec, task_args, task_kwargs, on_done, progress_ref(task_json, spec), limits)
+    except (InvalidTaskError, envelope.EnvelopeError) as e:
+        logger.error("❌ %s", e)
+        if on_done is not None:
+            on_done(e, None)
+    except Exception as e:
         logger.exception("🔥 Ocorreu um erro inesperado ao processar a tarefa.")
+        if on_done is not None:
+            on_done(e, None)
+
+
+def retry_or_dead_letter(client: redis.Redis, queue: str, task_json: envelope.Payload, error: BaseException) -> None:
+    """
+    Reagenda a tarefa que falhou na mesma fila com backoff exponencial e jitter, contando as
+    tentativas no campo "attempt". Payloads inválidos e tarefas sem tentativas restantes vão
+    para a dead-letter queue com o erro registrado. Tarefas limitadas (Throttled) são
+    adiadas pelo tempo sugerido sem contar tentativa; as interrompidas pelo encerramento do
+    worker (TaskInterrupted) voltam ao início da fila para retomar do checkpoint.
+    """
+    if isinstance(error, throttle.Throttled):
+        transport.schedule_many(client, [(queue, task_json, time.time() + error.retry_after)])
+        metrics.TASKS.labels(error.task_name, "throttled").inc()
+        return
+    if isinstance(error, tasks.TaskInterrupted):
+        transport.requeue_front(client, [(queue, task_json)])
+        return
+
+    try:
+        task_data = envelope.decode(task_json)
+    except envelope.EnvelopeError:
+        task_data = None
+    if task_data is None or isinstance(error, InvalidTaskError):
+        raw = envelope.to_bytes(task_json).decode("utf-8", "surrogateescape")
+        transport.dead_letter(client, json.dumps({"raw": raw, "error": repr(error), "failed_at": time.time()}))
+        logger.error("☠️ Payload inválido enviado para a dead-letter queue.")
+        if task_data is not None and task_data.get("task_id"):
+            results.store_result(client, task_data["task_id"], task_data.get("task_name"), error=error)
+        return
+
+    spec = AVAILABLE_TASKS.get(task_data.get("task_name"), {})
+    attempt = int(task_data.get("attempt", 0)) + 1
+    max_retries = int(task_data.get("max_retries", spec.get("max_retries", TASK_MAX_RETRIES)))
+    if attempt <= max_retries:
+        delay = transport.backoff_delay(
+            attempt,
+            spec.get("retry_backoff", TASK_RETRY_BACKOFF),
+            spec.get("retry_backoff_max", TASK_RETRY_BACKOFF_MAX),
+        )
+        task_data["attempt"] = attempt
+        transport.schedule_many(client, [(queue, envelope.encode(task_data), time.time() + delay)])
+        logger.warning(
+            "🔁 Tarefa '%s' falhou; tentativa %s/%s em %.1fs.", task_data.get("task_name"), attempt, max_retries, delay
+        )
+    else:
+        if workflow.is_workflow_step(task_data):
+            workflow.on_failure(client, task_data, error)
+        task_data["error"] = repr(error)
+        task_data["failed_at"] = time.time()
+        transport.dead_letter(client, json.dumps(task_data, default=str))
+        if task_data.get("task_id"):
+            results.store_result(client, task_data["task_id"], task_data.get("task_name"), error=error)
+        logger.error(
+            "☠️ Tarefa '%s' esgotou %s tentativas; enviada para a dead-letter queue.", task_data.get("task_name"), max_retries
+        )
+
+
+def save_result(client: redis.Redis, task_json: envelope.Payload, result: Any) -> None:
+    """
+    Grava o resultado no backend se a tarefa tiver task_id e, se ela for um passo de
+    workflow, enfileira a continuação; falhas só são registradas no log.
+    """
+    try:
+        task_data = envelope.decode(task_json)
+        if task_data.get("task_id"):
+            results.store_result(client, task_data["task_id"], task_data.get("task_name"), result)
+        if workflow.is_workflow_step(task_data):
+            workflow.on_success(client, task_data, result)
+    except Exception:
+        logger.exception("Falha ao gravar o resultado da tarefa.")
+
+
+def _keep_lease(rq: transport.ReliableQueue, stop: threading.Event) -> None:
+    """Renova o prazo de visibilidade enquanto o worker estiver vivo (inclusive durante tarefas longas)."""
+    while not stop.wait(rq.visibility_timeout / 3):
+        try:
+            rq.renew()
+        except Exception as e:
+            logger.warning("Falha ao renovar prazo de visibilidade: %s", e)
+
 
 def main():
+    if WORKER_MODE == "async":
+        import async_worker
+        async_worker.main()
+        return
+
+    metrics.start_server()
     client = make_redis_client()
     backoff = 1.0
     max_backoff = 30.0
-    
+
+    stats = ThroughputStats()
+    pool: Optional[TaskPool] = None
+    if WORKER_MODE == "pool":
+        pool = TaskPool(WORKER_THREADS, WORKER_PROCESSES, WORKER_PREFETCH, stats)
+        logger.info(
+            "Worker em modo pool (threads=%s processes=%s prefetch=%s)",
+            WORKER_THREADS, WORKER_PROCESSES, WORKER_PREFETCH,
+        )
+    elif WORKER_MODE != "sync":
+        logger.warning("WORKER_MODE '%s' desconhecido; usando 'sync'.", WORKER_MODE)
+    next_stats = time.monotonic() + STATS_INTERVAL
+    limiter = throttle.Limiter(client)
+    heartbeat = registry.Heartbeat(
+        make_redis_client(), WORKER_ID, "pool" if pool is not None else "sync",
+        WORKER_THREADS + WORKER_PROCESSES if pool is not None else 1, stats.snapshot,
+    ).start()
+
+    queue_weights = transport.worker_queues(
+        AVAILABLE_TASKS, {name: spec.get("weight", 1) for name, spec in AVAILABLE_TASKS.items()}
+    )
+    selector = transport.QueueSelector(queue_weights, WORKER_QUEUE_POLICY)
+    logger.info("Consumindo filas %s (política=%s)", selector.queues, selector.policy)
+
+    rq: Optional[transport.ReliableQueue] = None
+    lease_stop = threading.Event()
+    if RELIABLE_QUEUE:
+        rq = transport.ReliableQueue(client, WORKER_ID, selector.queues, VISIBILITY_TIMEOUT)
+        threading.Thread(target=_keep_lease, args=(rq, lease_stop), daemon=True).start()
+        logger.info("Fila confiável ativa (worker=%s visibility_timeout=%ss)", WORKER_ID, VISIBILITY_TIMEOUT)
+    next_reap = time.monotonic()
+    next_promote = time.monotonic()
+
+    def finish(item: Tuple[str, str], error: Optional[BaseException], result: Any) -> None:
+        # usa o `client` atual de main (reatribuído nas reconexões)
+        if error is not None:
+            retry_or_dead_letter(client, item[0], item[1], error)
+        else:
+            save_result(client, item[1], result)
+
     while running:
         try:
-            item: Optional[Tuple[str, str]] = client.blpop(QUEUE_NAME, timeout=5)
-            if item is None:
+            if time.monotonic() >= next_stats:
+                stats.log()
+                next_stats = time.monotonic() + STATS_INTERVAL
+            if rq is not None and time.monotonic() >= next_reap:
+                rq.reap()
+                next_reap = time.monotonic() + REAP_INTERVAL
+            if time.monotonic() >= next_promote:
+                _, next_due = transport.promote_due(client)
+                wait = DELAYED_POLL_INTERVAL
+                if next_due is not None:
+                    wait = min(wait, max(0.0, next_due - time.time()))
+                next_promote = time.monotonic() + wait
+
+            # não bloqueia além da próxima promoção de tarefas atrasadas
+            timeout = min(5.0, max(0.05, next_promote - time.monotonic()))
+            # só retira o que cabe agora: uma tarefa no modo sync, as vagas livres no modo pool
+            if pool is None:
+                count = 1
+            else:
+                count = min(transport.BATCH_SIZE, pool.free_slots())
+                if count <= 0:
+                    pool.wait_free(timeout)
+                    continue
+            queues = selector.order()
+            batch: List[Tuple[str, str]]
+            with metrics.timer(metrics.DEQUEUE_WAIT):
+                if rq is not None:
+                    batch = rq.claim(count, timeout=timeout, queues=queues)
+                else:
+                    batch = transport.pop_batch(client, queues, count, timeout=timeout)
+            if not batch:
                 continue
-            
-            _, task_json = item
-            process_task(task_json)
-            
+
+            done: List[Tuple[str, str]] = []
+            for i, item in enumerate(batch):
+                if not running:
+                    # devolve à fila o que foi retirado e não chegou a executar nem a ser despachado
+                    if rq is not None:
+                        rq.release(batch[i:])
+                    else:
+                        transport.requeue_front(client, batch[i:])
+                    break
+                _, task_json = item
+                if pool is not None:
+                    def on_done(error: Optional[BaseException], result: Any, it: Tuple[str, str] = item) -> None:
+                        finish(it, error, result)
+                        if rq is not None:
+                            rq.ack([it])
+                    dispatch_task(task_json, pool, on_done, limiter)
+                else:
+                    process_task(task_json, stats, lambda error, result, it=item: finish(it, error, result), limiter)
+                    done.append(item)
+            if rq is not None:
+                rq.ack(done)
+
             backoff = 1.0  # Reset backoff on success
         except redis.exceptions.ConnectionError as e:
             logger.warning("🚨 Erro de conexão com o Redis: %s. Reconectando em ~%s segundos...",e,backoff)
             time.sleep(backoff)
             backoff = min(max_backoff, backoff * 2)
             client = make_redis_client()
+            limiter.set_client(client)
+            if rq is not None:
+                rq.set_client(client)
         except Exception:
             logger.exception("Erro inesperado no loop do worker")
             time.sleep(1)
     
+    if pool is not None:
+        logger.info("Aguardando tarefas em andamento...")
+        pool.shutdown()
+    heartbeat.stop()
+    if rq is not None:
+        lease_stop.set()
+        try:
+            rq.deregister()
+        except Exception:
+            logger.warning("Não foi possível remover o registro do worker %s.", WORKER_ID)
+    stats.log()
     logger.info("Worker encerrado.")
     try:
         client.close()
@@ -92,4 +644,4 @@ def main():
            
   
 if __name__ == "__main__":
-  main()
\ No newline at end of file
+  main()
@@ -0,0 +1,320 @@
+"""
+Composição de tarefas: chain, group e chord sobre o envelope de tarefas.
+
+Uma assinatura é o dict de sempre ({"task_name", "args", "kwargs", "priority"}), criado com
+signature(). Os construtores combinam assinaturas:
+  - chain(a, b, c)   -> b recebe o resultado de a como primeiro argumento, c o de b;
+  - group(a, b, ...) -> executa os membros em paralelo;
+  - chord(grupo, cb) -> cb recebe a lista de resultados do grupo (na ordem dos membros).
+Um group dentro de um chain seguido de uma assinatura é um chord. apply() enfileira o
+workflow e retorna o task_id do último passo, ou o group_id se ele termina em um group
+(use `cli.py result <id> --wait`).
+
+Continuação sem polling:
+  - chain: o payload leva os passos restantes em "chain"; ao concluir, o worker enfileira o
+    próximo passo com enqueue_unique (chave = task_id do passo), então reentregas não duplicam;
+  - group: o hash `workflow:group:<id>` guarda o contador `pending`, e cada membro concluído
+    roda um script Lua que grava seu resultado (HSETNX, idempotente) em
+    `workflow:group:<id>:results` e decrementa o contador. O membro que zera o contador
+    empurra o callback do chord para a fila no mesmo script. O callback lê os resultados ao
+    executar, então o payload não cresce com o grupo (10k+ membros). Sem callback, a lista
+    de resultados do grupo é gravada no backend de resultados sob o group_id;
+  - o estado do grupo e os membros são gravados num único MULTI/EXEC: se o processo cair no
+    meio, nada fica gravado e a reentrega do passo anterior inicia o grupo do zero.
+
+Se um passo vai para a dead-letter queue, os passos seguintes (e o callback do chord) não
+rodam e recebem o resultado de falha no backend de resultados.
+
+Ajustes via env:
+  WORKFLOW_TTL  -> segundos que o estado dos grupos fica no Redis (padrão 86400)
+"""
+import os
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import redis
+
+import envelope
+import results
+import transport
+
+logger = logging.getLogger(__name__)
+
+WORKFLOW_PREFIX = "workflow"
+WORKFLOW_TTL = int(os.getenv("WORKFLOW_TTL", "86400"))
+# membros por RPUSH ao iniciar um grupo
+GROUP_PUSH_BATCH = 1000
+# task_name do resultado gravado sob o group_id quando o grupo não tem callback
+GROUP_TASK_NAME = "group"
+
+# cliente para resolver os resultados do chord no worker, criado sob demanda
+_client: Optional[redis.Redis] = None
+
+# KEYS[1] = hash do grupo, KEYS[2] = hash de resultados, KEYS[3] = fila do callback (só em
+# chords); ARGV = índice, resultado (JSON),
+# erro ("" se sucesso), ttl. Retorna quantos membros faltam, -1 se o membro já tinha sido
+# contado (reentrega), -2 se o grupo terminou com falhas e -3 se o grupo não existe mais.
+_COMPLETE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return -3
+end
+if redis.call('HSETNX', KEYS[2], ARGV[1], ARGV[2]) == 0 then
+  return -1
+end
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[4]))
+if ARGV[3] ~= '' then
+  redis.call('HSET', KEYS[1], 'failed', ARGV[3])
+end
+local left = redis.call('HINCRBY', KEYS[1], 'pending', -1)
+if left > 0 then
+  return left
+end
+if redis.call('HEXISTS', KEYS[1], 'failed') == 1 then
+  return -2
+end
+if KEYS[3] then
+  local callback = redis.call('HGET', KEYS[1], 'callback')
+  if callback then
+    redis.call('RPUSH', KEYS[3], callback)
+  end
+end
+return 0
+"""
+
+
+def signature(
+    task_name: str,
+    args: Optional[List[Any]] = None,
+    kwargs: Optional[Dict[str, Any]] = None,
+    priority: str = transport.DEFAULT_PRIORITY,
+) -> Dict[str, Any]:
+    return {"task_name": task_name, "args": list(args or []), "kwargs": dict(kwargs or {}), "priority": priority}
+
+
+def group(*members: Any) -> Dict[str, Any]:
+    """Grupo de assinaturas; aceita também um único iterável (ex.: gerador com 10k membros)."""
+    if len(members) == 1 and not isinstance(members[0], dict):
+        members = tuple(members[0])
+    return {"workflow": "group", "members": list(members)}
+
+
+def chain(*steps: Dict[str, Any]) -> Dict[str, Any]:
+    flat: List[Dict[str, Any]] = []
+    for step in steps:
+        flat.extend(step["steps"] if step.get("workflow") == "chain" else [step])
+    return {"workflow": "chain", "steps": flat}
+
+
+def chord(header: Any, callback: Dict[str, Any]) -> Dict[str, Any]:
+    return chain(header if isinstance(header, dict) else group(header), callback)
+
+
+def group_key(group_id: str) -> str:
+    return f"{WORKFLOW_PREFIX}:group:{group_id}"
+
+
+def group_results_key(group_id: str) -> str:
+    return f"{WORKFLOW_PREFIX}:group:{group_id}:results"
+
+
+def _prepare(steps: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Valida os passos e atribui task_id (assinaturas) e group_id (grupos) antes de enfileirar."""
+    prepared: List[Dict[str, Any]] = []
+    for i, step in enumerate(steps):
+        if step.get("workflow") == "group":
+            if i + 1 < len(steps) and steps[i + 1].get("workflow") == "group":
+                raise ValueError("Um group não pode ser seguido de outro group; use um callback entre eles.")
+            members = []
+            for member in step["members"]:
+                if member.get("workflow"):
+                    raise ValueError("Membros de um group devem ser assinaturas simples.")
+                members.append(dict(member, task_id=member.get("task_id") or results.new_task_id()))
+            prepared.append({"workflow": "group", "group_id": results.new_task_id(), "members": members})
+        elif step.get("workflow"):
+            raise ValueError(f"Passo de workflow inválido: {step.get('workflow')!r}")
+        else:
+            if not step.get("task_name"):
+                raise ValueError("Assinatura sem task_name.")
+            prepared.append(dict(step, task_id=step.get("task_id") or results.new_task_id()))
+    return prepared
+
+
+def _queue(sig: Dict[str, Any]) -> str:
+    return transport.queue_name(sig.get("priority", transport.DEFAULT_PRIORITY), sig["task_name"])
+
+
+def _payload(sig: Dict[str, Any], rest: List[Dict[str, Any]], previous: Any, has_previous: bool) -> Dict[str, Any]:
+    # a prioridade já está no nome da fila; os passos seguintes a levam em "chain"
+    payload = {key: value for key, value in sig.items() if key != "priority"}
+    if has_previous:
+        payload["args"] = [previous] + list(sig.get("args", []))
+    if rest:
+        payload["chain"] = rest
+    return payload
+
+
+def _start(client: redis.Redis, steps: List[Dict[str, Any]], previous: Any = None, has_previous: bool = False) -> None:
+    """Enfileira o primeiro passo de `steps`, levando os demais como continuação."""
+    first, rest = steps[0], steps[1:]
+    if first.get("workflow") != "group":
+        payload = _payload(first, rest, previous, has_previous)
+        transport.enqueue_unique(
+            client, [(_queue(first), envelope.encode(payload), f"{WORKFLOW_PREFIX}:{first['task_id']}", None)]
+        )
+        return
+    _start_group(client, first, rest, previous, has_previous)
+
+
+def _start_group(
+    client: redis.Redis, step: Dict[str, Any], rest: List[Dict[str, Any]], previous: Any, has_previous: bool
+) -> None:
+    group_id, members = step["group_id"], step["members"]
+    meta: Dict[str, Any] = {"total": len(members), "pending": len(members)}
+    callback: Optional[Dict[str, Any]] = None
+    if rest:
+        callback = dict(_payload(rest[0], rest[1:], None, False), chord_id=group_id)
+        meta.update(
+            callback=envelope.encode(callback), callback_queue=_queue(rest[0]), callback_task_id=rest[0]["task_id"]
+        )
+    by_queue: Dict[str, List[envelope.Payload]] = {}
+    for index, member in enumerate(members):
+        payload = _payload(member, [], previous, has_previous)
+        payload["group_id"], payload["group_index"] = group_id, index
+        payload["chord_queue"] = meta.get("callback_queue", "")
+        by_queue.setdefault(_queue(member), []).append(envelope.encode(payload))
+    if not members and callback is not None:
+        by_queue[meta["callback_queue"]] = [meta["callback"]]
+
+    # estado e membros no mesmo MULTI/EXEC; o WATCH na chave do grupo torna o início idempotente:
+    # a reentrega do passo anterior não reinicia um grupo já gravado
+    key = group_key(group_id)
+    with client.pipeline(transaction=True) as pipe:
+        try:
+            pipe.watch(key)
+            if pipe.exists(key):
+                logger.info("Grupo %s já iniciado; ignorando reentrega.", group_id)
+                return
+            pipe.multi()
+            pipe.hset(key, mapping=meta)
+            pipe.expire(key, WORKFLOW_TTL)
+            for queue, payloads in by_queue.items():
+                for start in range(0, len(payloads), GROUP_PUSH_BATCH):
+                    pipe.rpush(queue, *payloads[start:start + GROUP_PUSH_BATCH])
+            pipe.execute()
+        except redis.WatchError:
+            logger.info("Grupo %s iniciado por outra entrega; ignorando.", group_id)
+            return
+    if not members and callback is None:
+        results.store_result(client, group_id, GROUP_TASK_NAME, result=[])
+    logger.info("🧩 Grupo %s iniciado com %s membros%s.", group_id, len(members), " (chord)" if callback else "")
+
+
+def apply(client: redis.Redis, workflow: Dict[str, Any]) -> str:
+    """
+    Enfileira uma assinatura, chain, group ou chord. Retorna o task_id do último passo (ou o
+    group_id, se o workflow termina em um group sem callback). Em ambos os casos o resultado
+    fica disponível em results.get_result(); o de um group é a lista de resultados dos membros.
+    """
+    steps = _prepare(workflow["steps"] if workflow.get("workflow") == "chain" else [workflow])
+    if not steps:
+        raise ValueError("Workflow vazio.")
+    _start(client, steps)
+    last = steps[-1]
+    return last["group_id"] if last.get("workflow") == "group" else last["task_id"]
+
+
+def _fail_rest(client: redis.Redis, steps: Iterable[Dict[str, Any]], error: BaseException) -> None:
+    """Grava a falha no resultado dos passos que não vão mais rodar."""
+    for step in steps:
+        for sig in step.get("members", [step]):
+            if sig.get("task_id"):
+                results.store_result(client, sig["task_id"], sig.get("task_name"), error=error)
+
+
+def _complete_member(
+    client: redis.Redis, task_data: Dict[str, Any], result: Any, error: Optional[BaseException]
+) -> None:
+    group_id, index = task_data["group_id"], task_data["group_index"]
+    script = client.register_script(_COMPLETE_SCRIPT)
+    encoded = json.dumps(result if error is None else None, separators=(",", ":"), default=str)
+    keys = [group_key(group_id), group_results_key(group_id)]
+    # a fila do callback vem no payload do membro; tarefas enfileiradas antes dele a leem do grupo
+    if "chord_queue" in task_data:
+        callback_queue = task_data["chord_queue"]
+    else:
+        callback_queue = client.hget(keys[0], "callback_queue")
+    if callback_queue:
+        keys.append(callback_queue)
+    left = script(
+        keys=keys,
+        args=[index, encoded, repr(error) if error is not None else "", WORKFLOW_TTL],
+    )
+    if left == 0:
+        logger.info("🏁 Grupo %s concluído.", group_id)
+        if not client.hexists(group_key(group_id), "callback"):
+            results.store_result(client, group_id, GROUP_TASK_NAME, result=group_results(client, group_id))
+    elif left == -2:
+        callback, failed = client.hmget(group_key(group_id), ["callback", "failed"])
+        logger.error("☠️ Grupo %s terminou com falhas; o callback não será executado.", group_id)
+        if callback is not None:
+            data = envelope.decode(callback)
+            _fail_rest(client, [data] + data.get("chain", []), RuntimeError(failed))
+        else:
+            results.store_result(client, group_id, GROUP_TASK_NAME, error=RuntimeError(failed))
+    elif left == -3:
+        logger.warning("Grupo %s expirado ou inexistente; resultado do membro %s descartado.", group_id, index)
+
+
+def on_success(client: redis.Redis, task_data: Dict[str, Any], result: Any) -> None:
+    """Continua o workflow após um passo concluído (chamado pelo worker depois de gravar o resultado)."""
+    if "group_id" in task_data:
+        _complete_member(client, task_data, result, None)
+    if task_data.get("chain"):
+        _start(client, task_data["chain"], result, True)
+
+
+def on_failure(client: redis.Redis, task_data: Dict[str, Any], error: BaseException) -> None:
+    """Interrompe o workflow de um passo que esgotou as tentativas."""
+    if "group_id" in task_data:
+        _complete_member(client, task_data, None, error)
+    if task_data.get("chain"):
+        _fail_rest(client, task_data["chain"], error)
+
+
+def is_workflow_step(task_data: Dict[str, Any]) -> bool:
+    return "chain" in task_data or "group_id" in task_data
+
+
+def group_results(client: redis.Redis, group_id: str) -> List[Any]:
+    """Resultados do grupo na ordem dos membros (None para membros que falharam)."""
+    total = int(client.hget(group_key(group_id), "total") or 0)
+    stored = client.hgetall(group_results_key(group_id))
+    ordered: List[Any] = [None] * total
+    for index, value in stored.items():
+        ordered[int(index)] = json.loads(value)
+    return ordered
+
+
+def group_status(client: redis.Redis, group_id: str) -> Optional[Dict[str, Any]]:
+    meta = client.hgetall(group_key(group_id))
+    if not meta:
+        return None
+    return {
+        "group_id": group_id,
+        "total": int(meta.get("total", 0)),
+        "pending": int(meta.get("pending", 0)),
+        "failed": meta.get("failed"),
+        "callback_task_id": meta.get("callback_task_id"),
+    }
+
+
+def resolve_args(task_data: Dict[str, Any]) -> List[Any]:
+    """Argumentos da tarefa; callbacks de chord recebem a lista de resultados do grupo como primeiro argumento."""
+    args = list(task_data.get("args", []))
+    if "chord_id" not in task_data:
+        return args
+    global _client
+    if _client is None:
+        _client = transport.redis_client()
+    return [group_results(_client, task_data["chord_id"])] + args